@@ -0,0 +1,418 @@
+"""
+Module de persistance du modèle de recommandation.
+
+Plutôt que de relancer `load_data` → `preprocess_synopsis` →
+`vectorize_synopsis` à chaque démarrage, on construit une fois un artefact
+versionné sur disque contenant :
+
+* le vocabulaire et les poids IDF du `TfidfVectorizer` ;
+* la matrice TF‑IDF creuse ;
+* l'index creux des K plus proches voisins (voir `vectorize.build_neighbors`) ;
+* la liste des titres (pour reconstruire l'index titre -> position).
+
+`ModelArtifact.similarity` recalcule à la demande les scores exacts de la
+matrice dense à partir de la matrice TF‑IDF : c'est le `cosine_sim` des
+points d'entrée interactifs. L'index des voisins, tronqué à K, est réservé
+aux traitements qui l'acceptent explicitement (`batch`, `service`, `hybrid`).
+
+Avec `--streaming`, la matrice TF‑IDF est construite en flux par
+`stream_tfidf.HashingTfidf` (vocabulaire haché, sans vocabulaire en
+mémoire) : le catalogue n'est jamais chargé en entier pendant la
+construction.
+
+Les tableaux sont stockés au format `.npy` et rouverts avec
+`np.load(mmap_mode='r')` : plusieurs processus partagent ainsi les mêmes
+pages via le cache du système d'exploitation. L'artefact est rangé dans un
+sous-dossier nommé d'après une empreinte du fichier CSV et des paramètres
+du vectoriseur ; un artefact obsolète est donc détecté et reconstruit
+automatiquement.
+
+Utilisation en ligne de commande :
+
+    python artifact.py --csv Anime.csv --out model_artifact --top-k 100
+    python artifact.py --csv Anime.csv --streaming --chunk-size 50000
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import shutil
+import sys
+import tempfile
+import time
+from typing import TYPE_CHECKING, Callable, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+from scipy import sparse
+
+from data_load import DEFAULT_COLUMNS, iter_chunks, iter_synopses, load_data
+from preprocess import preprocess_synopsis
+from quantize import SCORE_PRECISION, quantize_scores
+from stream_tfidf import DEFAULT_CHUNK_SIZE, DEFAULT_N_FEATURES, HashingTfidf
+from vectorize import VECTORIZER_PARAMS, TfidfSimilarity, build_neighbors, fit_tfidf
+
+if TYPE_CHECKING:
+    from sklearn.feature_extraction.text import TfidfVectorizer
+
+# À incrémenter lorsque la structure des fichiers de l'artefact change
+ARTIFACT_FORMAT_VERSION = 1
+DEFAULT_ARTIFACT_DIR = 'model_artifact'
+DEFAULT_TOP_K = 100
+
+MANIFEST_FILE = 'manifest.json'
+VOCABULARY_FILE = 'vocabulary.json'
+TITLES_FILE = 'titles.json'
+
+
+def file_sha256(filepath: str, chunk_size: int = 1 << 20) -> str:
+    """Calcule l'empreinte SHA-256 d'un fichier, lu par morceaux."""
+    digest = hashlib.sha256()
+    with open(filepath, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def artifact_key(csv_path: str, top_k: int = DEFAULT_TOP_K, streaming: bool = False) -> str:
+    """Calcule la clé d'un artefact à partir du CSV et des paramètres du modèle.
+
+    Parameters
+    ----------
+    csv_path : str
+        Chemin du fichier `Anime.csv`.
+    top_k : int
+        Nombre de voisins conservés par titre.
+    streaming : bool
+        Vectorisation en flux (vocabulaire haché).
+
+    Returns
+    -------
+    str
+        Empreinte hexadécimale identifiant l'artefact.
+    """
+    params = {
+        'format_version': ARTIFACT_FORMAT_VERSION,
+        'csv_sha256': file_sha256(csv_path),
+        'vectorizer_params': VECTORIZER_PARAMS,
+        'top_k': top_k,
+    }
+    if streaming:
+        params['hashing_n_features'] = DEFAULT_N_FEATURES
+    payload = json.dumps(params, sort_keys=True).encode('utf-8')
+    return hashlib.sha256(payload).hexdigest()[:16]
+
+
+def _save_csr(directory: str, name: str, matrix: sparse.csr_matrix) -> None:
+    np.save(os.path.join(directory, f'{name}_data.npy'), matrix.data)
+    np.save(os.path.join(directory, f'{name}_indices.npy'), matrix.indices)
+    np.save(os.path.join(directory, f'{name}_indptr.npy'), matrix.indptr)
+
+
+def _load_csr(directory: str, name: str, shape: Tuple[int, int], mmap_mode: Optional[str]) -> sparse.csr_matrix:
+    arrays = [
+        np.load(os.path.join(directory, f'{name}_{part}.npy'), mmap_mode=mmap_mode)
+        for part in ('data', 'indices', 'indptr')
+    ]
+    return sparse.csr_matrix(tuple(arrays), shape=shape, copy=False)
+
+
+class ModelArtifact:
+    """Modèle de recommandation chargé depuis un artefact sur disque.
+
+    Attributes
+    ----------
+    path : str
+        Dossier de l'artefact.
+    version : str
+        Clé de l'artefact (empreinte du CSV et des paramètres).
+    manifest : dict
+        Métadonnées de l'artefact.
+    tfidf_matrix : scipy.sparse.csr_matrix
+        Matrice TF‑IDF des synopsis.
+    neighbors : scipy.sparse.csr_matrix or quantize.QuantizedSparse
+        Index creux des K plus proches voisins, utilisable comme
+        `cosine_sim` dans `recommend.recommend_anime` ; quantifié en
+        mémoire si `score_precision` n'est pas `'float32'`. Les similarités
+        hors des K meilleures sont ignorées : les classements peuvent
+        différer de ceux de la matrice dense (voir `similarity`).
+    indices : pandas.Series
+        Série associant chaque titre à sa position.
+    """
+
+    def __init__(self, path: str, mmap_mode: Optional[str] = 'r', score_precision: str = 'float32'):
+        self.path = path
+        with open(os.path.join(path, MANIFEST_FILE), encoding='utf-8') as f:
+            self.manifest = json.load(f)
+        self.version = self.manifest['key']
+
+        n_items = self.manifest['n_items']
+        n_features = self.manifest['n_features']
+        self.tfidf_matrix = _load_csr(path, 'tfidf', (n_items, n_features), mmap_mode)
+        self.neighbors = quantize_scores(_load_csr(path, 'neighbors', (n_items, n_items), mmap_mode),
+                                         score_precision)
+        self.idf = np.load(os.path.join(path, 'idf.npy'), mmap_mode=mmap_mode)
+
+        with open(os.path.join(path, TITLES_FILE), encoding='utf-8') as f:
+            self.titles = json.load(f)
+        self.indices = pd.Series(np.arange(n_items), index=self.titles).drop_duplicates()
+        self._vectorizer = None
+        self._similarity = None
+
+    @property
+    def similarity(self) -> TfidfSimilarity:
+        """Similarité cosinus exacte, calculée à la demande à partir de `tfidf_matrix`.
+
+        À utiliser comme `cosine_sim` pour obtenir les mêmes recommandations
+        que la matrice dense N×N ; `neighbors` est plus rapide mais tronqué.
+        """
+        if self._similarity is None:
+            self._similarity = TfidfSimilarity(self.tfidf_matrix)
+        return self._similarity
+
+    @property
+    def vectorizer(self) -> 'TfidfVectorizer':
+        """Vectoriseur TF‑IDF reconstruit à partir du vocabulaire sauvegardé.
+
+        Pour un artefact construit en flux, il s'agit d'un
+        `stream_tfidf.HashingTfidf` (même méthode `transform`).
+        """
+        if self._vectorizer is None and 'hashing_n_features' in self.manifest:
+            self._vectorizer = HashingTfidf(self.manifest['hashing_n_features'], idf=np.asarray(self.idf))
+        if self._vectorizer is None:
+            from sklearn.feature_extraction.text import TfidfVectorizer
+
+            with open(os.path.join(self.path, VOCABULARY_FILE), encoding='utf-8') as f:
+                terms = json.load(f)
+            vectorizer = TfidfVectorizer(
+                vocabulary={term: i for i, term in enumerate(terms)},
+                **self.manifest['vectorizer_params'],
+            )
+            vectorizer.idf_ = np.asarray(self.idf)
+            self._vectorizer = vectorizer
+        return self._vectorizer
+
+
+def build_artifact(
+    csv_path: str,
+    artifact_dir: str = DEFAULT_ARTIFACT_DIR,
+    top_k: int = DEFAULT_TOP_K,
+    df: Optional[pd.DataFrame] = None,
+    streaming: bool = False,
+    chunk_size: int = DEFAULT_CHUNK_SIZE,
+    workers: int = 1,
+    progress: Optional[Callable[[int, int, int, float], None]] = None,
+) -> str:
+    """Construit l'artefact du modèle et l'écrit sur disque.
+
+    L'artefact est d'abord écrit dans un dossier temporaire puis renommé,
+    afin qu'un processus concurrent ne lise jamais un artefact incomplet.
+    Les versions précédentes présentes dans `artifact_dir` sont supprimées.
+
+    Parameters
+    ----------
+    csv_path : str
+        Chemin du fichier `Anime.csv`.
+    artifact_dir : str
+        Dossier racine des artefacts.
+    top_k : int
+        Nombre de voisins conservés par titre.
+    df : pandas.DataFrame, optional
+        DataFrame déjà chargé et prétraité, pour éviter de relire le CSV.
+    streaming : bool
+        Vectorise le catalogue en flux, par morceaux de `chunk_size`
+        synopsis, avec `stream_tfidf.HashingTfidf`.
+    chunk_size : int
+        Nombre de synopsis lus à la fois en mode flux.
+    workers : int
+        Nombre de processus pour le calcul des voisins.
+    progress : Callable, optional
+        Suivi du calcul des voisins (voir `vectorize.build_neighbors`).
+
+    Returns
+    -------
+    str
+        Chemin du dossier de l'artefact construit.
+    """
+    key = artifact_key(csv_path, top_k, streaming)
+    if df is None and not streaming:
+        df = preprocess_synopsis(load_data(csv_path, DEFAULT_COLUMNS))
+
+    os.makedirs(artifact_dir, exist_ok=True)
+    tmp_dir = tempfile.mkdtemp(prefix=f'.{key}-', dir=artifact_dir)
+    if streaming:
+        if df is not None:
+            synopses, titles = iter(df['Synopsis']), df['Title'].astype(str).tolist()
+        else:
+            synopses = iter_synopses(csv_path, chunk_size)
+            titles = [str(title) for chunk in iter_chunks(csv_path, chunk_size, ['Title']) for title in chunk['Title']]
+        # La matrice est écrite directement dans l'artefact, morceau par morceau
+        hashing = HashingTfidf(DEFAULT_N_FEATURES)
+        tfidf_matrix = hashing.fit_transform_to_disk(synopses, tmp_dir, 'tfidf', chunk_size)
+        idf = hashing.idf_
+    else:
+        vectorizer, tfidf_matrix = fit_tfidf(df['Synopsis'])
+        tfidf_matrix = sparse.csr_matrix(tfidf_matrix, dtype=np.float32)
+        _save_csr(tmp_dir, 'tfidf', tfidf_matrix)
+        idf = vectorizer.idf_
+        titles = df['Title'].astype(str).tolist()
+        with open(os.path.join(tmp_dir, VOCABULARY_FILE), 'w', encoding='utf-8') as f:
+            json.dump(vectorizer.get_feature_names_out().tolist(), f, ensure_ascii=False)
+
+    neighbors = build_neighbors(tfidf_matrix, top_k, workers=workers, progress=progress)
+    _save_csr(tmp_dir, 'neighbors', neighbors)
+    np.save(os.path.join(tmp_dir, 'idf.npy'), idf.astype(np.float64))
+    with open(os.path.join(tmp_dir, TITLES_FILE), 'w', encoding='utf-8') as f:
+        json.dump(titles, f, ensure_ascii=False)
+
+    manifest = {
+        'format_version': ARTIFACT_FORMAT_VERSION,
+        'key': key,
+        'csv_path': os.path.abspath(csv_path),
+        'vectorizer_params': VECTORIZER_PARAMS,
+        'top_k': top_k,
+        'n_items': tfidf_matrix.shape[0],
+        'n_features': tfidf_matrix.shape[1],
+        'created_at': time.strftime('%Y-%m-%dT%H:%M:%S'),
+    }
+    if streaming:
+        manifest['hashing_n_features'] = DEFAULT_N_FEATURES
+    return publish_artifact(tmp_dir, artifact_dir, manifest)
+
+
+def publish_artifact(tmp_dir: str, artifact_dir: str, manifest: dict) -> str:
+    """Écrit le manifeste puis installe atomiquement l'artefact préparé dans `tmp_dir`.
+
+    Le dossier est renommé d'après `manifest['key']` et les autres versions
+    présentes dans `artifact_dir` sont supprimées.
+    """
+    key = manifest['key']
+    with open(os.path.join(tmp_dir, MANIFEST_FILE), 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, indent=2)
+
+    path = os.path.join(artifact_dir, key)
+    if os.path.exists(path):
+        # Reconstruction forcée : les lecteurs déjà ouverts gardent leurs pages
+        shutil.rmtree(path, ignore_errors=True)
+    try:
+        os.rename(tmp_dir, path)
+    except OSError:
+        # Un autre processus a construit la même version entre-temps
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+
+    # Nettoyage des versions obsolètes
+    for entry in os.listdir(artifact_dir):
+        entry_path = os.path.join(artifact_dir, entry)
+        if entry != key and not entry.startswith('.') and os.path.isdir(entry_path):
+            shutil.rmtree(entry_path, ignore_errors=True)
+    return path
+
+
+def load_artifact(path: str, mmap_mode: Optional[str] = 'r', score_precision: str = 'float32') -> ModelArtifact:
+    """Ouvre un artefact existant (en mémoire partagée par défaut)."""
+    return ModelArtifact(path, mmap_mode=mmap_mode, score_precision=score_precision)
+
+
+def latest_artifact(artifact_dir: str = DEFAULT_ARTIFACT_DIR) -> Optional[str]:
+    """Chemin de l'artefact le plus récent de `artifact_dir`, s'il en existe un."""
+    if not os.path.isdir(artifact_dir):
+        return None
+    candidates = [
+        os.path.join(artifact_dir, entry) for entry in os.listdir(artifact_dir)
+        if not entry.startswith('.') and os.path.exists(os.path.join(artifact_dir, entry, MANIFEST_FILE))
+    ]
+    if not candidates:
+        return None
+    return max(candidates, key=lambda path: os.path.getmtime(os.path.join(path, MANIFEST_FILE)))
+
+
+def load_or_build(
+    csv_path: str = 'Anime.csv',
+    artifact_dir: str = DEFAULT_ARTIFACT_DIR,
+    top_k: int = DEFAULT_TOP_K,
+    streaming: bool = False,
+    score_precision: str = SCORE_PRECISION,
+) -> Tuple[pd.DataFrame, ModelArtifact]:
+    """Charge les données et l'artefact à jour, en le reconstruisant si besoin.
+
+    Parameters
+    ----------
+    csv_path : str
+        Chemin du fichier `Anime.csv`.
+    artifact_dir : str
+        Dossier racine des artefacts.
+    top_k : int
+        Nombre de voisins conservés par titre.
+    streaming : bool
+        Mode de vectorisation utilisé si l'artefact doit être construit. Un
+        artefact à jour de l'autre mode est réutilisé tel quel.
+    score_precision : str
+        Précision des scores des voisins en mémoire (`'float32'`,
+        `'float16'` ou `'int8'`, voir `quantize`).
+
+    Returns
+    -------
+    tuple
+        Un couple (df, artifact) où `df` est le DataFrame prétraité.
+    """
+    df = preprocess_synopsis(load_data(csv_path, DEFAULT_COLUMNS))
+    for mode in (streaming, not streaming):
+        path = os.path.join(artifact_dir, artifact_key(csv_path, top_k, mode))
+        if os.path.exists(os.path.join(path, MANIFEST_FILE)):
+            return df, load_artifact(path, score_precision=score_precision)
+    path = build_artifact(csv_path, artifact_dir, top_k, df=df, streaming=streaming)
+    return df, load_artifact(path, score_precision=score_precision)
+
+
+class BlockProgress:
+    """Affiche l'avancement du calcul des voisins et la durée de chaque bloc."""
+
+    def __init__(self, stream=sys.stderr):
+        self.stream = stream
+        self.block_seconds: List[float] = []
+        self.done = 0
+
+    def __call__(self, start: int, stop: int, n_rows: int, seconds: float) -> None:
+        self.block_seconds.append(seconds)
+        self.done += stop - start
+        print(f"voisins : {self.done}/{n_rows} lignes ({100 * self.done / n_rows:.0f} %), "
+              f"bloc {start}-{stop} en {seconds:.2f} s", file=self.stream, flush=True)
+
+    def summary(self) -> str:
+        if not self.block_seconds:
+            return "aucun bloc calculé"
+        times = np.asarray(self.block_seconds)
+        return (f"{len(times)} blocs, {times.sum():.1f} s de calcul cumulé "
+                f"(moyenne {times.mean():.2f} s, max {times.max():.2f} s)")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Construit l'artefact du modèle de recommandation.")
+    parser.add_argument('--csv', default='Anime.csv', help='Fichier CSV du catalogue')
+    parser.add_argument('--out', default=DEFAULT_ARTIFACT_DIR, help='Dossier racine des artefacts')
+    parser.add_argument('--top-k', type=int, default=DEFAULT_TOP_K, help='Voisins conservés par titre')
+    parser.add_argument('--force', action='store_true', help="Reconstruit même si l'artefact est à jour")
+    parser.add_argument('--streaming', action='store_true',
+                        help='Vectorisation en flux (catalogues plus grands que la RAM)')
+    parser.add_argument('--chunk-size', type=int, default=DEFAULT_CHUNK_SIZE, help='Synopsis par morceau en mode flux')
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1,
+                        help='Processus pour le calcul des voisins')
+    args = parser.parse_args()
+
+    path = os.path.join(args.out, artifact_key(args.csv, args.top_k, args.streaming))
+    if args.force or not os.path.exists(os.path.join(path, MANIFEST_FILE)):
+        start = time.perf_counter()
+        progress = BlockProgress()
+        path = build_artifact(
+            args.csv, args.out, args.top_k, streaming=args.streaming, chunk_size=args.chunk_size,
+            workers=args.workers, progress=progress,
+        )
+        print(f"Artefact construit en {time.perf_counter() - start:.1f} s : {path}")
+        print(f"Voisins ({args.workers} processus) : {progress.summary()}")
+    else:
+        print(f"Artefact à jour : {path}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,281 @@
+"""
+Calcul hors ligne des recommandations pour un grand nombre d'utilisateurs.
+
+Ce script lit des listes de favoris depuis un flux JSONL ou CSV, les score
+par paquets avec un seul produit matriciel contre l'index des voisins de
+l'artefact (voir `recommend.score_favorites`) et écrit les résultats au fur
+et à mesure, au format JSONL. Le calcul peut être réparti sur un pool de
+processus qui ouvrent tous le même artefact en mémoire partagée (lecture
+seule). Le débit (utilisateurs/s) et la mémoire maximale sont affichés à la
+fin.
+
+Formats d'entrée acceptés :
+
+* JSONL : une ligne par utilisateur, `{"user_id": ..., "favorites": [...]}` ;
+* CSV : colonnes `user_id` et `favorites`, les titres étant séparés par `|`.
+
+Utilisation :
+
+    python batch.py users.jsonl recommendations.jsonl --top-n 10 --workers 8
+
+Avec `--diversity mmr` (ou `genre`), chaque liste est réordonnée parmi un
+groupe de candidats plus large pour limiter les titres d'une même franchise
+(voir `diversity`).
+"""
+
+import argparse
+import csv
+import io
+import json
+import sys
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from itertools import islice
+from typing import Dict, Iterable, Iterator, List, Optional, Sequence
+
+import numpy as np
+
+from artifact import DEFAULT_ARTIFACT_DIR, DEFAULT_TOP_K, load_artifact, load_or_build
+from diversity import DEFAULT_LAMBDA, DEFAULT_MAX_PER_GENRE, DEFAULT_POOL_FACTOR, METHODS, diversify, pool_size
+from instrumentation import max_rss_mb
+from recommend import score_favorites, top_n_indices
+
+DEFAULT_CHUNK_SIZE = 1024
+
+# Modèle (et genres du catalogue) partagés par les fonctions exécutées dans les processus du pool
+_MODEL = None
+_GENRES = None
+
+
+def read_favorites(stream: Iterable[str], fmt: str) -> Iterator[Dict]:
+    """Lit les listes de favoris d'un flux texte, ligne par ligne.
+
+    Parameters
+    ----------
+    stream : Iterable[str]
+        Flux d'entrée (fichier ouvert ou `sys.stdin`).
+    fmt : str
+        `'jsonl'` ou `'csv'`.
+
+    Yields
+    ------
+    dict
+        Un dictionnaire `{'user_id': ..., 'favorites': [...]}` par utilisateur.
+    """
+    if fmt == 'jsonl':
+        for line in stream:
+            line = line.strip()
+            if line:
+                record = json.loads(line)
+                yield {'user_id': record.get('user_id'), 'favorites': record.get('favorites', [])}
+    elif fmt == 'csv':
+        for row in csv.DictReader(stream):
+            favorites = [title.strip() for title in row.get('favorites', '').split('|') if title.strip()]
+            yield {'user_id': row.get('user_id'), 'favorites': favorites}
+    else:
+        raise ValueError(f"Format d'entrée inconnu : {fmt}")
+
+
+def chunked(records: Iterable[Dict], size: int) -> Iterator[List[Dict]]:
+    """Découpe un flux d'enregistrements en paquets de `size` éléments."""
+    iterator = iter(records)
+    while True:
+        chunk = list(islice(iterator, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def _init_worker(artifact_path: str, genres: Optional[Sequence[str]] = None) -> None:
+    global _MODEL, _GENRES
+    _MODEL = load_artifact(artifact_path)
+    _GENRES = genres
+
+
+def recommend_chunk(
+    chunk: List[Dict],
+    top_n: int,
+    model=None,
+    diversity: Optional[Dict] = None,
+    genres: Optional[Sequence[str]] = None,
+) -> List[Dict]:
+    """Calcule les recommandations d'un paquet d'utilisateurs.
+
+    Parameters
+    ----------
+    chunk : List[dict]
+        Enregistrements `{'user_id', 'favorites'}`.
+    top_n : int
+        Nombre de recommandations par utilisateur.
+    model : artifact.ModelArtifact, optional
+        Modèle à utiliser ; par défaut celui du processus courant.
+    diversity : dict, optional
+        Options de diversification : `method` (`'mmr'` ou `'genre'`),
+        `diversity_lambda`, `max_per_genre` et `pool_factor`.
+    genres : Sequence[str], optional
+        Genre de chaque titre, par position (méthode `'genre'`) ; par
+        défaut ceux du processus courant.
+
+    Returns
+    -------
+    List[dict]
+        Un enregistrement `{'user_id', 'recommendations', 'scores'}` par
+        utilisateur.
+    """
+    model = model if model is not None else _MODEL
+    genres = genres if genres is not None else _GENRES
+    favorites_batch = [record['favorites'] for record in chunk]
+    scores, positions = score_favorites(favorites_batch, model.neighbors, model.indices)
+    options = dict(diversity or {})
+    pool_factor = options.pop('pool_factor', DEFAULT_POOL_FACTOR)
+
+    results = []
+    for record, row_scores, fav_indices in zip(chunk, scores, positions):
+        if not record['favorites']:
+            top, top_scores = np.empty(0, dtype=np.int64), np.empty(0)
+        elif diversity is None:
+            top = top_n_indices(row_scores, fav_indices, top_n)
+            top_scores = row_scores[top]
+        else:
+            # Groupe de candidats élargi, réordonné sur ses seules similarités deux à deux
+            pool = top_n_indices(row_scores, fav_indices, pool_size(top_n, pool_factor))
+            top, top_scores = diversify(pool, row_scores[pool], top_n, cosine_sim=model.neighbors,
+                                        genres=genres, **options)
+        results.append({
+            'user_id': record['user_id'],
+            'recommendations': [model.titles[i] for i in top],
+            'scores': [round(float(score), 6) for score in top_scores],
+        })
+    return results
+
+
+def run_batch(
+    records: Iterable[Dict],
+    output: io.TextIOBase,
+    artifact_path: str,
+    top_n: int = 10,
+    chunk_size: int = DEFAULT_CHUNK_SIZE,
+    workers: int = 0,
+    diversity: Optional[Dict] = None,
+    genres: Optional[Sequence[str]] = None,
+) -> Dict:
+    """Calcule et écrit les recommandations de tous les utilisateurs.
+
+    Parameters
+    ----------
+    records : Iterable[dict]
+        Flux d'enregistrements `{'user_id', 'favorites'}`.
+    output : io.TextIOBase
+        Flux de sortie JSONL, écrit paquet par paquet.
+    artifact_path : str
+        Dossier de l'artefact du modèle.
+    top_n : int
+        Nombre de recommandations par utilisateur.
+    chunk_size : int
+        Nombre d'utilisateurs scorés par produit matriciel.
+    workers : int
+        Nombre de processus ; 0 pour tout calculer dans le processus courant.
+    diversity : dict, optional
+        Options de diversification, voir `recommend_chunk`.
+    genres : Sequence[str], optional
+        Genre de chaque titre, par position (méthode `'genre'`).
+
+    Returns
+    -------
+    dict
+        Statistiques : nombre d'utilisateurs, durée, débit et mémoire maximale.
+    """
+    start = time.perf_counter()
+    n_users = 0
+
+    def write(results: List[Dict]) -> None:
+        nonlocal n_users
+        for result in results:
+            output.write(json.dumps(result, ensure_ascii=False) + '\n')
+        n_users += len(results)
+
+    chunks = chunked(records, chunk_size)
+    if workers > 0:
+        with ProcessPoolExecutor(
+            max_workers=workers, initializer=_init_worker, initargs=(artifact_path, genres)
+        ) as pool:
+            # Nombre de paquets en vol borné : l'entrée n'est jamais lue en entier
+            pending = deque()
+            for chunk in chunks:
+                pending.append(pool.submit(recommend_chunk, chunk, top_n, diversity=diversity))
+                if len(pending) >= 2 * workers:
+                    write(pending.popleft().result())
+            while pending:
+                write(pending.popleft().result())
+    else:
+        model = load_artifact(artifact_path)
+        for chunk in chunks:
+            write(recommend_chunk(chunk, top_n, model=model, diversity=diversity, genres=genres))
+    output.flush()
+
+    elapsed = time.perf_counter() - start
+    return {
+        'users': n_users,
+        'seconds': round(elapsed, 3),
+        'users_per_sec': round(n_users / elapsed, 1) if elapsed > 0 else 0.0,
+        'peak_rss_mb': round(max_rss_mb(include_children=True), 1),
+    }
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description="Recommandations hors ligne pour un flux d'utilisateurs.")
+    parser.add_argument('input', help="Fichier d'entrée JSONL/CSV ('-' pour l'entrée standard)")
+    parser.add_argument('output', help="Fichier de sortie JSONL ('-' pour la sortie standard)")
+    parser.add_argument('--format', choices=['jsonl', 'csv'], help="Format d'entrée (déduit de l'extension par défaut)")
+    parser.add_argument('--csv', default='Anime.csv', help='Fichier CSV du catalogue')
+    parser.add_argument('--artifact-dir', default=DEFAULT_ARTIFACT_DIR, help='Dossier racine des artefacts')
+    parser.add_argument('--top-k', type=int, default=DEFAULT_TOP_K, help="Voisins conservés par titre dans l'artefact")
+    parser.add_argument('--top-n', type=int, default=10, help='Recommandations par utilisateur')
+    parser.add_argument('--chunk-size', type=int, default=DEFAULT_CHUNK_SIZE, help='Utilisateurs par paquet')
+    parser.add_argument('--workers', type=int, default=0, help='Nombre de processus (0 : aucun pool)')
+    parser.add_argument('--diversity', choices=METHODS, help='Diversification des listes (MMR ou quota par genre)')
+    parser.add_argument('--diversity-lambda', type=float, default=DEFAULT_LAMBDA,
+                        help='Poids de la pertinence face à la diversité (MMR), entre 0 et 1')
+    parser.add_argument('--max-per-genre', type=int, default=DEFAULT_MAX_PER_GENRE, help='Quota de titres par genre')
+    parser.add_argument('--pool-factor', type=int, default=DEFAULT_POOL_FACTOR,
+                        help='Candidats réordonnés par recommandation demandée')
+    args = parser.parse_args(argv)
+
+    fmt = args.format or ('csv' if args.input.endswith('.csv') else 'jsonl')
+    # Construit l'artefact s'il est absent ou obsolète, puis le partage par chemin
+    df, model = load_or_build(args.csv, args.artifact_dir, args.top_k)
+    diversity, genres = None, None
+    if args.diversity is not None:
+        diversity = {
+            'method': args.diversity,
+            'diversity_lambda': args.diversity_lambda,
+            'max_per_genre': args.max_per_genre,
+            'pool_factor': args.pool_factor,
+        }
+        if args.diversity == 'genre':
+            genres = df['Genre'].astype(object).tolist()
+
+    source = sys.stdin if args.input == '-' else open(args.input, encoding='utf-8', newline='')
+    sink = sys.stdout if args.output == '-' else open(args.output, 'w', encoding='utf-8')
+    try:
+        stats = run_batch(
+            read_favorites(source, fmt), sink, model.path,
+            top_n=args.top_n, chunk_size=args.chunk_size, workers=args.workers,
+            diversity=diversity, genres=genres,
+        )
+    finally:
+        if source is not sys.stdin:
+            source.close()
+        if sink is not sys.stdout:
+            sink.close()
+
+    print(
+        f"{stats['users']} utilisateurs en {stats['seconds']} s "
+        f"({stats['users_per_sec']} utilisateurs/s, pic mémoire {stats['peak_rss_mb']} Mo)",
+        file=sys.stderr,
+    )
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,221 @@
+"""
+Encodage des synopsis par lots, reprenable et éventuellement multi-processus.
+
+`SentenceTransformer.encode` appelé une seule fois sur tout le catalogue
+perd tout le travail déjà fait s'il est interrompu. `BatchEncoder` :
+
+* trie les textes par longueur décroissante, afin que chaque lot de
+  `batch_size` textes soit de longueur homogène (peu de remplissage) ;
+* découpe ce tri en fragments de `shard_size` textes, écrits sur disque
+  dès qu'ils sont encodés (`checkpoint_dir`) : une relance ne ré-encode que
+  les fragments manquants. Chaque fragment est nommé d'après l'empreinte
+  de ses textes et du modèle, un fragment obsolète n'est donc jamais relu ;
+* peut répartir les lots sur plusieurs processus CPU (`workers`) ;
+* mesure le débit (synopsis par seconde).
+
+Utilisation :
+
+    python batch_encoder.py Anime.csv --batch-size 64 --workers 4
+"""
+
+import argparse
+import hashlib
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import Callable, List, Optional, Sequence
+
+import numpy as np
+
+# Textes par appel à l'encodeur
+DEFAULT_BATCH_SIZE = 64
+
+# Textes par fragment sauvegardé sur disque
+DEFAULT_SHARD_SIZE = 4096
+
+# Encodeur du processus de travail courant (voir `_init_encoder_worker`)
+_WORKER_ENCODER = None
+
+
+def _encode(encoder, texts: List[str]) -> np.ndarray:
+    embeddings = encoder.encode(texts, batch_size=len(texts), show_progress_bar=False)
+    return np.asarray(embeddings, dtype=np.float32)
+
+
+def _init_encoder_worker(encoder, n_threads: int) -> None:
+    global _WORKER_ENCODER
+    _WORKER_ENCODER = encoder
+    # Les processus se partagent les cœurs : pas de sur-souscription de torch
+    if 'torch' in sys.modules:
+        sys.modules['torch'].set_num_threads(n_threads)
+
+
+def _encode_task(texts: List[str]) -> np.ndarray:
+    return _encode(_WORKER_ENCODER, texts)
+
+
+def shard_key(texts: Sequence[str], model_name: str) -> str:
+    """Empreinte d'un fragment (textes, dans l'ordre, et modèle)."""
+    digest = hashlib.sha1(model_name.encode('utf-8'))
+    for text in texts:
+        digest.update(b'\0')
+        digest.update(text.encode('utf-8'))
+    return digest.hexdigest()
+
+
+def clear_checkpoints(checkpoint_dir: str) -> None:
+    """Supprime les fragments sauvegardés (une fois le cache d'embeddings écrit)."""
+    if not os.path.isdir(checkpoint_dir):
+        return
+    for name in os.listdir(checkpoint_dir):
+        if name.endswith('.npy'):
+            os.remove(os.path.join(checkpoint_dir, name))
+    if not os.listdir(checkpoint_dir):
+        os.rmdir(checkpoint_dir)
+
+
+class EncodeProgress:
+    """Affiche l'avancement et le débit de l'encodage (sur stderr)."""
+
+    def __init__(self, stream=sys.stderr):
+        self.stream = stream
+
+    def __call__(self, done: int, total: int, seconds: float) -> None:
+        rate = done / seconds if seconds > 0 else 0.0
+        print(f"\rEmbeddings : {done}/{total} ({rate:.0f} synopsis/s)", end='', file=self.stream, flush=True)
+        if done == total:
+            print(file=self.stream)
+
+
+class BatchEncoder:
+    """Encodeur par lots triés par longueur, avec points de reprise.
+
+    Parameters
+    ----------
+    encoder : object
+        Objet exposant `encode(texts, **kwargs)` (`SentenceTransformer`).
+    model_name : str
+        Nom du modèle (fait partie de l'empreinte des fragments).
+    batch_size : int
+        Textes par appel à l'encodeur.
+    workers : int
+        Processus d'encodage ; 1 encode dans le processus courant.
+    checkpoint_dir : str, optional
+        Dossier des fragments déjà encodés ; sans lui, pas de reprise.
+    shard_size : int
+        Textes par fragment sauvegardé.
+    progress : Callable[[int, int, float], None], optional
+        Appelée après chaque fragment avec (textes traités, total, secondes).
+    """
+
+    def __init__(self, encoder, model_name: str = '', batch_size: int = DEFAULT_BATCH_SIZE, workers: int = 1,
+                 checkpoint_dir: Optional[str] = None, shard_size: int = DEFAULT_SHARD_SIZE,
+                 progress: Optional[Callable[[int, int, float], None]] = None):
+        self.encoder = encoder
+        self.model_name = model_name
+        self.batch_size = max(1, batch_size)
+        self.workers = max(1, workers)
+        self.checkpoint_dir = checkpoint_dir
+        # Un fragment contient toujours un nombre entier de lots
+        self.shard_size = max(self.batch_size, shard_size // self.batch_size * self.batch_size)
+        self.progress = progress
+        self.stats = {}
+
+    def _shard_path(self, texts: Sequence[str]) -> Optional[str]:
+        if self.checkpoint_dir is None:
+            return None
+        return os.path.join(self.checkpoint_dir, f'{shard_key(texts, self.model_name)}.npy')
+
+    def _encode_shard(self, texts: List[str], pool: Optional[ProcessPoolExecutor]) -> np.ndarray:
+        batches = [texts[start:start + self.batch_size] for start in range(0, len(texts), self.batch_size)]
+        if pool is None:
+            return np.concatenate([_encode(self.encoder, batch) for batch in batches])
+        return np.concatenate(list(pool.map(_encode_task, batches)))
+
+    def encode(self, texts: Sequence[str]) -> np.ndarray:
+        """Encode des textes ; renvoie une matrice float32 alignée sur `texts`.
+
+        Les fragments déjà présents dans `checkpoint_dir` sont relus au lieu
+        d'être encodés. `stats` résume ensuite l'exécution (textes encodés,
+        repris, durée, débit).
+        """
+        texts = list(texts)
+        start_time = time.perf_counter()
+        lengths = np.fromiter((len(text) for text in texts), dtype=np.int64, count=len(texts))
+        order = np.argsort(-lengths, kind='stable')
+        if self.checkpoint_dir is not None:
+            os.makedirs(self.checkpoint_dir, exist_ok=True)
+
+        pool = None
+        if self.workers > 1:
+            n_threads = max(1, (os.cpu_count() or 1) // self.workers)
+            pool = ProcessPoolExecutor(max_workers=self.workers, initializer=_init_encoder_worker,
+                                       initargs=(self.encoder, n_threads))
+        shards, encoded, resumed = [], 0, 0
+        try:
+            for shard_start in range(0, len(texts), self.shard_size):
+                shard_texts = [texts[i] for i in order[shard_start:shard_start + self.shard_size]]
+                path = self._shard_path(shard_texts)
+                if path is not None and os.path.exists(path):
+                    vectors = np.load(path)
+                    resumed += len(shard_texts)
+                else:
+                    vectors = self._encode_shard(shard_texts, pool)
+                    encoded += len(shard_texts)
+                    if path is not None:
+                        # Écriture atomique : un fragment interrompu n'est jamais relu
+                        tmp_path = f'{path}.tmp.npy'
+                        np.save(tmp_path, vectors)
+                        os.replace(tmp_path, path)
+                shards.append(vectors)
+                if self.progress is not None:
+                    self.progress(shard_start + len(shard_texts), len(texts), time.perf_counter() - start_time)
+        finally:
+            if pool is not None:
+                pool.shutdown()
+
+        seconds = time.perf_counter() - start_time
+        self.stats = {
+            'n_texts': len(texts),
+            'encoded': encoded,
+            'resumed': resumed,
+            'seconds': round(seconds, 3),
+            'sentences_per_second': round(encoded / seconds, 1) if seconds > 0 else 0.0,
+        }
+        if not shards:
+            return np.empty((0, 0), dtype=np.float32)
+        sorted_vectors = np.concatenate(shards)
+        embeddings = np.empty_like(sorted_vectors)
+        embeddings[order] = sorted_vectors
+        return embeddings
+
+
+def main(argv: Optional[Sequence[str]] = None) -> None:
+    from data_load import DEFAULT_COLUMNS, load_data
+    from llm_engine import LLMEngine, create_embeddings_cache
+    from preprocess import preprocess_synopsis
+
+    parser = argparse.ArgumentParser(description="Encode les synopsis du catalogue dans le cache d'embeddings.")
+    parser.add_argument('csv', nargs='?', default='Anime.csv', help='Catalogue (CSV, Parquet ou Feather)')
+    parser.add_argument('--cache', default='embeddings_cache.npy', help="Cache d'embeddings")
+    parser.add_argument('--batch-size', type=int, default=DEFAULT_BATCH_SIZE, help='Textes par lot')
+    parser.add_argument('--workers', type=int, default=1, help="Processus d'encodage")
+    parser.add_argument('--shard-size', type=int, default=DEFAULT_SHARD_SIZE, help='Textes par point de reprise')
+    args = parser.parse_args(argv)
+
+    df = preprocess_synopsis(load_data(args.csv, DEFAULT_COLUMNS))
+    engine = LLMEngine()
+    embeddings = create_embeddings_cache(df, args.cache, engine=engine, batch_size=args.batch_size,
+                                         workers=args.workers, shard_size=args.shard_size)
+    if embeddings is not None:
+        stats = engine.last_encode_stats
+        if not stats:
+            print("Cache d'embeddings déjà à jour")
+            return
+        print(f"{stats['encoded']} synopsis encodés, {stats['resumed']} repris, "
+              f"{stats['sentences_per_second']:.0f} synopsis/s")
+
+
+if __name__ == '__main__':
+    main()
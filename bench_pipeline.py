@@ -0,0 +1,227 @@
+"""
+Banc d'essai de l'ensemble du pipeline sur des catalogues synthétiques.
+
+Pour chaque taille de catalogue demandée, le script génère un `Anime.csv`
+synthétique (titres, genres et synopsis de longueur réaliste tirés d'un
+vocabulaire de Zipf), puis mesure chaque étape :
+
+* `load_data`, `preprocess_synopsis`, `vectorize_synopsis` ;
+* `recommend_anime` (requêtes de favoris tirés au hasard) ;
+* l'encodage des synopsis et `LLMEngine.semantic_search`, avec un encodeur
+  factice déterministe (`FakeEncoder`) : le banc tourne hors ligne, sur CPU.
+
+Pour chaque étape sont relevés le temps écoulé, le pic de mémoire résidente
+et le débit. Chaque taille est exécutée dans un processus neuf pour que les
+mesures de mémoire ne se cumulent pas. Les résultats sont écrits en JSON
+afin de comparer les performances d'un commit à l'autre.
+
+Utilisation :
+
+    python bench_pipeline.py --sizes 10000 100000 --out bench_results.json
+"""
+
+import argparse
+import hashlib
+import json
+import multiprocessing
+import os
+import platform
+import subprocess
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import Callable, Dict, List, Optional
+
+import numpy as np
+import pandas as pd
+
+from instrumentation import Instrumentation, max_rss_mb
+
+GENRES = ['Action', 'Adventure', 'Comedy', 'Drama', 'Fantasy', 'Horror', 'Mecha',
+          'Mystery', 'Romance', 'Sci-Fi', 'Slice of Life', 'Sports']
+
+# Le calcul dense N×N n'est tenté qu'en dessous de cette taille
+DENSE_MAX_ROWS = 20000
+
+
+class FakeEncoder:
+    """Encodeur déterministe imitant `SentenceTransformer.encode`.
+
+    Chaque mot est associé à un vecteur pseudo-aléatoire dérivé de son
+    empreinte ; l'embedding d'un texte est la moyenne de ses mots. Deux
+    textes proches ont donc des embeddings proches, sans modèle à charger.
+    """
+
+    def __init__(self, dim: int = 384, seed: int = 0):
+        self.dim = dim
+        self.seed = seed
+        self._cache = {}
+
+    def _word_vector(self, word: str) -> np.ndarray:
+        vector = self._cache.get(word)
+        if vector is None:
+            digest = hashlib.blake2b(f'{self.seed}:{word}'.encode('utf-8'), digest_size=8).digest()
+            rng = np.random.default_rng(int.from_bytes(digest, 'little'))
+            vector = rng.standard_normal(self.dim).astype(np.float32)
+            self._cache[word] = vector
+        return vector
+
+    def encode(self, texts: List[str], **kwargs) -> np.ndarray:
+        embeddings = np.zeros((len(texts), self.dim), dtype=np.float32)
+        for i, text in enumerate(texts):
+            words = text.lower().split()
+            if words:
+                embeddings[i] = np.mean([self._word_vector(word) for word in words], axis=0)
+        return embeddings
+
+
+def generate_catalogue(n_rows: int, seed: int = 0, vocabulary_size: int = 30000) -> pd.DataFrame:
+    """Génère un catalogue d'anime synthétique.
+
+    Les longueurs de synopsis suivent une loi log-normale (environ 110 mots
+    en médiane) et les mots une loi de Zipf, comme dans un corpus réel.
+    Environ 2 % des synopsis sont manquants.
+
+    Parameters
+    ----------
+    n_rows : int
+        Nombre de titres.
+    seed : int
+        Graine du générateur aléatoire.
+    vocabulary_size : int
+        Taille du vocabulaire synthétique.
+
+    Returns
+    -------
+    pandas.DataFrame
+        Colonnes `Title`, `Genre` et `Synopsis`.
+    """
+    rng = np.random.default_rng(seed)
+    vocabulary = np.array([f'w{i}' for i in range(vocabulary_size)])
+    lengths = np.clip(rng.lognormal(mean=np.log(110), sigma=0.5, size=n_rows), 5, 600).astype(int)
+    words = rng.zipf(1.3, size=int(lengths.sum())) % vocabulary_size
+    offsets = np.concatenate([[0], np.cumsum(lengths)])
+    synopses = [' '.join(vocabulary[words[offsets[i]:offsets[i + 1]]]) for i in range(n_rows)]
+    missing = rng.random(n_rows) < 0.02
+    return pd.DataFrame({
+        'Title': [f'Anime {i}' for i in range(n_rows)],
+        'Genre': rng.choice(GENRES, size=n_rows),
+        'Synopsis': [None if gone else text for gone, text in zip(missing, synopses)],
+    })
+
+
+def measure(stage: str, func: Callable, items: int, results: Dict):
+    """Exécute `func`, enregistre temps, pic mémoire et débit, renvoie son résultat."""
+    # Registre propre à l'étape : le pic mémoire est échantillonné par son thread
+    probe = Instrumentation()
+    probe.enable()
+    try:
+        with probe.stage(stage):
+            start = time.perf_counter()
+            value = func()
+            elapsed = time.perf_counter() - start
+    finally:
+        probe.disable()
+    results[stage] = {
+        'seconds': round(elapsed, 4),
+        'peak_rss_mb': round(probe.stages[stage].peak_rss_mb, 1),
+        'items': items,
+        'items_per_sec': round(items / elapsed, 1) if elapsed > 0 else None,
+    }
+    return value
+
+
+def run_size(n_rows: int, queries: int = 100, top_k: Optional[int] = 50, dim: int = 384, seed: int = 0) -> Dict:
+    """Exécute toutes les étapes du pipeline pour une taille de catalogue."""
+    from data_load import DEFAULT_COLUMNS, load_data
+    from llm_engine import LLMEngine
+    from preprocess import preprocess_synopsis
+    from recommend import recommend_anime
+    from vectorize import vectorize_synopsis
+
+    rng = np.random.default_rng(seed)
+    stages = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        csv_path = os.path.join(tmp, 'Anime.csv')
+        generate_catalogue(n_rows, seed).to_csv(csv_path, index=False)
+
+        df = measure('load_data', lambda: load_data(csv_path, DEFAULT_COLUMNS), n_rows, stages)
+    df = measure('preprocess_synopsis', lambda: preprocess_synopsis(df), n_rows, stages)
+
+    neighbors = top_k
+    if neighbors is None and n_rows > DENSE_MAX_ROWS:
+        neighbors = 50
+    _, cosine_sim, indices = measure(
+        'vectorize_synopsis', lambda: vectorize_synopsis(df, top_k=neighbors), n_rows, stages
+    )
+    stages['vectorize_synopsis']['top_k'] = neighbors
+
+    titles = df['Title'].to_numpy()
+    favorites = [list(rng.choice(titles, size=3, replace=False)) for _ in range(queries)]
+    measure(
+        'recommend_anime',
+        lambda: [recommend_anime(favs, 10, df, cosine_sim, indices) for favs in favorites],
+        queries, stages,
+    )
+
+    engine = LLMEngine()
+    engine.embedder = FakeEncoder(dim=dim, seed=seed)
+    synopses = df['Synopsis'].tolist()
+    embeddings = measure('encode', lambda: engine.get_embeddings(synopses), n_rows, stages)
+    texts = [synopses[i] for i in rng.integers(0, n_rows, size=queries)]
+    measure(
+        'semantic_search',
+        lambda: [engine.semantic_search(text, df, embeddings, top_k=10) for text in texts],
+        queries, stages,
+    )
+    return {'rows': n_rows, 'stages': stages, 'max_rss_mb': round(max_rss_mb(), 1)}
+
+
+def _git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', 'HEAD'], capture_output=True, text=True, check=True,
+            cwd=os.path.dirname(os.path.abspath(__file__)),
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description="Banc d'essai du pipeline sur catalogues synthétiques.")
+    parser.add_argument('--sizes', type=int, nargs='+', default=[10000], help='Tailles de catalogue (lignes)')
+    parser.add_argument('--queries', type=int, default=100, help='Requêtes de recommandation/recherche')
+    parser.add_argument('--top-k', type=int, default=50,
+                        help='Voisins par titre (0 : matrice dense, si la taille le permet)')
+    parser.add_argument('--dim', type=int, default=384, help="Dimension de l'encodeur factice")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--out', default='bench_results.json', help='Fichier JSON de sortie')
+    args = parser.parse_args(argv)
+
+    report = {
+        'commit': _git_commit(),
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'cpu_count': os.cpu_count(),
+        'config': vars(args),
+        'results': [],
+    }
+    top_k = args.top_k or None
+    context = multiprocessing.get_context('spawn')
+    for n_rows in args.sizes:
+        # Un processus neuf par taille : les pics de mémoire ne se cumulent pas
+        with ProcessPoolExecutor(max_workers=1, mp_context=context) as pool:
+            result = pool.submit(run_size, n_rows, args.queries, top_k, args.dim, args.seed).result()
+        report['results'].append(result)
+        for stage, stats in result['stages'].items():
+            print(f"{n_rows:>9} {stage:<20} {stats['seconds']:>9.3f} s "
+                  f"{stats['items_per_sec'] or 0:>12.1f} /s {stats['peak_rss_mb']:>9.1f} Mo")
+
+    with open(args.out, 'w', encoding='utf-8') as f:
+        json.dump(report, f, indent=2)
+    print(f"Résultats écrits dans {args.out}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,143 @@
+"""
+Mesure du temps de démarrage des points d'entrée.
+
+Chaque point d'entrée (`main`, `interactive`, `streamlit_app`) est importé
+dans un interpréteur neuf, plusieurs fois ; on retient le meilleur temps
+(démarrage de Python compris) et on le compare à un budget. Le script
+vérifie aussi qu'aucune dépendance lourde (torch, sentence-transformers,
+scikit-learn) n'est chargée à l'import : elles doivent l'être au premier
+usage seulement.
+
+Le code de sortie est non nul si un budget est dépassé ou si un point
+d'entrée ne s'importe pas, ce qui permet de l'utiliser comme garde-fou en
+intégration continue :
+
+    python bench_startup.py --repeat 5
+
+`--allow-missing` ignore les points d'entrée dont une dépendance optionnelle
+(streamlit, par exemple) n'est pas installée.
+"""
+
+import argparse
+import json
+import subprocess
+import sys
+import time
+from typing import Dict, List, Optional
+
+# Budget de démarrage (secondes) de chaque point d'entrée
+STARTUP_BUDGETS = {
+    'main': 1.5,
+    'interactive': 1.5,
+    'streamlit_app': 3.0,
+}
+
+# Modules qui ne doivent pas être importés au démarrage
+FORBIDDEN_MODULES = ('torch', 'sentence_transformers', 'transformers', 'sklearn')
+
+_PROBE = """
+import json, sys
+import {module}
+loaded = sorted({{name.split('.')[0] for name in sys.modules}} & set({forbidden!r}))
+print(json.dumps(loaded))
+"""
+
+
+def _slowest_imports(importtime_log: str, top: int) -> List[Dict]:
+    """Extrait les imports les plus coûteux d'une trace `-X importtime`."""
+    entries = []
+    for line in importtime_log.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        parts = line.split(':', 1)[1].split('|')
+        if len(parts) != 3:
+            continue
+        _, cumulative_us, name = parts
+        entries.append({'module': name.strip(), 'cumulative_ms': int(cumulative_us) / 1000})
+    entries.sort(key=lambda entry: entry['cumulative_ms'], reverse=True)
+    return entries[:top]
+
+
+def measure_startup(module: str, repeat: int = 3, top: int = 5) -> Dict:
+    """Mesure le temps d'import d'un point d'entrée dans un interpréteur neuf.
+
+    Parameters
+    ----------
+    module : str
+        Nom du module à importer.
+    repeat : int
+        Nombre de mesures ; le meilleur temps est retenu.
+    top : int
+        Nombre d'imports les plus coûteux à rapporter.
+
+    Returns
+    -------
+    dict
+        Temps retenu (s), modules interdits chargés, imports les plus
+        coûteux et éventuelle erreur.
+    """
+    code = _PROBE.format(module=module, forbidden=FORBIDDEN_MODULES)
+    best = None
+    result = {'module': module}
+    for _ in range(repeat):
+        start = time.perf_counter()
+        proc = subprocess.run(
+            [sys.executable, '-X', 'importtime', '-c', code],
+            capture_output=True, text=True,
+        )
+        elapsed = time.perf_counter() - start
+        if proc.returncode != 0:
+            result['error'] = proc.stderr.strip().splitlines()[-1] if proc.stderr.strip() else 'échec'
+            return result
+        if best is None or elapsed < best:
+            best = elapsed
+            result['forbidden_loaded'] = json.loads(proc.stdout.strip().splitlines()[-1])
+            result['slowest_imports'] = _slowest_imports(proc.stderr, top)
+    result['seconds'] = round(best, 3)
+    return result
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Budget de démarrage des points d'entrée.")
+    parser.add_argument('modules', nargs='*', default=list(STARTUP_BUDGETS), help='Points d\'entrée mesurés')
+    parser.add_argument('--repeat', type=int, default=3, help='Mesures par point d\'entrée')
+    parser.add_argument('--top', type=int, default=5, help='Imports les plus coûteux affichés')
+    parser.add_argument('--allow-missing', action='store_true',
+                        help='Ignore les points d\'entrée dont une dépendance n\'est pas installée')
+    parser.add_argument('--json', dest='json_path', help='Écrit aussi les résultats dans ce fichier JSON')
+    args = parser.parse_args(argv)
+
+    failed = False
+    results = []
+    for module in args.modules:
+        result = measure_startup(module, args.repeat, args.top)
+        budget = STARTUP_BUDGETS.get(module)
+        result['budget'] = budget
+        results.append(result)
+
+        if 'error' in result:
+            missing = result['error'].startswith('ModuleNotFoundError')
+            if args.allow_missing and missing:
+                print(f"{module:<15} ignoré ({result['error']})")
+            else:
+                failed = True
+                print(f"{module:<15} ÉCHEC ({result['error']})")
+            continue
+        over = budget is not None and result['seconds'] > budget
+        heavy = result['forbidden_loaded']
+        status = 'OK' if not (over or heavy) else 'ÉCHEC'
+        failed = failed or over or bool(heavy)
+        print(f"{module:<15} {result['seconds']:.3f} s (budget {budget} s) {status}")
+        if heavy:
+            print(f"{'':<15} modules lourds chargés à l'import : {', '.join(heavy)}")
+        for entry in result['slowest_imports']:
+            print(f"{'':<15} {entry['cumulative_ms']:>8.1f} ms  {entry['module']}")
+
+    if args.json_path:
+        with open(args.json_path, 'w', encoding='utf-8') as f:
+            json.dump(results, f, indent=2)
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -1,26 +1,211 @@
 """
 Module de chargement des données pour le système de recommandation d'anime.
 
-Ce module définit une fonction simple pour charger le fichier CSV contenant
-les informations sur les anime. L'objectif est de séparer cette étape
-de prétraitement de manière claire, afin de pouvoir la réutiliser dans
-différents scripts ou notebooks.
+Ce module définit les fonctions de chargement du catalogue d'anime.
+L'objectif est de séparer cette étape de prétraitement de manière claire,
+afin de pouvoir la réutiliser dans différents scripts ou notebooks.
+
+Sur demande (`columns=DEFAULT_COLUMNS`), seules les colonnes utiles aux
+recommandations sont lues (`Title`, `Genre`, `Synopsis`) ; par défaut,
+`load_data` lit toutes les colonnes. Les types sont compacts : catégorie
+pour `Genre`, chaînes pyarrow pour les textes lorsque pyarrow est utilisable. Le catalogue peut
+aussi être lu par morceaux (`iter_chunks`, `iter_synopses`) ou converti une
+fois pour toutes en Parquet/Feather (`convert_to_columnar`), format que
+`load_data` relit beaucoup plus vite :
+
+    python data_load.py Anime.csv --format parquet
 """
 
+import argparse
+import os
+from typing import Dict, Iterator, List, Optional, Sequence
+
 import pandas as pd
 
+from instrumentation import timed
+
+# Un pyarrow installé mais inutilisable (ABI numpy incompatible, version
+# antérieure à 7) compte comme absent : les textes restent en `object`.
+# pandas importe déjà pyarrow s'il est présent, l'import ne coûte rien de plus.
+try:
+    import pyarrow
+    PYARROW_AVAILABLE = int(pyarrow.__version__.split('.')[0]) >= 7
+except ImportError:
+    PYARROW_AVAILABLE = False
+
+# Colonnes utilisées par les recommandeurs
+DEFAULT_COLUMNS = ['Title', 'Genre', 'Synopsis']
+
+# Nombre de lignes lues à la fois en mode itératif
+DEFAULT_CHUNK_SIZE = 10000
+
+COLUMNAR_FORMATS = {'.parquet': 'parquet', '.feather': 'feather'}
+
+
+def column_dtypes() -> Dict[str, str]:
+    """Types compacts des colonnes connues du catalogue."""
+    text = 'string[pyarrow]' if PYARROW_AVAILABLE else 'object'
+    return {'Title': text, 'Synopsis': text, 'Genre': 'category'}
+
+
+def _read_csv(filepath: str, columns: Optional[Sequence[str]], **kwargs):
+    wanted = set(columns) if columns is not None else None
+    return pd.read_csv(
+        filepath,
+        # Projection tolérante : une colonne absente du fichier est ignorée
+        usecols=(lambda column: column in wanted) if wanted is not None else None,
+        dtype=column_dtypes(),
+        **kwargs,
+    )
 
-def load_data(filepath: str) -> pd.DataFrame:
-    """Charge le jeu de données à partir d'un fichier CSV.
+
+def _read_columnar(filepath: str, fmt: str, columns: Optional[Sequence[str]]) -> pd.DataFrame:
+    if fmt == 'parquet':
+        import pyarrow.parquet as pq
+        available = pq.read_schema(filepath).names
+    else:
+        import pyarrow.ipc as ipc
+        available = ipc.open_file(filepath).schema.names
+    if columns is not None:
+        columns = [column for column in columns if column in available]
+    if fmt == 'parquet':
+        return pd.read_parquet(filepath, columns=columns)
+    return pd.read_feather(filepath, columns=columns)
+
+
+@timed('load_data')
+def load_data(filepath: str, columns: Optional[Sequence[str]] = None) -> pd.DataFrame:
+    """Charge le jeu de données à partir d'un fichier CSV, Parquet ou Feather.
+
+    Le format est déduit de l'extension du fichier.
 
     Parameters
     ----------
     filepath : str
-        Chemin complet vers le fichier CSV à charger.
+        Chemin complet vers le fichier à charger.
+    columns : Sequence[str], optional
+        Colonnes à lire (par défaut, toutes ; `DEFAULT_COLUMNS` pour les
+        seules colonnes utiles aux recommandations) ; les colonnes absentes
+        du fichier sont ignorées.
 
     Returns
     -------
     pandas.DataFrame
-        DataFrame contenant l'intégralité des données du fichier.
+        DataFrame contenant les colonnes demandées, avec des types compacts.
     """
-    return pd.read_csv(filepath)
+    fmt = COLUMNAR_FORMATS.get(os.path.splitext(filepath)[1].lower())
+    if fmt is not None:
+        return _read_columnar(filepath, fmt, columns)
+    return _read_csv(filepath, columns)
+
+
+def iter_chunks(
+    filepath: str,
+    chunksize: int = DEFAULT_CHUNK_SIZE,
+    columns: Optional[Sequence[str]] = DEFAULT_COLUMNS,
+) -> Iterator[pd.DataFrame]:
+    """Lit le catalogue par morceaux de `chunksize` lignes.
+
+    Parameters
+    ----------
+    filepath : str
+        Chemin du fichier CSV, Parquet ou Feather.
+    chunksize : int
+        Nombre de lignes par morceau.
+    columns : Sequence[str], optional
+        Colonnes à lire (`None` pour toutes).
+
+    Yields
+    ------
+    pandas.DataFrame
+        Morceaux successifs du catalogue, indexés par position globale.
+    """
+    fmt = COLUMNAR_FORMATS.get(os.path.splitext(filepath)[1].lower())
+    if fmt is None:
+        with _read_csv(filepath, columns, chunksize=chunksize) as reader:
+            yield from reader
+        return
+    if fmt == 'parquet':
+        import pyarrow.parquet as pq
+        parquet = pq.ParquetFile(filepath)
+        if columns is not None:
+            columns = [column for column in columns if column in parquet.schema_arrow.names]
+        start = 0
+        for batch in parquet.iter_batches(batch_size=chunksize, columns=columns):
+            chunk = batch.to_pandas()
+            chunk.index = pd.RangeIndex(start, start + len(chunk))
+            start += len(chunk)
+            yield chunk
+        return
+    # Feather est projeté en mémoire : le découpage ne coûte pas de copie
+    df = _read_columnar(filepath, fmt, columns)
+    for start in range(0, len(df), chunksize):
+        yield df.iloc[start:start + chunksize]
+
+
+def iter_synopses(filepath: str, chunksize: int = DEFAULT_CHUNK_SIZE) -> Iterator[str]:
+    """Itère sur les synopsis du catalogue (chaîne vide si manquant).
+
+    Seule la colonne `Synopsis` est lue, morceau par morceau : le résultat
+    peut être passé directement à `vectorize.fit_tfidf`.
+    """
+    for chunk in iter_chunks(filepath, chunksize, columns=['Synopsis']):
+        yield from chunk['Synopsis'].fillna('').tolist()
+
+
+def convert_to_columnar(
+    csv_path: str,
+    out_path: Optional[str] = None,
+    fmt: str = 'parquet',
+    columns: Optional[Sequence[str]] = DEFAULT_COLUMNS,
+) -> str:
+    """Convertit le catalogue CSV en Parquet ou Feather.
+
+    Parameters
+    ----------
+    csv_path : str
+        Fichier CSV source.
+    out_path : str, optional
+        Fichier de sortie ; par défaut, `csv_path` avec l'extension du format.
+    fmt : str
+        `'parquet'` ou `'feather'`.
+    columns : Sequence[str], optional
+        Colonnes conservées (`None` pour toutes).
+
+    Returns
+    -------
+    str
+        Chemin du fichier écrit.
+    """
+    if fmt not in COLUMNAR_FORMATS.values():
+        raise ValueError(f"Format inconnu : {fmt}")
+    if not PYARROW_AVAILABLE:
+        raise ImportError("La conversion en Parquet/Feather nécessite pyarrow (pip install pyarrow)")
+    if out_path is None:
+        out_path = f"{os.path.splitext(csv_path)[0]}.{fmt}"
+
+    df = load_data(csv_path, columns)
+    tmp_path = f"{out_path}.tmp"
+    if fmt == 'parquet':
+        df.to_parquet(tmp_path, index=False)
+    else:
+        df.reset_index(drop=True).to_feather(tmp_path)
+    os.replace(tmp_path, out_path)
+    return out_path
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description="Convertit le catalogue CSV en format colonne.")
+    parser.add_argument('csv', nargs='?', default='Anime.csv', help='Fichier CSV du catalogue')
+    parser.add_argument('--format', choices=sorted(COLUMNAR_FORMATS.values()), default='parquet')
+    parser.add_argument('--out', help='Fichier de sortie')
+    parser.add_argument('--all-columns', action='store_true', help='Conserve toutes les colonnes du CSV')
+    args = parser.parse_args(argv)
+
+    columns = None if args.all_columns else DEFAULT_COLUMNS
+    out_path = convert_to_columnar(args.csv, args.out, args.format, columns)
+    print(f"Catalogue écrit dans {out_path}")
+
+
+if __name__ == '__main__':
+    main()
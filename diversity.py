@@ -0,0 +1,245 @@
+"""
+Réordonnancement des recommandations pour diversifier la liste.
+
+Le top-N brut par similarité cumulée est souvent saturé par une même
+franchise (suites, films, épisodes spéciaux d'un favori). Ce module
+réordonne un groupe de candidats, `pool_factor` fois plus grand que la
+liste demandée, avec l'une de deux méthodes :
+
+* `'mmr'` (Maximal Marginal Relevance) : chaque titre retenu maximise
+  `λ·pertinence − (1 − λ)·max(similarité avec les titres déjà retenus)`.
+  λ = 1 redonne le classement brut, λ = 0 privilégie la seule diversité ;
+* `'genre'` : au plus `max_per_genre` titres par genre, les titres en
+  excédent ne complétant la liste qu'à défaut d'autres candidats.
+
+Les similarités deux à deux ne sont calculées que sur les candidats
+(matrice P×P extraite de la matrice de similarité ou de l'index des
+voisins) : le coût dépend de la taille du groupe, pas du catalogue.
+
+    python diversity.py --csv Anime.csv --favorites "Naruto" --method mmr --lambda 0.6
+"""
+
+import argparse
+from typing import Optional, Sequence, Tuple
+
+import numpy as np
+from scipy import sparse
+
+from quantize import QuantizedMatrix
+
+METHODS = ('mmr', 'genre')
+
+# Compromis pertinence / diversité de la MMR (1 : classement brut)
+DEFAULT_LAMBDA = 0.7
+
+# Candidats examinés par recommandation demandée
+DEFAULT_POOL_FACTOR = 5
+
+# Titres au plus par genre (méthode 'genre')
+DEFAULT_MAX_PER_GENRE = 3
+
+
+def pool_size(top_n: int, pool_factor: int = DEFAULT_POOL_FACTOR) -> int:
+    """Nombre de candidats à extraire avant réordonnancement."""
+    return max(top_n, top_n * pool_factor)
+
+
+def candidate_similarity(cosine_sim, candidates: np.ndarray) -> np.ndarray:
+    """Similarités deux à deux des candidats (matrice dense P×P).
+
+    Parameters
+    ----------
+    cosine_sim : numpy.ndarray, scipy.sparse.spmatrix or quantize.QuantizedScores
+        Matrice de similarité cosinus ou index creux des voisins.
+    candidates : numpy.ndarray
+        Positions des candidats.
+
+    Returns
+    -------
+    numpy.ndarray
+        Matrice symétrique float32, diagonale nulle. Avec l'index des
+        voisins, une paire absente des deux listes de voisins vaut 0.
+    """
+    candidates = np.asarray(candidates, dtype=np.int64)
+    if isinstance(cosine_sim, QuantizedMatrix):
+        block = cosine_sim.block(candidates, candidates)
+    elif isinstance(cosine_sim, np.ndarray):
+        block = cosine_sim[np.ix_(candidates, candidates)]
+    else:
+        # Index creux (éventuellement quantifié) : lignes des candidats, puis leurs colonnes
+        block = sparse.csr_matrix(cosine_sim[candidates])[:, candidates].toarray()
+    block = np.asarray(block, dtype=np.float32)
+    # L'index des voisins n'est pas symétrique : une paire est similaire dès qu'un sens l'est
+    similarity = np.maximum(block, block.T)
+    np.fill_diagonal(similarity, 0.0)
+    return similarity
+
+
+def mmr_rerank(
+    relevance: np.ndarray,
+    similarity: np.ndarray,
+    top_n: int,
+    diversity_lambda: float = DEFAULT_LAMBDA,
+) -> np.ndarray:
+    """Sélection gloutonne MMR parmi les candidats.
+
+    Parameters
+    ----------
+    relevance : numpy.ndarray
+        Pertinence de chaque candidat (P,), ramenée sur [0, 1].
+    similarity : numpy.ndarray
+        Similarités deux à deux des candidats (P×P).
+    top_n : int
+        Nombre de candidats à retenir.
+    diversity_lambda : float
+        Poids de la pertinence, dans [0, 1].
+
+    Returns
+    -------
+    numpy.ndarray
+        Positions (dans le groupe) des candidats retenus, dans l'ordre de sélection.
+    """
+    if not 0.0 <= diversity_lambda <= 1.0:
+        raise ValueError(f"diversity_lambda doit être compris entre 0 et 1 : {diversity_lambda}")
+    relevance = np.asarray(relevance, dtype=np.float64)
+    k = min(top_n, len(relevance))
+    if k <= 0:
+        return np.empty(0, dtype=np.int64)
+    # Pertinence sur [0, 1] : le compromis λ ne dépend pas du nombre de favoris
+    low, high = relevance.min(), relevance.max()
+    relevance = (relevance - low) / (high - low) if high > low else np.ones_like(relevance)
+
+    # Similarité maximale de chaque candidat avec la sélection, mise à jour en O(P)
+    redundancy = np.zeros(len(relevance))
+    available = np.ones(len(relevance), dtype=bool)
+    selected = np.empty(k, dtype=np.int64)
+    for step in range(k):
+        gain = diversity_lambda * relevance - (1.0 - diversity_lambda) * redundancy
+        gain[~available] = -np.inf
+        best = int(np.argmax(gain))
+        selected[step] = best
+        available[best] = False
+        np.maximum(redundancy, similarity[best], out=redundancy)
+    return selected
+
+
+def split_genres(value) -> Tuple[str, ...]:
+    """Genres d'un titre (`'Action, Comedy'` → `('action', 'comedy')`)."""
+    if not isinstance(value, str):
+        return ()
+    return tuple(dict.fromkeys(genre.strip().lower() for genre in value.split(',') if genre.strip()))
+
+
+def genre_quota_rerank(
+    candidate_genres: Sequence[Tuple[str, ...]],
+    top_n: int,
+    max_per_genre: int = DEFAULT_MAX_PER_GENRE,
+) -> np.ndarray:
+    """Sélection par quota de genres, candidats parcourus par pertinence décroissante.
+
+    Un candidat est retenu si aucun de ses genres n'a atteint le quota ;
+    sinon il est mis de côté et ne complète la liste qu'en dernier recours.
+
+    Returns
+    -------
+    numpy.ndarray
+        Positions (dans le groupe) des candidats retenus.
+    """
+    if max_per_genre < 1:
+        raise ValueError(f"max_per_genre doit être positif : {max_per_genre}")
+    k = min(top_n, len(candidate_genres))
+    selected, deferred, counts = [], [], {}
+    for position, genres in enumerate(candidate_genres):
+        if len(selected) == k:
+            break
+        if any(counts.get(genre, 0) >= max_per_genre for genre in genres):
+            deferred.append(position)
+            continue
+        selected.append(position)
+        for genre in genres:
+            counts[genre] = counts.get(genre, 0) + 1
+    selected += deferred[:k - len(selected)]
+    return np.asarray(selected, dtype=np.int64)
+
+
+def diversify(
+    top_indices: np.ndarray,
+    top_scores: np.ndarray,
+    top_n: int,
+    method: str = 'mmr',
+    cosine_sim=None,
+    genres: Optional[Sequence] = None,
+    diversity_lambda: float = DEFAULT_LAMBDA,
+    max_per_genre: int = DEFAULT_MAX_PER_GENRE,
+) -> Tuple[np.ndarray, np.ndarray]:
+    """Réordonne un groupe de candidats triés par pertinence décroissante.
+
+    Parameters
+    ----------
+    top_indices, top_scores : numpy.ndarray
+        Positions des candidats dans le catalogue et leurs scores.
+    top_n : int
+        Nombre de recommandations à retourner.
+    method : str
+        `'mmr'` ou `'genre'`.
+    cosine_sim : numpy.ndarray, scipy.sparse.spmatrix or quantize.QuantizedScores, optional
+        Matrice de similarité (méthode `'mmr'`).
+    genres : Sequence, optional
+        Genre(s) de chaque titre du catalogue, par position (méthode `'genre'`).
+    diversity_lambda, max_per_genre
+        Voir `mmr_rerank` et `genre_quota_rerank`.
+
+    Returns
+    -------
+    tuple
+        Positions et scores d'origine des titres retenus.
+    """
+    if method not in METHODS:
+        raise ValueError(f"Méthode de diversification inconnue : {method}")
+    if method == 'mmr':
+        if cosine_sim is None:
+            raise ValueError("La méthode 'mmr' nécessite la matrice de similarité")
+        similarity = candidate_similarity(cosine_sim, top_indices)
+        order = mmr_rerank(top_scores, similarity, top_n, diversity_lambda)
+    else:
+        if genres is None:
+            raise ValueError("La méthode 'genre' nécessite les genres du catalogue")
+        order = genre_quota_rerank([split_genres(genres[i]) for i in top_indices], top_n, max_per_genre)
+    return top_indices[order], top_scores[order]
+
+
+def main(argv: Optional[Sequence[str]] = None) -> None:
+    from artifact import DEFAULT_ARTIFACT_DIR, DEFAULT_TOP_K, load_or_build
+    from recommend import recommend_anime
+
+    parser = argparse.ArgumentParser(description="Compare les recommandations brutes et diversifiées.")
+    parser.add_argument('--csv', default='Anime.csv', help='Fichier CSV du catalogue')
+    parser.add_argument('--artifact-dir', default=DEFAULT_ARTIFACT_DIR, help='Dossier racine des artefacts')
+    parser.add_argument('--top-k', type=int, default=DEFAULT_TOP_K, help="Voisins conservés par titre dans l'artefact")
+    parser.add_argument('--favorites', required=True, help='Titres favoris séparés par des virgules')
+    parser.add_argument('--top-n', type=int, default=10, help='Nombre de recommandations')
+    parser.add_argument('--method', choices=METHODS, default='mmr', help='Méthode de diversification')
+    parser.add_argument('--lambda', dest='diversity_lambda', type=float, default=DEFAULT_LAMBDA,
+                        help='Poids de la pertinence (MMR), entre 0 et 1')
+    parser.add_argument('--max-per-genre', type=int, default=DEFAULT_MAX_PER_GENRE, help='Quota par genre')
+    parser.add_argument('--pool-factor', type=int, default=DEFAULT_POOL_FACTOR, help='Candidats par recommandation')
+    args = parser.parse_args(argv)
+
+    df, model = load_or_build(args.csv, args.artifact_dir, args.top_k)
+    favorites = [title.strip() for title in args.favorites.split(',') if title.strip()]
+    raw = recommend_anime(favorites, args.top_n, df, model.neighbors, model.indices)
+    diverse = recommend_anime(
+        favorites, args.top_n, df, model.neighbors, model.indices,
+        diversity=args.method, diversity_lambda=args.diversity_lambda,
+        max_per_genre=args.max_per_genre, pool_factor=args.pool_factor,
+    )
+    width = max([len('Brut')] + [len(title) for title in raw['Title']])
+    print(f"{'Brut':<{width}}  Diversifié ({args.method})")
+    for rank in range(max(len(raw), len(diverse))):
+        left = raw['Title'].iloc[rank] if rank < len(raw) else ''
+        right = diverse['Title'].iloc[rank] if rank < len(diverse) else ''
+        print(f"{left:<{width}}  {right}")
+
+
+if __name__ == '__main__':
+    main()
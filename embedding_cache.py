@@ -0,0 +1,174 @@
+"""
+Cache incrémental des embeddings de synopsis.
+
+Chaque ligne du cache est identifiée par une empreinte du texte du synopsis
+et du nom du modèle d'embeddings. Lors d'un rafraîchissement, seuls les
+synopsis nouveaux ou modifiés sont encodés ; les autres vecteurs sont
+recopiés depuis l'ancien cache. Le cache est toujours réécrit dans l'ordre
+courant du DataFrame, si bien qu'il peut être ouvert directement en mémoire
+partagée (`np.load(mmap_mode='r')`) sans réindexation.
+
+Fichiers :
+
+* `embeddings_cache.npy` : matrice N×D en float32 (ou float16) ;
+* `embeddings_cache.index.json` : fichier annexe contenant le modèle, le
+  type des vecteurs, l'empreinte de chaque ligne et celle du `.npy` (taille
+  et date de modification).
+
+Les deux fichiers sont écrits dans un fichier temporaire puis remplacés
+atomiquement. Si le processus s'arrête entre les deux remplacements,
+l'empreinte du `.npy` ne correspond plus au fichier annexe et la paire est
+rejetée : le cache est reconstruit au lieu de servir des vecteurs décalés.
+"""
+
+import hashlib
+import json
+import os
+from typing import Callable, List, Optional, Sequence
+
+import numpy as np
+
+# Nombre de lignes recopiées à la fois lors de la réécriture du cache
+COPY_BLOCK_SIZE = 4096
+
+
+def row_key(text: str, model_name: str) -> str:
+    """Empreinte d'un synopsis pour un modèle d'embeddings donné."""
+    return hashlib.sha1(f'{model_name}\0{text}'.encode('utf-8')).hexdigest()
+
+
+def file_fingerprint(path: str) -> dict:
+    """Empreinte légère d'un fichier : taille et date de modification (ns)."""
+    stat = os.stat(path)
+    return {'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns}
+
+
+def _write_json_atomic(path: str, payload: dict) -> None:
+    tmp_path = f'{path}.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(payload, f)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+
+class EmbeddingCache:
+    """Cache d'embeddings adressé par le contenu des synopsis.
+
+    Parameters
+    ----------
+    cache_path : str
+        Chemin du fichier `.npy` contenant les vecteurs.
+    model_name : str
+        Nom du modèle d'embeddings (il fait partie de la clé de chaque ligne).
+    dtype : str
+        Type de stockage des vecteurs : `'float32'` ou `'float16'`.
+    """
+
+    def __init__(self, cache_path: str = "embeddings_cache.npy", model_name: str = "all-mpnet-base-v2",
+                 dtype: str = 'float32'):
+        self.cache_path = cache_path
+        self.model_name = model_name
+        self.dtype = np.dtype(dtype)
+        root, _ = os.path.splitext(cache_path)
+        self.index_path = f'{root}.index.json'
+
+    def _read_index(self) -> Optional[dict]:
+        if not (os.path.exists(self.index_path) and os.path.exists(self.cache_path)):
+            return None
+        with open(self.index_path, encoding='utf-8') as f:
+            index = json.load(f)
+        expected = index.get('npy')
+        if expected is None:
+            # Ancien format sans empreinte : seul le nombre de lignes est vérifiable
+            rows = np.load(self.cache_path, mmap_mode='r').shape[0]
+            return index if rows == len(index.get('keys', [])) else None
+        return index if expected == file_fingerprint(self.cache_path) else None
+
+    def keys_for(self, texts: Sequence[str]) -> List[str]:
+        return [row_key(text, self.model_name) for text in texts]
+
+    def load(self, texts: Sequence[str]) -> Optional[np.ndarray]:
+        """Ouvre le cache s'il correspond exactement aux synopsis fournis.
+
+        Parameters
+        ----------
+        texts : Sequence[str]
+            Synopsis, dans l'ordre du DataFrame.
+
+        Returns
+        -------
+        numpy.ndarray or None
+            Matrice des embeddings en mémoire partagée, ou None si le cache
+            est absent ou obsolète (ordre, ajouts ou synopsis modifiés).
+        """
+        index = self._read_index()
+        if index is None or index.get('keys') != self.keys_for(texts):
+            return None
+        return np.load(self.cache_path, mmap_mode='r')
+
+    def update(self, texts: Sequence[str], encode: Callable[[List[str]], np.ndarray]) -> Optional[np.ndarray]:
+        """Met à jour le cache en n'encodant que les synopsis nouveaux ou modifiés.
+
+        Parameters
+        ----------
+        texts : Sequence[str]
+            Synopsis, dans l'ordre du DataFrame.
+        encode : Callable
+            Fonction qui encode une liste de textes en matrice d'embeddings.
+
+        Returns
+        -------
+        numpy.ndarray or None
+            Matrice des embeddings en mémoire partagée, alignée sur `texts`,
+            ou None si l'encodage a échoué.
+        """
+        if not texts:
+            return None
+        keys = self.keys_for(texts)
+        index = self._read_index()
+        old_rows = {}
+        old = None
+        if index is not None and index.get('model') == self.model_name:
+            old = np.load(self.cache_path, mmap_mode='r')
+            old_rows = {key: row for row, key in enumerate(index['keys'])}
+
+        # Encodage des seuls synopsis absents du cache (chacun une seule fois)
+        missing = list(dict.fromkeys(key for key in keys if key not in old_rows))
+        new_vectors = {}
+        if missing:
+            first_text = dict(zip(keys, texts))
+            encoded = encode([first_text[key] for key in missing])
+            if encoded is None:
+                return None
+            new_vectors = dict(zip(missing, np.asarray(encoded)))
+
+        if old is not None and not missing and index['keys'] == keys and old.dtype == self.dtype:
+            return old
+        dim = old.shape[1] if old is not None else len(next(iter(new_vectors.values())))
+
+        # Réécriture du cache dans l'ordre courant, puis remplacement atomique
+        tmp_path = f'{self.cache_path}.tmp.npy'
+        store = np.lib.format.open_memmap(tmp_path, mode='w+', dtype=self.dtype, shape=(len(keys), dim))
+        for start in range(0, len(keys), COPY_BLOCK_SIZE):
+            block_keys = keys[start:start + COPY_BLOCK_SIZE]
+            for offset, key in enumerate(block_keys):
+                if key in new_vectors:
+                    store[start + offset] = new_vectors[key]
+            cached = [(offset, old_rows[key]) for offset, key in enumerate(block_keys) if key not in new_vectors]
+            if cached:
+                offsets, rows = map(np.asarray, zip(*cached))
+                store[start + offsets] = old[rows]
+        store.flush()
+        del store, old
+        with open(tmp_path, 'rb') as f:
+            os.fsync(f.fileno())
+
+        # `os.replace` conserve la date de modification : l'empreinte du
+        # fichier temporaire est celle du cache une fois installé.
+        fingerprint = file_fingerprint(tmp_path)
+        os.replace(tmp_path, self.cache_path)
+        _write_json_atomic(self.index_path, {
+            'model': self.model_name, 'dtype': self.dtype.name, 'dim': int(dim), 'keys': keys, 'npy': fingerprint,
+        })
+        return np.load(self.cache_path, mmap_mode='r')
@@ -0,0 +1,239 @@
+"""
+Classement hybride TF‑IDF + embeddings.
+
+`HybridRanker` prend des favoris et/ou une requête en langage naturel et
+renvoie un unique top-K fusionné. Pour que le coût d'une requête reste
+indépendant de la taille du catalogue, on procède en deux temps :
+
+1. **Génération de candidats** avec l'index le moins coûteux pour chaque
+   entrée : les listes de voisins TF‑IDF (`vectorize.build_neighbors`) pour
+   les favoris, l'index vectoriel (`vector_index`) pour la requête ;
+2. **Re-scoring** des seuls candidats avec l'autre représentation.
+
+Les deux scores sont ensuite fusionnés par somme pondérée (après
+normalisation min-max) ou par *reciprocal rank fusion* (RRF).
+"""
+
+from typing import Callable, Dict, List, Optional, Sequence
+
+import numpy as np
+import pandas as pd
+from scipy import sparse
+
+from recommend import favorite_positions
+from quantize import QuantizedSparse
+from vector_index import ExactIndex, normalize_rows
+
+DEFAULT_WEIGHTS = {'tfidf': 0.5, 'embedding': 0.5}
+DEFAULT_CANDIDATE_POOL = 200
+# Constante de lissage de la fusion RRF
+RRF_K = 60
+
+
+def _top_positions(scores: np.ndarray, n: int) -> np.ndarray:
+    n = min(n, len(scores))
+    if n <= 0:
+        return np.empty(0, dtype=np.int64)
+    return np.argpartition(-scores, n - 1)[:n]
+
+
+def _min_max(scores: np.ndarray) -> np.ndarray:
+    low, high = scores.min(), scores.max()
+    if high - low <= 0:
+        return np.zeros_like(scores)
+    return (scores - low) / (high - low)
+
+
+def _ranks(scores: np.ndarray) -> np.ndarray:
+    """Rang (à partir de 1) de chaque score, par ordre décroissant."""
+    ranks = np.empty(len(scores), dtype=np.int64)
+    ranks[np.argsort(-scores, kind='stable')] = np.arange(1, len(scores) + 1)
+    return ranks
+
+
+def fuse_scores(signals: Dict[str, np.ndarray], weights: Dict[str, float], method: str = 'weighted') -> np.ndarray:
+    """Fusionne plusieurs scores calculés sur les mêmes candidats.
+
+    Parameters
+    ----------
+    signals : Dict[str, numpy.ndarray]
+        Scores de chaque représentation (par exemple `'tfidf'`, `'embedding'`).
+    weights : Dict[str, float]
+        Poids de chaque représentation.
+    method : str
+        `'weighted'` (somme pondérée des scores normalisés) ou `'rrf'`.
+
+    Returns
+    -------
+    numpy.ndarray
+        Score fusionné de chaque candidat.
+    """
+    fused = np.zeros(len(next(iter(signals.values()))), dtype=np.float64)
+    for name, scores in signals.items():
+        weight = weights.get(name, 0.0)
+        if method == 'weighted':
+            fused += weight * _min_max(scores)
+        elif method == 'rrf':
+            fused += weight / (RRF_K + _ranks(scores))
+        else:
+            raise ValueError(f"Méthode de fusion inconnue : {method}")
+    return fused
+
+
+class HybridRanker:
+    """Classement fusionné TF‑IDF + embeddings sur un ensemble de candidats.
+
+    Parameters
+    ----------
+    df : pandas.DataFrame
+        Catalogue (colonnes `Title` et `Synopsis`).
+    tfidf_matrix : scipy.sparse.csr_matrix
+        Matrice TF‑IDF des synopsis.
+    neighbors : scipy.sparse.csr_matrix
+        Index creux des K plus proches voisins TF‑IDF.
+    indices : pandas.Series
+        Série associant chaque titre à sa position.
+    vectorizer : TfidfVectorizer, optional
+        Vectoriseur ajusté, nécessaire pour scorer une requête en TF‑IDF.
+    embeddings : numpy.ndarray, optional
+        Embeddings des synopsis (mêmes positions que `df`).
+    vector_index : ExactIndex or IVFIndex, optional
+        Index vectoriel sur `embeddings` ; un index exact est construit par
+        défaut.
+    encode : Callable, optional
+        Fonction encodant une liste de textes (par exemple
+        `LLMEngine.embedder.encode`), nécessaire pour une requête textuelle.
+    """
+
+    def __init__(
+        self,
+        df: pd.DataFrame,
+        tfidf_matrix: sparse.csr_matrix,
+        neighbors: sparse.csr_matrix,
+        indices: pd.Series,
+        vectorizer=None,
+        embeddings: Optional[np.ndarray] = None,
+        vector_index=None,
+        encode: Optional[Callable[[List[str]], np.ndarray]] = None,
+    ):
+        self.df = df
+        self.tfidf_matrix = sparse.csr_matrix(tfidf_matrix)
+        # Un index quantifié (voir `quantize`) renvoie lui aussi des lignes CSR
+        self.neighbors = neighbors if isinstance(neighbors, QuantizedSparse) else sparse.csr_matrix(neighbors)
+        self.indices = indices
+        self.vectorizer = vectorizer
+        self.embeddings = embeddings
+        self.encode = encode
+        if vector_index is None and embeddings is not None:
+            vector_index = ExactIndex(embeddings)
+        self.vector_index = vector_index
+
+    def _favorite_candidates(self, fav_indices: np.ndarray, pool: int) -> np.ndarray:
+        """Candidats issus des listes de voisins des favoris (coût O(F·K))."""
+        rows = self.neighbors[fav_indices]
+        candidates, inverse = np.unique(rows.indices, return_inverse=True)
+        candidates = candidates.astype(np.int64)
+        scores = np.bincount(inverse, weights=rows.data, minlength=len(candidates))
+        keep = ~np.isin(candidates, fav_indices)
+        candidates, scores = candidates[keep], scores[keep]
+        return candidates[_top_positions(scores, pool)]
+
+    def _query_candidates(self, query_vector: np.ndarray, pool: int) -> np.ndarray:
+        positions, _ = self.vector_index.search(query_vector, pool)
+        return np.asarray(positions, dtype=np.int64)
+
+    def rank(
+        self,
+        favorites: Optional[Sequence[str]] = None,
+        query: Optional[str] = None,
+        top_k: int = 10,
+        weights: Optional[Dict[str, float]] = None,
+        method: str = 'weighted',
+        candidate_pool: int = DEFAULT_CANDIDATE_POOL,
+    ) -> pd.DataFrame:
+        """Renvoie le top-K fusionné pour des favoris et/ou une requête.
+
+        Parameters
+        ----------
+        favorites : Sequence[str], optional
+            Titres favoris.
+        query : str, optional
+            Requête en langage naturel.
+        top_k : int
+            Nombre de résultats.
+        weights : Dict[str, float], optional
+            Poids des scores `'tfidf'` et `'embedding'`.
+        method : str
+            `'weighted'` ou `'rrf'` (voir `fuse_scores`).
+        candidate_pool : int
+            Nombre de candidats générés par chaque index avant re-scoring.
+
+        Returns
+        -------
+        pandas.DataFrame
+            Colonnes `Title`, `Genre` (si le catalogue l'a), `Synopsis`,
+            `score`, `tfidf_score` et `embedding_score`, triées par score
+            fusionné décroissant.
+        """
+        weights = {**DEFAULT_WEIGHTS, **(weights or {})}
+        info_columns = [column for column in ('Title', 'Genre', 'Synopsis') if column in self.df.columns]
+        empty = pd.DataFrame(columns=info_columns + ['score', 'tfidf_score', 'embedding_score'])
+        fav_indices = favorite_positions(favorites or [], self.indices)
+        use_embeddings = self.embeddings is not None
+        query_vector = None
+        if query:
+            if use_embeddings and self.encode is not None:
+                query_vector = normalize_rows(np.asarray(self.encode([query]))[0])
+            elif self.vectorizer is None:
+                raise ValueError("Une requête textuelle nécessite un encodeur ou un vectoriseur TF-IDF")
+        if not len(fav_indices) and not query:
+            return empty
+
+        # 1. Génération de candidats avec l'index le moins coûteux
+        parts = []
+        if len(fav_indices):
+            parts.append(self._favorite_candidates(fav_indices, candidate_pool))
+        if query_vector is not None:
+            parts.append(self._query_candidates(query_vector, candidate_pool))
+        elif query:
+            # Sans embeddings, la requête est scorée en TF‑IDF sur tout le catalogue
+            query_tfidf = self.vectorizer.transform([query])
+            parts.append(_top_positions((self.tfidf_matrix @ query_tfidf.T).toarray().ravel(), candidate_pool))
+        candidates = np.unique(np.concatenate(parts))
+        candidates = candidates[~np.isin(candidates, fav_indices)]
+        if not len(candidates):
+            return empty
+
+        # 2. Re-scoring des seuls candidats avec chaque représentation
+        tfidf_parts = []
+        if len(fav_indices):
+            # Similarité exacte candidats × favoris : coût O(pool·F)
+            fav_sim = self.tfidf_matrix[candidates] @ self.tfidf_matrix[fav_indices].T
+            tfidf_parts.append(np.asarray(fav_sim.sum(axis=1)).ravel() / len(fav_indices))
+        if query and self.vectorizer is not None:
+            query_tfidf = self.vectorizer.transform([query])
+            tfidf_parts.append((self.tfidf_matrix[candidates] @ query_tfidf.T).toarray().ravel())
+        signals = {}
+        if tfidf_parts:
+            signals['tfidf'] = np.mean(tfidf_parts, axis=0)
+
+        if use_embeddings:
+            vectors = normalize_rows(np.asarray(self.embeddings[candidates]))
+            embedding_parts = []
+            if len(fav_indices):
+                profile = normalize_rows(normalize_rows(np.asarray(self.embeddings[fav_indices])).mean(axis=0))
+                embedding_parts.append(vectors @ profile)
+            if query_vector is not None:
+                embedding_parts.append(vectors @ query_vector)
+            if embedding_parts:
+                signals['embedding'] = np.mean(embedding_parts, axis=0)
+
+        fused = fuse_scores(signals, weights, method)
+        order = np.lexsort((candidates, -fused))[:top_k]
+        top = candidates[order]
+
+        results = self.df.iloc[top][info_columns].copy()
+        results['score'] = fused[order]
+        results['tfidf_score'] = signals['tfidf'][order] if 'tfidf' in signals else np.nan
+        results['embedding_score'] = signals['embedding'][order] if 'embedding' in signals else np.nan
+        return results
@@ -0,0 +1,323 @@
+"""
+Mise à jour incrémentale de l'artefact du modèle.
+
+Lorsqu'une nouvelle saison ajoute quelques dizaines de titres au catalogue,
+il n'est pas nécessaire de réapprendre le vectoriseur ni de recalculer tous
+les voisins. `update_artifact` prend les lignes nouvelles ou modifiées (un
+titre déjà présent est considéré comme modifié) et :
+
+1. les transforme avec le vocabulaire et les poids IDF déjà appris ;
+2. remplace ou ajoute leurs lignes dans la matrice TF‑IDF ;
+3. calcule leurs K plus proches voisins sur tout le catalogue ;
+4. corrige les listes de voisins des titres existants : celles qui
+   contenaient un titre modifié sont recalculées, et les titres nouveaux ou
+   modifiés sont insérés dans les autres lorsqu'ils battent le K-ième
+   voisin actuel.
+
+Les voisins obtenus sont ceux d'un recalcul complet sur la même matrice.
+
+Le vocabulaire n'étant pas réappris, les mots inconnus des nouveaux
+synopsis sont ignorés. Leur proportion cumulée depuis le dernier
+apprentissage complet (la dérive du vocabulaire) est suivie dans le
+manifeste ; au-delà de `drift_threshold`, la mise à jour signale qu'une
+reconstruction complète est souhaitable.
+
+Utilisation (après avoir ajouté les lignes à `Anime.csv`) :
+
+    python incremental.py nouveautes.csv --csv Anime.csv
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+import time
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+import pandas as pd
+from scipy import sparse
+
+from artifact import (DEFAULT_ARTIFACT_DIR, TITLES_FILE, VOCABULARY_FILE, ModelArtifact, _save_csr,
+                      artifact_key, build_artifact, latest_artifact, load_artifact, publish_artifact)
+from data_load import DEFAULT_COLUMNS, load_data
+from preprocess import preprocess_synopsis
+from stream_tfidf import HashingTfidf
+
+# Proportion de mots inconnus au-delà de laquelle un réapprentissage est conseillé
+DEFAULT_DRIFT_THRESHOLD = 0.15
+
+
+def _out_of_vocabulary(vectorizer, synopses: List[str], n_fit_items: int) -> Tuple[int, int]:
+    """Nombre de mots inconnus du vocabulaire appris et nombre total de mots."""
+    if isinstance(vectorizer, HashingTfidf):
+        # Une colonne jamais vue à l'apprentissage a le poids IDF maximal
+        unseen = vectorizer.idf_ >= np.log(1 + n_fit_items) + 1 - 1e-9
+        counts = vectorizer.counts(synopses)
+        return int(counts.data[unseen[counts.indices]].sum()), int(counts.data.sum())
+    analyzer = vectorizer.build_analyzer()
+    vocabulary = vectorizer.vocabulary_
+    tokens = [token for synopsis in synopses for token in analyzer(synopsis)]
+    return sum(token not in vocabulary for token in tokens), len(tokens)
+
+
+def _top_k_rows(scores: np.ndarray, k: int) -> Tuple[np.ndarray, np.ndarray]:
+    """Top-K de chaque ligne de `scores`, trié par score décroissant."""
+    top = np.argpartition(scores, -k, axis=1)[:, -k:]
+    top_scores = np.take_along_axis(scores, top, axis=1)
+    order = np.argsort(-top_scores, axis=1)
+    return np.take_along_axis(top, order, axis=1), np.take_along_axis(top_scores, order, axis=1)
+
+
+def _replace_rows(
+    matrix: sparse.csr_matrix,
+    positions: np.ndarray,
+    rows: sparse.csr_matrix,
+    appended: sparse.csr_matrix,
+) -> sparse.csr_matrix:
+    """Remplace les lignes `positions` de `matrix` par `rows` et ajoute `appended`."""
+    n_rows = matrix.shape[0]
+    keep = np.ones(n_rows, dtype=np.float32)
+    keep[positions] = 0
+    # Matrice de sélection : la ligne j de `rows` est placée à la position positions[j]
+    scatter = sparse.csr_matrix(
+        (np.ones(len(positions), dtype=np.float32), (positions, np.arange(len(positions)))),
+        shape=(n_rows, len(positions)),
+    )
+    updated = sparse.diags(keep) @ matrix + scatter @ rows
+    updated = sparse.vstack([updated, appended], format='csr', dtype=np.float32)
+    updated.eliminate_zeros()
+    return updated
+
+
+def patch_neighbors(
+    neighbors: sparse.csr_matrix,
+    tfidf_matrix: sparse.csr_matrix,
+    changed: np.ndarray,
+    top_k: int,
+) -> sparse.csr_matrix:
+    """Corrige l'index des voisins après modification des lignes `changed`.
+
+    Parameters
+    ----------
+    neighbors : scipy.sparse.csr_matrix
+        Ancien index des voisins (N×N, N ≤ nombre de lignes de `tfidf_matrix`).
+    tfidf_matrix : scipy.sparse.csr_matrix
+        Matrice TF‑IDF à jour.
+    changed : numpy.ndarray
+        Positions des lignes nouvelles ou modifiées.
+    top_k : int
+        Nombre de voisins conservés par titre.
+
+    Returns
+    -------
+    scipy.sparse.csr_matrix
+        Index des voisins à jour, lignes triées par score décroissant.
+    """
+    n_items = tfidf_matrix.shape[0]
+    k = max(0, min(top_k, n_items - 1))
+    if k == 0 or not len(changed):
+        neighbors = sparse.csr_matrix(neighbors)
+        neighbors.resize((n_items, n_items))
+        return neighbors
+
+    neighbors = sparse.csr_matrix(neighbors)
+    old = neighbors.tocoo()
+    is_changed = np.zeros(n_items, dtype=bool)
+    is_changed[changed] = True
+    # Les listes qui contenaient une ligne modifiée sont recalculées en entier :
+    # le remplaçant de ce voisin peut venir de n'importe où dans le catalogue
+    stale = is_changed[old.col]
+    recomputed = np.concatenate([changed, np.setdiff1d(old.row[stale], changed)]).astype(np.int64)
+
+    # Similarités des lignes recalculées avec tout le catalogue : |R|×N
+    scores = (tfidf_matrix[recomputed] @ tfidf_matrix.T).toarray().astype(np.float32)
+    scores[np.arange(len(recomputed)), recomputed] = -np.inf
+
+    # 1. Voisins complets des lignes nouvelles, modifiées ou amputées
+    top, top_scores = _top_k_rows(scores, k)
+    new_rows = np.repeat(recomputed, k)
+    new_cols = top.ravel()
+    new_vals = top_scores.ravel()
+
+    # 2. Listes intactes des autres lignes
+    is_recomputed = np.zeros(n_items, dtype=bool)
+    is_recomputed[recomputed] = True
+    keep = ~is_recomputed[old.row]
+    old_rows, old_cols, old_vals = old.row[keep], old.col[keep], old.data[keep]
+
+    # K-ième score actuel de chaque ligne ; une liste incomplète accepte tout candidat
+    lengths = np.diff(neighbors.indptr)
+    kth = np.zeros(n_items, dtype=np.float32)
+    full = np.flatnonzero(lengths >= k)
+    if len(full):
+        kth[full] = neighbors.data[neighbors.indptr[full + 1] - 1]
+
+    # 3. Lignes modifiées insérées dans les listes intactes qu'elles améliorent
+    changed_scores = scores[:len(changed)]
+    candidate_idx, candidate_rows = np.nonzero(changed_scores > kth)
+    keep = ~is_recomputed[candidate_rows]
+    candidate_rows = candidate_rows[keep]
+    candidate_cols = changed[candidate_idx[keep]]
+    candidate_vals = changed_scores[candidate_idx[keep], candidate_rows]
+
+    rows = np.concatenate([old_rows, candidate_rows, new_rows])
+    cols = np.concatenate([old_cols, candidate_cols, new_cols])
+    vals = np.concatenate([old_vals, candidate_vals, new_vals]).astype(np.float32)
+    order = np.lexsort((cols, -vals, rows))
+    rows, cols, vals = rows[order], cols[order], vals[order]
+    # Rang de chaque entrée dans sa ligne : seuls les K premiers sont gardés
+    starts = np.searchsorted(rows, rows, side='left')
+    keep = (np.arange(len(rows)) - starts < k) & (vals > 0)
+    counts = np.bincount(rows[keep], minlength=n_items)
+    indptr = np.concatenate([[0], np.cumsum(counts)]).astype(np.int64)
+    return sparse.csr_matrix((vals[keep], cols[keep].astype(np.int32), indptr), shape=(n_items, n_items))
+
+
+def update_artifact(
+    model: ModelArtifact,
+    rows: pd.DataFrame,
+    artifact_dir: Optional[str] = None,
+    csv_path: Optional[str] = None,
+    drift_threshold: float = DEFAULT_DRIFT_THRESHOLD,
+) -> Tuple[str, Dict]:
+    """Intègre des titres nouveaux ou modifiés dans un artefact existant.
+
+    Parameters
+    ----------
+    model : artifact.ModelArtifact
+        Artefact à mettre à jour.
+    rows : pandas.DataFrame
+        Lignes nouvelles ou modifiées (colonnes `Title` et `Synopsis`). Un
+        titre déjà présent remplace la ligne existante ; les autres sont
+        ajoutés à la fin, dans l'ordre.
+    artifact_dir : str, optional
+        Dossier racine des artefacts (par défaut, celui de `model`).
+    csv_path : str, optional
+        Catalogue complet auquel les lignes ont déjà été ajoutées. S'il est
+        fourni, on vérifie que l'ordre des titres correspond et l'artefact
+        reçoit la clé de ce fichier, si bien que `artifact.load_or_build`
+        le retrouve.
+    drift_threshold : float
+        Proportion cumulée de mots inconnus au-delà de laquelle un
+        réapprentissage complet est conseillé.
+
+    Returns
+    -------
+    tuple
+        Un couple (chemin du nouvel artefact, rapport) ; le rapport indique
+        le nombre de titres ajoutés et modifiés, la dérive du vocabulaire et
+        `needs_refit`.
+    """
+    artifact_dir = artifact_dir or os.path.dirname(os.path.abspath(model.path))
+    rows = preprocess_synopsis(rows.drop_duplicates('Title', keep='last'))
+    titles = list(model.titles)
+    indices = model.indices[~model.indices.index.duplicated(keep='last')]
+    known = indices.reindex(rows['Title'].astype(str))
+    is_new = known.isna().to_numpy()
+    modified = known[~is_new].to_numpy(dtype=np.int64)
+    new_titles = rows['Title'].astype(str)[is_new].tolist()
+    titles.extend(new_titles)
+    if csv_path is not None:
+        catalogue_titles = load_data(csv_path, ['Title'])['Title'].astype(str).tolist()
+        if catalogue_titles != titles:
+            raise ValueError(
+                f"L'ordre des titres de {csv_path} ne correspond pas à l'artefact mis à jour : "
+                "les titres doivent être ajoutés à la fin du catalogue (reconstruction complète sinon)"
+            )
+
+    vectorizer = model.vectorizer
+    synopses = rows['Synopsis'].tolist()
+    vectors = sparse.csr_matrix(vectorizer.transform(synopses), dtype=np.float32)
+    tfidf_matrix = _replace_rows(
+        sparse.csr_matrix(model.tfidf_matrix, dtype=np.float32), modified, vectors[~is_new], vectors[is_new],
+    )
+    n_old = len(model.titles)
+    changed = np.concatenate([modified, np.arange(n_old, n_old + int(is_new.sum()))])
+    top_k = model.manifest['top_k']
+    neighbors = patch_neighbors(model.neighbors, tfidf_matrix, changed, top_k)
+
+    # Dérive du vocabulaire, cumulée depuis le dernier apprentissage complet
+    manifest = dict(model.manifest)
+    drift = dict(manifest.get('drift', {'fit_n_items': n_old, 'oov_tokens': 0, 'tokens': 0,
+                                        'rows_added': 0, 'rows_modified': 0}))
+    oov_tokens, tokens = _out_of_vocabulary(vectorizer, synopses, drift['fit_n_items'])
+    drift['oov_tokens'] += oov_tokens
+    drift['tokens'] += tokens
+    drift['rows_added'] += int(is_new.sum())
+    drift['rows_modified'] += len(modified)
+    drift['ratio'] = drift['oov_tokens'] / drift['tokens'] if drift['tokens'] else 0.0
+
+    if csv_path is not None:
+        key = artifact_key(csv_path, top_k, 'hashing_n_features' in manifest)
+    else:
+        digest = hashlib.sha256(model.version.encode('utf-8'))
+        digest.update(json.dumps([rows['Title'].astype(str).tolist(), synopses]).encode('utf-8'))
+        key = digest.hexdigest()[:16]
+
+    os.makedirs(artifact_dir, exist_ok=True)
+    tmp_dir = tempfile.mkdtemp(prefix=f'.{key}-', dir=artifact_dir)
+    _save_csr(tmp_dir, 'tfidf', tfidf_matrix)
+    _save_csr(tmp_dir, 'neighbors', neighbors)
+    # Vocabulaire et poids IDF sont inchangés
+    for name in ('idf.npy', VOCABULARY_FILE):
+        if os.path.exists(os.path.join(model.path, name)):
+            shutil.copyfile(os.path.join(model.path, name), os.path.join(tmp_dir, name))
+    with open(os.path.join(tmp_dir, TITLES_FILE), 'w', encoding='utf-8') as f:
+        json.dump(titles, f, ensure_ascii=False)
+
+    manifest.update({
+        'key': key,
+        'n_items': tfidf_matrix.shape[0],
+        'created_at': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'drift': drift,
+    })
+    if csv_path is not None:
+        manifest['csv_path'] = os.path.abspath(csv_path)
+    path = publish_artifact(tmp_dir, artifact_dir, manifest)
+
+    report = {
+        'path': path,
+        'rows_added': int(is_new.sum()),
+        'rows_modified': len(modified),
+        'oov_ratio': oov_tokens / tokens if tokens else 0.0,
+        'drift': drift['ratio'],
+        'needs_refit': drift['ratio'] > drift_threshold,
+    }
+    return path, report
+
+
+def main(argv: Optional[Sequence[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description="Intègre de nouveaux titres à l'artefact sans reconstruction.")
+    parser.add_argument('rows', help='Fichier (CSV, Parquet ou Feather) des lignes nouvelles ou modifiées')
+    parser.add_argument('--csv', default='Anime.csv', help='Catalogue complet, lignes déjà ajoutées')
+    parser.add_argument('--artifact-dir', default=DEFAULT_ARTIFACT_DIR, help='Dossier racine des artefacts')
+    parser.add_argument('--drift-threshold', type=float, default=DEFAULT_DRIFT_THRESHOLD,
+                        help='Proportion de mots inconnus déclenchant un réapprentissage')
+    parser.add_argument('--refit', action='store_true',
+                        help='Reconstruit entièrement l\'artefact si la dérive dépasse le seuil')
+    args = parser.parse_args(argv)
+
+    path = latest_artifact(args.artifact_dir)
+    if path is None:
+        parser.error(f"aucun artefact dans {args.artifact_dir} : lancez d'abord artifact.py")
+    model = load_artifact(path, mmap_mode=None)
+
+    start = time.perf_counter()
+    path, report = update_artifact(model, load_data(args.rows, DEFAULT_COLUMNS), args.artifact_dir, args.csv, args.drift_threshold)
+    print(f"{report['rows_added']} titres ajoutés, {report['rows_modified']} modifiés "
+          f"en {time.perf_counter() - start:.2f} s : {path}")
+    print(f"Mots inconnus : {report['oov_ratio']:.1%} (cumul depuis l'apprentissage : {report['drift']:.1%})")
+    if report['needs_refit']:
+        if args.refit:
+            path = build_artifact(args.csv, args.artifact_dir, model.manifest['top_k'],
+                                  streaming='hashing_n_features' in model.manifest)
+            print(f"Dérive au-delà du seuil : artefact reconstruit ({path})")
+        else:
+            print("Dérive au-delà du seuil : reconstruction complète conseillée (--refit)")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,289 @@
+"""
+Instrumentation légère des étapes du pipeline.
+
+Les fonctions clés sont décorées par `timed` (`load_data`,
+`preprocess_synopsis`, `vectorize_synopsis`, `recommend_anime`,
+`semantic_search`, `_call_ollama`) et les événements notables comptés par
+`count` (appels au LLM, réponses servies par le cache, délais dépassés,
+erreurs, explications par défaut). Pour chaque étape sont relevés le
+nombre d'appels, un histogramme des durées et le pic de mémoire résidente
+(échantillonné par un thread pendant que l'étape s'exécute).
+
+Désactivée (le défaut), l'instrumentation se réduit à un test booléen par
+appel. Elle s'active par programme (`enable()`) ou, pour n'importe quel
+point d'entrée, par la variable d'environnement `ANIME_METRICS` :
+
+* `ANIME_METRICS=json` : une ligne JSON par étape terminée sur stderr, puis
+  le bilan complet en JSON à la sortie du programme ;
+* `ANIME_METRICS=prometheus` : bilan au format texte Prometheus à la sortie.
+
+    ANIME_METRICS=json python main.py
+"""
+
+import atexit
+import bisect
+import functools
+import json
+import os
+import sys
+import threading
+import time
+from contextlib import contextmanager, nullcontext
+from typing import Callable, Dict, List, Optional, Sequence, TextIO
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+# Bornes (secondes) des histogrammes de durée
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# Intervalle d'échantillonnage de la mémoire résidente (secondes)
+MEMORY_INTERVAL = 0.01
+
+ENV_VARIABLE = 'ANIME_METRICS'
+EXPORT_FORMATS = ('json', 'prometheus')
+
+_NULL_STAGE = nullcontext()
+
+
+def max_rss_mb(include_children: bool = False) -> float:
+    """Pic de mémoire résidente du processus depuis son démarrage (Mo).
+
+    Avec `include_children`, le pic du plus gros processus enfant terminé
+    (workers d'un pool, par exemple) est aussi pris en compte.
+    """
+    if resource is None:
+        return 0.0
+    usage = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    if include_children:
+        usage = max(usage, resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss)
+    # ru_maxrss est exprimé en octets sous macOS, en kilo-octets ailleurs
+    return usage / (2 ** 20 if sys.platform == 'darwin' else 1024)
+
+
+def current_rss_mb() -> float:
+    """Mémoire résidente actuelle du processus (Mo)."""
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE') / 2 ** 20
+    except (OSError, ValueError, AttributeError):
+        return max_rss_mb()
+
+
+class Histogram:
+    """Histogramme cumulatif à bornes fixes, au sens de Prometheus."""
+
+    def __init__(self, buckets: Sequence[float] = LATENCY_BUCKETS):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def render(self, name: str, labels: str) -> List[str]:
+        lines = []
+        cumulative = 0
+        for bound, count in zip(self.buckets + (float('inf'),), self.counts):
+            cumulative += count
+            le = '+Inf' if bound == float('inf') else repr(bound)
+            lines.append(f'{name}_bucket{{{labels},le="{le}"}} {cumulative}')
+        lines.append(f'{name}_sum{{{labels}}} {self.sum:.6f}')
+        lines.append(f'{name}_count{{{labels}}} {self.count}')
+        return lines
+
+
+class StageStats:
+    """Mesures cumulées d'une étape."""
+
+    def __init__(self):
+        self.durations = Histogram()
+        self.max_seconds = 0.0
+        self.peak_rss_mb = 0.0
+
+    def as_dict(self) -> Dict:
+        return {
+            'calls': self.durations.count,
+            'seconds': round(self.durations.sum, 6),
+            'max_seconds': round(self.max_seconds, 6),
+            'peak_rss_mb': round(self.peak_rss_mb, 1),
+        }
+
+
+class Instrumentation:
+    """Registre des mesures : étapes chronométrées et compteurs.
+
+    Parameters
+    ----------
+    memory_interval : float
+        Intervalle d'échantillonnage de la mémoire ; 0 pour ne relever la
+        mémoire qu'à la fin de chaque étape.
+    """
+
+    def __init__(self, memory_interval: float = MEMORY_INTERVAL):
+        self.enabled = False
+        self.memory_interval = memory_interval
+        self.log_stream: Optional[TextIO] = None
+        self.stages: Dict[str, StageStats] = {}
+        self.counters: Dict[str, int] = {}
+        self._lock = threading.Lock()
+        # Pic mémoire de chaque étape en cours, mis à jour par l'échantillonneur
+        self._active: Dict[int, List[float]] = {}
+        self._sampler = None
+        self._stop = threading.Event()
+
+    def enable(self, log_stream: Optional[TextIO] = None) -> None:
+        """Active les mesures ; `log_stream` reçoit une ligne JSON par étape."""
+        self.log_stream = log_stream
+        self.enabled = True
+        if self.memory_interval > 0 and self._sampler is None:
+            self._stop.clear()
+            self._sampler = threading.Thread(target=self._sample, name='rss-sampler', daemon=True)
+            self._sampler.start()
+
+    def disable(self) -> None:
+        self.enabled = False
+        if self._sampler is not None:
+            self._stop.set()
+            self._sampler.join()
+            self._sampler = None
+
+    def reset(self) -> None:
+        with self._lock:
+            self.stages.clear()
+            self.counters.clear()
+
+    def _sample(self) -> None:
+        while not self._stop.wait(self.memory_interval):
+            if self._active:
+                rss = current_rss_mb()
+                for peak in list(self._active.values()):
+                    if rss > peak[0]:
+                        peak[0] = rss
+
+    @contextmanager
+    def _measure(self, name: str):
+        # Relevé en fin d'étape, complété par l'échantillonneur pour les étapes longues
+        peak = [0.0]
+        token = id(peak)
+        self._active[token] = peak
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            seconds = time.perf_counter() - start
+            del self._active[token]
+            peak_rss = max(peak[0], current_rss_mb())
+            with self._lock:
+                stats = self.stages.get(name)
+                if stats is None:
+                    stats = self.stages[name] = StageStats()
+                stats.durations.observe(seconds)
+                stats.max_seconds = max(stats.max_seconds, seconds)
+                stats.peak_rss_mb = max(stats.peak_rss_mb, peak_rss)
+            if self.log_stream is not None:
+                record = {'stage': name, 'seconds': round(seconds, 6), 'peak_rss_mb': round(peak_rss, 1)}
+                print(json.dumps(record), file=self.log_stream, flush=True)
+
+    def stage(self, name: str):
+        """Contexte chronométrant une étape (sans effet si désactivé)."""
+        if not self.enabled:
+            return _NULL_STAGE
+        return self._measure(name)
+
+    def count(self, name: str, n: int = 1) -> None:
+        if not self.enabled:
+            return
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + n
+
+    def snapshot(self) -> Dict:
+        """Bilan des mesures, sérialisable en JSON."""
+        with self._lock:
+            return {
+                'stages': {name: stats.as_dict() for name, stats in sorted(self.stages.items())},
+                'counters': dict(sorted(self.counters.items())),
+                'max_rss_mb': round(max_rss_mb(), 1),
+            }
+
+    def to_json(self) -> str:
+        return json.dumps(self.snapshot(), indent=2)
+
+    def render_prometheus(self) -> str:
+        """Bilan au format texte Prometheus."""
+        with self._lock:
+            lines = [
+                '# HELP anime_stage_duration_seconds Durée des étapes du pipeline.',
+                '# TYPE anime_stage_duration_seconds histogram',
+            ]
+            for name, stats in sorted(self.stages.items()):
+                lines += stats.durations.render('anime_stage_duration_seconds', f'stage="{name}"')
+            lines += [
+                '# HELP anime_stage_peak_rss_bytes Pic de mémoire résidente observé pendant une étape.',
+                '# TYPE anime_stage_peak_rss_bytes gauge',
+            ]
+            for name, stats in sorted(self.stages.items()):
+                lines.append(f'anime_stage_peak_rss_bytes{{stage="{name}"}} {int(stats.peak_rss_mb * 2 ** 20)}')
+            lines += [
+                '# HELP anime_events_total Événements comptés (appels LLM, cache, erreurs...).',
+                '# TYPE anime_events_total counter',
+            ]
+            for name, value in sorted(self.counters.items()):
+                lines.append(f'anime_events_total{{event="{name}"}} {value}')
+        return '\n'.join(lines) + '\n'
+
+    def export(self, fmt: str) -> str:
+        if fmt not in EXPORT_FORMATS:
+            raise ValueError(f"Format d'export inconnu : {fmt}")
+        return self.to_json() + '\n' if fmt == 'json' else self.render_prometheus()
+
+
+# Registre partagé par tout le processus
+INSTRUMENTATION = Instrumentation()
+
+
+def stage(name: str):
+    """Contexte chronométrant une étape du registre partagé."""
+    return INSTRUMENTATION.stage(name)
+
+
+def count(name: str, n: int = 1) -> None:
+    """Incrémente un compteur du registre partagé."""
+    if INSTRUMENTATION.enabled:
+        INSTRUMENTATION.count(name, n)
+
+
+def timed(name: str) -> Callable:
+    """Décorateur chronométrant chaque appel de la fonction sous le nom `name`."""
+    def decorator(func: Callable) -> Callable:
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if not INSTRUMENTATION.enabled:
+                return func(*args, **kwargs)
+            with INSTRUMENTATION._measure(name):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def enable(log_stream: Optional[TextIO] = None) -> Instrumentation:
+    INSTRUMENTATION.enable(log_stream)
+    return INSTRUMENTATION
+
+
+def configure_from_env(stream: TextIO = sys.stderr) -> Optional[str]:
+    """Active l'instrumentation selon `ANIME_METRICS` et exporte le bilan à la sortie."""
+    fmt = os.getenv(ENV_VARIABLE, '').strip().lower()
+    if fmt not in EXPORT_FORMATS or INSTRUMENTATION.enabled:
+        return None
+    INSTRUMENTATION.enable(stream if fmt == 'json' else None)
+    atexit.register(lambda: stream.write(INSTRUMENTATION.export(fmt)))
+    return fmt
+
+
+configure_from_env()
@@ -7,14 +7,14 @@ import sys
 from rich.console import Console
 from rich.table import Table
 from rich.panel import Panel
-from rich.prompt import Prompt, IntPrompt
+from rich.prompt import Prompt, IntPrompt, FloatPrompt
 from rich.markdown import Markdown
 from rich import box
 
-from data_load import load_data
-from preprocess import preprocess_synopsis
-from vectorize import vectorize_synopsis
-from recommend import recommend_anime
+from artifact import load_or_build
+from diversity import METHODS
+from recommend import RecommendationCache, recommend_anime
+from title_index import TitleIndex
 
 console = Console()
 
@@ -40,12 +40,50 @@ def display_dataframe(df, title="Aperçu des données"):
         
     console.print(table)
 
+def install_completer(title_index: TitleIndex) -> None:
+    """Active la complétion des titres (touche Tab) dans la saisie des favoris."""
+    try:
+        import readline
+    except ImportError:
+        return
+
+    matches = []
+
+    def complete(text, state):
+        if state == 0:
+            # Seul le titre en cours de saisie (après la dernière virgule) est complété
+            buffer = readline.get_line_buffer()
+            head, _, current = buffer.rpartition(',')
+            prefix = f"{head}, " if head else ""
+            matches[:] = [f"{prefix}{title}" for title, _ in title_index.search(current.strip(), limit=10)]
+        return matches[state] if state < len(matches) else None
+
+    readline.set_completer_delims('')
+    readline.set_completer(complete)
+    readline.parse_and_bind('tab: complete')
+
+
+def ask_in_range(prompt, text: str, default, minimum, maximum=None):
+    """Pose la question jusqu'à obtenir une valeur comprise entre les bornes."""
+    while True:
+        value = prompt.ask(text, default=default)
+        if value >= minimum and (maximum is None or value <= maximum):
+            return value
+        bounds = f"entre {minimum} et {maximum}" if maximum is not None else f"au moins {minimum}"
+        console.print(f"[bold red]La valeur doit être {bounds}.[/bold red]")
+
+
 def main() -> None:
     with console.status("[bold green]Chargement et préparation des données...[/bold green]", spinner="dots"):
-        # Chargement et préparation des données
-        df = load_data('Anime.csv')
-        df = preprocess_synopsis(df)
-        _, cosine_sim, indices = vectorize_synopsis(df)
+        # Chargement des données et du modèle persisté (reconstruit s'il est obsolète)
+        df, model = load_or_build('Anime.csv')
+        # Similarité exacte (comme la matrice dense), calculée pour les seuls favoris
+        cosine_sim, indices = model.similarity, model.indices
+        # Les combinaisons de favoris déjà demandées sont servies depuis ce cache
+        cache = RecommendationCache()
+        # Index des titres pour la saisie approximative et la complétion
+        title_index = TitleIndex(df['Title'])
+        install_completer(title_index)
     
     console.print("[bold green]✓ Données chargées avec succès![/bold green]\n")
 
@@ -70,17 +108,46 @@ Ce système de recommandation est basé sur la **similarité du synopsis**.
             display_dataframe(df.head(5))
             
         elif choice == '2':
-            console.print(Panel("Entrez les titres favoris séparés par des virgules\n(exactement comme dans la colonne 'Title')", title="Recommandation", border_style="green"))
+            console.print(Panel("Entrez les titres favoris séparés par des virgules\n(Tab pour compléter ; les fautes de frappe sont tolérées)", title="Recommandation", border_style="green"))
             fav_input = Prompt.ask("[bold yellow]Titres favoris[/bold yellow]")
             
-            favorites = [title.strip() for title in fav_input.split(',') if title.strip()]
+            favorites = []
+            for entry in (title.strip() for title in fav_input.split(',')):
+                if not entry:
+                    continue
+                title = title_index.resolve(entry)
+                if title is None:
+                    suggestions = ', '.join(title for title, _ in title_index.search(entry, limit=3))
+                    console.print(f"[yellow]Titre introuvable : {entry}[/yellow]"
+                                  + (f" (suggestions : {suggestions})" if suggestions else ""))
+                    continue
+                if title != entry:
+                    console.print(f"[dim]{entry} → {title}[/dim]")
+                if title not in favorites:
+                    favorites.append(title)
             
             if not favorites:
-                console.print("[bold red]Aucun favori fourni. Veuillez réessayer.[/bold red]")
+                console.print("[bold red]Aucun favori reconnu. Veuillez réessayer.[/bold red]")
                 continue
                 
+            # Diversification optionnelle : MMR (λ réglable) ou quota par genre
+            diversity = Prompt.ask("[bold yellow]Diversifier les résultats[/bold yellow]",
+                                   choices=["non", *METHODS], default="non")
+            options = {}
+            if diversity == "mmr":
+                options['diversity_lambda'] = ask_in_range(
+                    FloatPrompt, "[bold yellow]Poids de la pertinence (0 : diversité, 1 : classement brut)[/bold yellow]",
+                    default=0.7, minimum=0.0, maximum=1.0)
+            elif diversity == "genre":
+                options['max_per_genre'] = ask_in_range(
+                    IntPrompt, "[bold yellow]Titres au plus par genre[/bold yellow]", default=3, minimum=1)
+
             with console.status("[bold blue]Recherche de recommandations...[/bold blue]", spinner="earth"):
-                top = recommend_anime(favorites, top_n=10, df=df, cosine_sim=cosine_sim, indices=indices)
+                if diversity == "non":
+                    top = cache.recommend(favorites, top_n=10, df=df, cosine_sim=cosine_sim,
+                                          indices=indices, version=model.version)
+                else:
+                    top = recommend_anime(favorites, 10, df, cosine_sim, indices, diversity=diversity, **options)
             
             if top.empty:
                 console.print("[bold red]Aucune recommandation disponible (vérifiez les titres saisis).[/bold red]")
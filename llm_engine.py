@@ -7,97 +7,396 @@ Utilise des embeddings sémantiques (sentence-transformers) et un LLM local
 
 import os
 import json
+import importlib.util
+import queue
+import threading
+import time
 import requests
-from typing import List, Dict, Optional
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Dict, Iterator, Optional, Sequence, Tuple
 import numpy as np
 import pandas as pd
+from requests.adapters import HTTPAdapter
 
-try:
-    from sentence_transformers import SentenceTransformer
-    EMBEDDINGS_AVAILABLE = True
-except ImportError:
-    EMBEDDINGS_AVAILABLE = False
+from batch_encoder import DEFAULT_BATCH_SIZE, DEFAULT_SHARD_SIZE, BatchEncoder, EncodeProgress, clear_checkpoints
+from embedding_cache import EmbeddingCache
+from instrumentation import count, timed
+from response_cache import ResponseCache, make_key
+from quantize import EMBEDDING_PRECISION
+from vector_index import ExactIndex
+
+# sentence-transformers (et donc torch) n'est importé qu'au premier usage
+EMBEDDINGS_AVAILABLE = importlib.util.find_spec("sentence_transformers") is not None
 
 OLLAMA_URL = os.getenv("OLLAMA_URL", "http://localhost:11434")
 DEFAULT_MODEL = os.getenv("LLM_MODEL", "mistral")
+EMBEDDING_MODEL = os.getenv("EMBEDDING_MODEL", "all-mpnet-base-v2")
+OLLAMA_OPTIONS = {"temperature": 0.7, "num_predict": 500}
+# Nombre maximal de requêtes simultanées vers Ollama
+MAX_CONCURRENCY = int(os.getenv("LLM_MAX_CONCURRENCY", "4"))
+
+EXPLAIN_SYSTEM = "Tu es un expert anime. Explique en 2 phrases pourquoi cet anime conviendrait. Français."
+EXPLAIN_FALLBACK = "Basé sur la similarité des thèmes."
+PITCH_SYSTEM = "Génère une accroche de 2 phrases pour donner envie de regarder. Français."
 
 
 class LLMEngine:
     """Moteur LLM pour recommandations intelligentes."""
 
-    def __init__(self, model_name: str = DEFAULT_MODEL):
+    def __init__(self, model_name: str = DEFAULT_MODEL, base_url: str = OLLAMA_URL,
+                 response_cache: Optional[ResponseCache] = None, max_concurrency: int = MAX_CONCURRENCY,
+                 warm_up: bool = False):
         self.model_name = model_name
-        self.embedder = None
-        self._init_embeddings()
+        self.base_url = base_url
+        self.max_concurrency = max_concurrency
+        self._response_cache = response_cache
+        self._response_cache_lock = threading.Lock()
+        self._session = None
+        self._session_lock = threading.Lock()
+        # Latences du premier token (s) des derniers appels en flux
+        self.first_token_latencies = deque(maxlen=1000)
+        self._embedder = None
+        self._embedder_loaded = False
+        self._embedder_lock = threading.Lock()
+        self._warm_up_thread = None
+        self._index = None
+        self._indexed = None
+        # Bilan du dernier encodage par lots (voir `BatchEncoder.stats`)
+        self.last_encode_stats = {}
+        if warm_up:
+            self.warm_up()
+
+    @property
+    def embedder(self):
+        """Modèle d'embeddings, chargé au premier usage (None s'il est indisponible)."""
+        if not self._embedder_loaded:
+            with self._embedder_lock:
+                if not self._embedder_loaded:
+                    self._init_embeddings()
+                    self._embedder_loaded = True
+        return self._embedder
+
+    @embedder.setter
+    def embedder(self, value):
+        self._embedder = value
+        self._embedder_loaded = True
 
     def _init_embeddings(self):
         if EMBEDDINGS_AVAILABLE:
             try:
-                self.embedder = SentenceTransformer('all-mpnet-base-v2')
+                from sentence_transformers import SentenceTransformer
+                self._embedder = SentenceTransformer(EMBEDDING_MODEL)
             except Exception as e:
                 print(f"Embeddings error: {e}")
 
-    def get_embeddings(self, texts: List[str]) -> Optional[np.ndarray]:
+    def warm_up(self, background: bool = True) -> Optional[threading.Thread]:
+        """Charge le modèle d'embeddings à l'avance, dans un thread par défaut.
+
+        Les appels sémantiques faits pendant le chargement attendent sa fin.
+        """
+        if not background:
+            self.embedder
+            return None
+        if self._warm_up_thread is None:
+            self._warm_up_thread = threading.Thread(
+                target=lambda: self.embedder, name="embedder-warm-up", daemon=True
+            )
+            self._warm_up_thread.start()
+        return self._warm_up_thread
+
+    def get_embeddings(self, texts: List[str], batch_size: int = DEFAULT_BATCH_SIZE, workers: int = 1,
+                       checkpoint_dir: Optional[str] = None, shard_size: int = DEFAULT_SHARD_SIZE,
+                       show_progress: bool = True) -> Optional[np.ndarray]:
+        """Encode des textes par lots triés par longueur (voir `batch_encoder`).
+
+        Avec `checkpoint_dir`, les fragments déjà encodés sont sauvegardés et
+        un encodage interrompu reprend là où il s'était arrêté.
+        """
         if self.embedder is None:
             return None
-        return self.embedder.encode(texts, show_progress_bar=True)
+        encoder = BatchEncoder(
+            self.embedder, EMBEDDING_MODEL, batch_size=batch_size, workers=workers,
+            checkpoint_dir=checkpoint_dir, shard_size=shard_size,
+            progress=EncodeProgress() if show_progress else None,
+        )
+        embeddings = encoder.encode(texts)
+        self.last_encode_stats = encoder.stats
+        return embeddings
+
+    def _get_index(self, embeddings):
+        """Index exact construit une seule fois (embeddings pré-normalisés)."""
+        if self._index is None or self._indexed is not embeddings:
+            self._index = ExactIndex(embeddings, precision=EMBEDDING_PRECISION)
+            self._indexed = embeddings
+        return self._index
 
-    def semantic_search(self, query: str, df: pd.DataFrame, embeddings: np.ndarray, top_k: int = 10) -> pd.DataFrame:
-        """Recherche sémantique - requêtes naturelles comme 'anime sombre avec robots'."""
+    @timed('semantic_search')
+    def semantic_search(self, query: str, df: pd.DataFrame, embeddings: np.ndarray, top_k: int = 10,
+                        index=None) -> pd.DataFrame:
+        """Recherche sémantique - requêtes naturelles comme 'anime sombre avec robots'.
+
+        `index` peut être un index de `vector_index` (exact ou approché) ;
+        par défaut un index exact est construit sur `embeddings`.
+        """
+        if index is None:
+            index = self._get_index(embeddings)
         query_embedding = self.embedder.encode([query])[0]
-        similarities = np.dot(embeddings, query_embedding) / (
-            np.linalg.norm(embeddings, axis=1) * np.linalg.norm(query_embedding)
-        )
-        top_indices = np.argsort(similarities)[-top_k:][::-1]
+        top_indices, scores = index.search(query_embedding, top_k)
         results = df.iloc[top_indices].copy()
-        results['similarity_score'] = similarities[top_indices]
+        results['similarity_score'] = scores
         return results
 
+    @property
+    def response_cache(self) -> ResponseCache:
+        """Cache persistant des réponses du LLM (créé au premier usage)."""
+        # Premier accès possible depuis les threads de `explain_recommendations`
+        if self._response_cache is None:
+            with self._response_cache_lock:
+                if self._response_cache is None:
+                    self._response_cache = ResponseCache()
+        return self._response_cache
+
+    @property
+    def session(self) -> requests.Session:
+        """Session HTTP keep-alive partagée, dimensionnée pour `max_concurrency`."""
+        with self._session_lock:
+            if self._session is None:
+                session = requests.Session()
+                adapter = HTTPAdapter(pool_connections=1, pool_maxsize=self.max_concurrency)
+                session.mount("http://", adapter)
+                session.mount("https://", adapter)
+                self._session = session
+        return self._session
+
+    @timed('call_ollama')
     def _call_ollama(self, prompt: str, system: str = None) -> Optional[str]:
+        key = make_key(self.model_name, system, prompt, OLLAMA_OPTIONS)
+        cached = self.response_cache.get(key)
+        if cached is not None:
+            count('llm_cache_hits')
+            return cached
+        count('llm_calls')
         try:
             payload = {
                 "model": self.model_name,
                 "prompt": prompt,
                 "stream": False,
-                "options": {"temperature": 0.7, "num_predict": 500}
+                "options": OLLAMA_OPTIONS
             }
             if system:
                 payload["system"] = system
-            response = requests.post(f"{OLLAMA_URL}/api/generate", json=payload, timeout=60)
+            response = self.session.post(f"{self.base_url}/api/generate", json=payload, timeout=60)
             response.raise_for_status()
-            return response.json().get("response", "")
-        except:
+            text = response.json().get("response", "")
+        except requests.Timeout:
+            count('llm_timeouts')
+            return None
+        except (requests.RequestException, ValueError):
+            count('llm_errors')
             return None
+        if text:
+            self.response_cache.set(key, text)
+        return text
+
+    def _stream_ollama(self, prompt: str, system: str = None) -> Iterator[str]:
+        """Appelle Ollama en mode flux et renvoie les tokens au fil de l'eau.
+
+        La latence du premier token est ajoutée à `first_token_latencies`.
+        La réponse complète est mise en cache ; une réponse déjà en cache est
+        renvoyée en un seul morceau.
+        """
+        start = time.perf_counter()
+        key = make_key(self.model_name, system, prompt, OLLAMA_OPTIONS)
+        cached = self.response_cache.get(key)
+        if cached is not None:
+            count('llm_cache_hits')
+            self.first_token_latencies.append(time.perf_counter() - start)
+            yield cached
+            return
+        count('llm_calls')
+
+        payload = {
+            "model": self.model_name,
+            "prompt": prompt,
+            "stream": True,
+            "options": OLLAMA_OPTIONS
+        }
+        if system:
+            payload["system"] = system
+        tokens = []
+        try:
+            with self.session.post(f"{self.base_url}/api/generate", json=payload, timeout=60, stream=True) as response:
+                response.raise_for_status()
+                for line in response.iter_lines():
+                    if not line:
+                        continue
+                    message = json.loads(line)
+                    token = message.get("response", "")
+                    if token:
+                        if not tokens:
+                            self.first_token_latencies.append(time.perf_counter() - start)
+                        tokens.append(token)
+                        yield token
+                    if message.get("done"):
+                        break
+        except requests.Timeout:
+            count('llm_timeouts')
+            return
+        except (requests.RequestException, ValueError):
+            count('llm_errors')
+            return
+        if tokens:
+            self.response_cache.set(key, "".join(tokens))
+
+    def _stream_with_fallback(self, prompt: str, system: str, fallback: str) -> Iterator[str]:
+        produced = False
+        for token in self._stream_ollama(prompt, system):
+            produced = True
+            yield token
+        if not produced:
+            count('llm_fallbacks')
+            yield fallback
+
+    @property
+    def last_first_token_latency(self) -> Optional[float]:
+        """Latence du premier token du dernier appel en flux, en secondes."""
+        return self.first_token_latencies[-1] if self.first_token_latencies else None
+
+    @staticmethod
+    def _explain_prompt(anime_title: str, anime_synopsis: str, favorites: List[str]) -> str:
+        return f"Favoris: {', '.join(favorites[:3])}\nRecommandé: {anime_title}\nSynopsis: {anime_synopsis[:300]}"
 
     def explain_recommendation(self, anime_title: str, anime_synopsis: str, favorites: List[str]) -> str:
         """Génère une explication de pourquoi cet anime est recommandé."""
-        system = "Tu es un expert anime. Explique en 2 phrases pourquoi cet anime conviendrait. Français."
-        prompt = f"Favoris: {', '.join(favorites[:3])}\nRecommandé: {anime_title}\nSynopsis: {anime_synopsis[:300]}"
-        return self._call_ollama(prompt, system) or "Basé sur la similarité des thèmes."
+        prompt = self._explain_prompt(anime_title, anime_synopsis, favorites)
+        explanation = self._call_ollama(prompt, EXPLAIN_SYSTEM)
+        if not explanation:
+            count('llm_fallbacks')
+            return EXPLAIN_FALLBACK
+        return explanation
+
+    def explain_recommendations(self, items: Sequence[Tuple[str, str]], favorites: List[str]) -> List[str]:
+        """Génère les explications de plusieurs recommandations en parallèle.
+
+        Les appels passent par la session partagée, avec au plus
+        `max_concurrency` requêtes simultanées ; les réponses déjà en cache
+        sont servies sans appeler le LLM.
+
+        Parameters
+        ----------
+        items : Sequence[Tuple[str, str]]
+            Couples (titre, synopsis) des anime recommandés.
+        favorites : List[str]
+            Titres favoris de l'utilisateur.
+
+        Returns
+        -------
+        List[str]
+            Les explications, dans l'ordre de `items`.
+        """
+        if not items:
+            return []
+        with ThreadPoolExecutor(max_workers=min(self.max_concurrency, len(items))) as pool:
+            return list(pool.map(
+                lambda item: self.explain_recommendation(item[0], item[1], favorites), items
+            ))
+
+    def explain_recommendation_stream(self, anime_title: str, anime_synopsis: str,
+                                      favorites: List[str]) -> Iterator[str]:
+        """Variante en flux de `explain_recommendation` : renvoie les tokens au fil de l'eau."""
+        prompt = self._explain_prompt(anime_title, anime_synopsis, favorites)
+        return self._stream_with_fallback(prompt, EXPLAIN_SYSTEM, EXPLAIN_FALLBACK)
+
+    def explain_recommendations_stream(self, items: Sequence[Tuple[str, str]],
+                                       favorites: List[str]) -> Iterator[Tuple[int, str]]:
+        """Variante en flux de `explain_recommendations` : toutes les explications en parallèle.
+
+        Chaque explication est lue dans un thread du pool (au plus
+        `max_concurrency` à la fois) ; les tokens sont renvoyés au fil de leur
+        arrivée sous la forme (position dans `items`, token), si bien que
+        l'appelant peut mettre à jour chaque carte depuis son propre thread.
+        """
+        if not items:
+            return
+        tokens = queue.Queue()
+        done = object()
+
+        def pump(position: int, item: Tuple[str, str]) -> None:
+            try:
+                for token in self.explain_recommendation_stream(item[0], item[1], favorites):
+                    tokens.put((position, token))
+            finally:
+                tokens.put((position, done))
+
+        with ThreadPoolExecutor(max_workers=min(self.max_concurrency, len(items))) as pool:
+            futures = [pool.submit(pump, position, item) for position, item in enumerate(items)]
+            remaining = len(items)
+            while remaining:
+                position, token = tokens.get()
+                if token is done:
+                    remaining -= 1
+                else:
+                    yield position, token
+            for future in futures:
+                future.result()
+
+    @staticmethod
+    def _pitch_prompt(anime_data: Dict) -> str:
+        return f"Anime: {anime_data.get('Title')}\nGenre: {anime_data.get('Genre')}\nSynopsis: {anime_data.get('Synopsis', '')[:300]}"
 
     def generate_pitch(self, anime_data: Dict) -> str:
         """Génère un pitch accrocheur pour un anime."""
-        system = "Génère une accroche de 2 phrases pour donner envie de regarder. Français."
-        prompt = f"Anime: {anime_data.get('Title')}\nGenre: {anime_data.get('Genre')}\nSynopsis: {anime_data.get('Synopsis', '')[:300]}"
-        return self._call_ollama(prompt, system) or anime_data.get('Synopsis', '')[:150]
+        pitch = self._call_ollama(self._pitch_prompt(anime_data), PITCH_SYSTEM)
+        if not pitch:
+            count('llm_fallbacks')
+            return anime_data.get('Synopsis', '')[:150]
+        return pitch
 
+    def generate_pitch_stream(self, anime_data: Dict) -> Iterator[str]:
+        """Variante en flux de `generate_pitch` : renvoie les tokens au fil de l'eau."""
+        fallback = anime_data.get('Synopsis', '')[:150]
+        return self._stream_with_fallback(self._pitch_prompt(anime_data), PITCH_SYSTEM, fallback)
 
-def create_embeddings_cache(df: pd.DataFrame, cache_path: str = "embeddings_cache.npy"):
-    """Crée et sauvegarde les embeddings pour tout le dataset."""
-    engine = LLMEngine()
+
+def create_embeddings_cache(df: pd.DataFrame, cache_path: str = "embeddings_cache.npy",
+                            engine: Optional[LLMEngine] = None, dtype: str = 'float32',
+                            batch_size: int = DEFAULT_BATCH_SIZE, workers: int = 1,
+                            shard_size: int = DEFAULT_SHARD_SIZE):
+    """Crée ou rafraîchit le cache d'embeddings du dataset.
+
+    Seuls les synopsis nouveaux ou modifiés depuis le dernier appel sont
+    encodés (voir `embedding_cache.EmbeddingCache`). Les fragments encodés
+    sont sauvegardés dans `<cache>.shards/` jusqu'à l'écriture du cache :
+    un encodage interrompu reprend au dernier fragment terminé.
+    """
+    engine = engine or LLMEngine()
     if engine.embedder is None:
         print("Sentence-transformers non disponible")
         return None
-    
+
     synopses = df['Synopsis'].fillna('').tolist()
-    embeddings = engine.get_embeddings(synopses)
-    np.save(cache_path, embeddings)
+    cache = EmbeddingCache(cache_path, EMBEDDING_MODEL, dtype=dtype)
+    checkpoint_dir = f"{os.path.splitext(cache_path)[0]}.shards"
+    embeddings = cache.update(synopses, lambda texts: engine.get_embeddings(
+        texts, batch_size=batch_size, workers=workers, checkpoint_dir=checkpoint_dir, shard_size=shard_size,
+    ))
+    if embeddings is not None:
+        clear_checkpoints(checkpoint_dir)
     print(f"Embeddings sauvegardés: {cache_path}")
     return embeddings
 
 
-def load_embeddings_cache(cache_path: str = "embeddings_cache.npy") -> Optional[np.ndarray]:
-    """Charge les embeddings depuis le cache."""
+def load_embeddings_cache(cache_path: str = "embeddings_cache.npy",
+                          df: Optional[pd.DataFrame] = None) -> Optional[np.ndarray]:
+    """Charge les embeddings depuis le cache (en mémoire partagée).
+
+    Si `df` est fourni, renvoie None lorsque le cache ne correspond plus
+    exactement à ses synopsis (ordre, titres ajoutés, synopsis modifiés).
+    """
+    if df is not None:
+        synopses = df['Synopsis'].fillna('').tolist()
+        return EmbeddingCache(cache_path, EMBEDDING_MODEL).load(synopses)
     if os.path.exists(cache_path):
-        return np.load(cache_path)
+        return np.load(cache_path, mmap_mode='r')
     return None
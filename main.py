@@ -7,9 +7,7 @@ de recommandations à partir de favoris. Il peut être exécuté directement
 en ligne de commande.
 """
 
-from data_load import load_data
-from preprocess import preprocess_synopsis
-from vectorize import vectorize_synopsis
+from artifact import load_or_build
 from recommend import recommend_anime
 
 
@@ -17,14 +15,10 @@ def main():
     # Chemin du fichier de données
     filepath = 'Anime.csv'
 
-    # Chargement du jeu de données
-    df = load_data(filepath)
-
-    # Prétraitement de la colonne Synopsis
-    df = preprocess_synopsis(df)
-
-    # Vectorisation et calcul de la similarité
-    _, cosine_sim, indices = vectorize_synopsis(df)
+    # Chargement des données et du modèle persisté (reconstruit s'il est obsolète)
+    df, model = load_or_build(filepath)
+    # Similarité exacte (comme la matrice dense), calculée pour les seuls favoris
+    cosine_sim, indices = model.similarity, model.indices
 
     # Exemple de favoris (à modifier selon les besoins)
     favorites = ['Shingeki no Kyojin', 'Sword Art Online', 'Naruto']
@@ -0,0 +1,102 @@
+"""
+Serveur HTTP factice imitant l'API `/api/generate` d'Ollama.
+
+Il permet de développer et de tester les fonctionnalités LLM sans modèle
+local : la réponse est construite à partir du prompt reçu, après un délai
+configurable, en une fois ou en flux NDJSON (`"stream": true`). Les
+requêtes reçues sont comptées, ce qui permet de vérifier le fonctionnement
+du cache de réponses.
+
+Utilisation :
+
+    python ollama_stub.py --port 11434 --delay 0.5
+    OLLAMA_URL=http://localhost:11434 streamlit run streamlit_app.py
+"""
+
+import argparse
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Optional, Tuple
+
+
+class OllamaStubHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_POST(self):
+        if self.path != '/api/generate':
+            self.send_error(404)
+            return
+        length = int(self.headers.get('Content-Length', 0))
+        payload = json.loads(self.rfile.read(length) or b'{}')
+        with self.server.lock:
+            self.server.requests_received += 1
+        time.sleep(self.server.delay)
+
+        text = f"Réponse factice pour : {payload.get('prompt', '').splitlines()[0] if payload.get('prompt') else ''}"
+        if payload.get('stream', True):
+            self._stream(payload.get('model'), text)
+            return
+        body = json.dumps({'model': payload.get('model'), 'response': text, 'done': True}).encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _stream(self, model: str, text: str) -> None:
+        # Flux NDJSON en transfert fragmenté, un mot par ligne comme Ollama
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/x-ndjson')
+        self.send_header('Transfer-Encoding', 'chunked')
+        self.end_headers()
+        words = text.split(' ')
+        for i, word in enumerate(words):
+            token = word if i == 0 else f' {word}'
+            self._write_chunk({'model': model, 'response': token, 'done': False})
+            time.sleep(self.server.token_delay)
+        self._write_chunk({'model': model, 'response': '', 'done': True})
+        self.wfile.write(b'0\r\n\r\n')
+
+    def _write_chunk(self, message: dict) -> None:
+        data = json.dumps(message).encode('utf-8') + b'\n'
+        self.wfile.write(f'{len(data):x}\r\n'.encode('ascii') + data + b'\r\n')
+        self.wfile.flush()
+
+
+def start_stub(port: int = 0, delay: float = 0.0, token_delay: float = 0.0) -> Tuple[ThreadingHTTPServer, str]:
+    """Démarre le serveur factice dans un thread et renvoie (serveur, URL).
+
+    `delay` simule le temps avant la première réponse, `token_delay` le
+    temps entre deux tokens en mode flux.
+    """
+    server = ThreadingHTTPServer(('127.0.0.1', port), OllamaStubHandler)
+    server.daemon_threads = True
+    server.delay = delay
+    server.token_delay = token_delay
+    server.lock = threading.Lock()
+    server.requests_received = 0
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f'http://127.0.0.1:{server.server_address[1]}'
+
+
+def main(argv: Optional[list] = None) -> None:
+    parser = argparse.ArgumentParser(description="Serveur Ollama factice.")
+    parser.add_argument('--port', type=int, default=11434)
+    parser.add_argument('--delay', type=float, default=0.5, help='Délai simulé par réponse (s)')
+    parser.add_argument('--token-delay', type=float, default=0.05, help='Délai simulé entre deux tokens (s)')
+    args = parser.parse_args(argv)
+    server, url = start_stub(args.port, args.delay, args.token_delay)
+    print(f"Serveur Ollama factice sur {url}")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.shutdown()
+
+
+if __name__ == '__main__':
+    main()
@@ -10,7 +10,10 @@ vectorisation.
 
 import pandas as pd
 
+from instrumentation import timed
 
+
+@timed('preprocess_synopsis')
 def preprocess_synopsis(df: pd.DataFrame) -> pd.DataFrame:
     """Prépare la colonne Synopsis en remplaçant les NaN par des chaînes vides.
 
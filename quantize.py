@@ -0,0 +1,344 @@
+"""
+Représentations quantifiées des embeddings et des scores de similarité.
+
+Le classement n'a pas besoin de toute la précision des float32 (embeddings)
+ni des float64 (`cosine_sim` dense). Sur option, les matrices sont
+stockées ligne par ligne en :
+
+* `'float16'` : demi-précision (mémoire divisée par 2) ;
+* `'int8'` : entiers sur 8 bits avec un facteur d'échelle par ligne
+  (mémoire divisée par 4, par 8 par rapport à float64).
+
+Ces gains portent sur les valeurs. Dans l'index creux des voisins, chaque
+valeur est accompagnée de son numéro de colonne : celui-ci est stocké sur
+16 bits jusqu'à 65 536 titres (32 bits au-delà), si bien que l'index entier
+passe de 8 octets par voisin à 3 (int8) ou 4 (float16), soit un gain de
+2,7× ou 2× (1,6× ou 1,3× au-delà de 65 536 titres).
+
+Les scores sont calculés directement sur la forme compacte : seules les
+lignes utiles (favoris, candidats) ou un bloc de lignes à la fois sont
+reconvertis en float32, jamais la matrice entière.
+
+* `QuantizedMatrix` : matrice dense (embeddings, `cosine_sim` dense),
+  utilisée par `vector_index` et `recommend` ;
+* `QuantizedSparse` : index creux des voisins (`artifact.ModelArtifact`).
+
+La précision est choisie par programme ou par les variables
+d'environnement `EMBEDDING_PRECISION` et `SCORE_PRECISION`.
+`overlap_at_k` et la ligne de commande mesurent l'accord des classements
+avec la pleine précision avant d'adopter une option :
+
+    python quantize.py --csv Anime.csv --precision int8 -k 10
+"""
+
+import argparse
+import os
+from typing import Optional, Sequence, Tuple, Union
+
+import numpy as np
+from scipy import sparse
+
+PRECISIONS = ('float32', 'float16', 'int8')
+
+EMBEDDING_PRECISION = os.getenv("EMBEDDING_PRECISION", "float32")
+SCORE_PRECISION = os.getenv("SCORE_PRECISION", "float32")
+
+# Lignes reconverties en float32 à la fois lors d'un produit matriciel
+BLOCK_SIZE = 8192
+
+INT8_MAX = 127
+
+
+def _check_precision(precision: str) -> None:
+    if precision not in PRECISIONS:
+        raise ValueError(f"Précision inconnue : {precision} (attendu : {', '.join(PRECISIONS)})")
+
+
+def _narrow_indices(indices: np.ndarray, n_cols: int) -> np.ndarray:
+    """Numéros de colonne CSR dans le plus petit entier non signé qui les contient."""
+    for dtype in (np.uint16, np.uint32):
+        if n_cols - 1 <= np.iinfo(dtype).max:
+            return indices.astype(dtype)
+    return indices
+
+
+def _int8_codes(values: np.ndarray, scale: np.ndarray) -> np.ndarray:
+    """Code des valeurs en int8 ; `scale` est l'échelle de la ligne de chaque valeur."""
+    codes = np.rint(values / np.where(scale > 0, scale, 1.0))
+    return np.clip(codes, -INT8_MAX, INT8_MAX).astype(np.int8)
+
+
+class QuantizedMatrix:
+    """Matrice dense quantifiée ligne par ligne.
+
+    Parameters
+    ----------
+    codes : numpy.ndarray
+        Matrice N×D en float16 ou int8.
+    scale : numpy.ndarray, optional
+        Facteur d'échelle de chaque ligne (int8 uniquement).
+    """
+
+    def __init__(self, codes: np.ndarray, scale: Optional[np.ndarray] = None):
+        self.codes = codes
+        self.scale = scale
+        self.precision = 'int8' if scale is not None else 'float16'
+
+    @classmethod
+    def from_dense(cls, matrix: np.ndarray, precision: str = 'int8', normalize: bool = False,
+                   ignore_diagonal: bool = False) -> 'QuantizedMatrix':
+        """Quantifie une matrice dense, bloc de lignes par bloc de lignes.
+
+        Avec `normalize`, chaque ligne est d'abord normalisée en norme L2
+        (embeddings), sans copie float32 de la matrice entière. Avec
+        `ignore_diagonal`, l'échelle int8 d'une ligne ignore la diagonale
+        (similarité d'un titre avec lui-même, jamais recommandé) : elle est
+        écrêtée, et la précision reste pour les autres scores.
+        """
+        _check_precision(precision)
+        if precision == 'float32':
+            raise ValueError("Une matrice float32 n'a pas besoin d'être quantifiée")
+        codes = np.empty(matrix.shape, dtype=np.int8 if precision == 'int8' else np.float16)
+        scale = np.empty(len(matrix), dtype=np.float32) if precision == 'int8' else None
+        for start in range(0, len(matrix), BLOCK_SIZE):
+            block = np.asarray(matrix[start:start + BLOCK_SIZE], dtype=np.float32)
+            if normalize:
+                norms = np.linalg.norm(block, axis=1, keepdims=True)
+                block = block / np.where(norms > 0, norms, 1.0)
+            if precision == 'int8':
+                magnitude = np.abs(block)
+                if ignore_diagonal:
+                    rows = np.arange(len(block))
+                    magnitude[rows, start + rows] = 0.0
+                block_scale = magnitude.max(axis=1, initial=0.0) / INT8_MAX
+                codes[start:start + len(block)] = _int8_codes(block, block_scale[:, None])
+                scale[start:start + len(block)] = block_scale
+            else:
+                codes[start:start + len(block)] = block
+        return cls(codes, scale)
+
+    def __len__(self) -> int:
+        return len(self.codes)
+
+    @property
+    def shape(self) -> Tuple[int, ...]:
+        return self.codes.shape
+
+    @property
+    def dtype(self) -> np.dtype:
+        return np.dtype(np.float32)
+
+    @property
+    def nbytes(self) -> int:
+        return self.codes.nbytes + (self.scale.nbytes if self.scale is not None else 0)
+
+    def __getitem__(self, rows) -> np.ndarray:
+        """Lignes demandées, reconverties en float32."""
+        block = self.codes[rows].astype(np.float32)
+        if self.scale is not None:
+            block *= self.scale[rows][..., None]
+        return block
+
+    def block(self, rows: np.ndarray, cols: np.ndarray) -> np.ndarray:
+        """Sous-matrice `rows` × `cols`, en float32, sans reconvertir les lignes entières."""
+        block = self.codes[np.ix_(rows, cols)].astype(np.float32)
+        if self.scale is not None:
+            block *= self.scale[rows][:, None]
+        return block
+
+    def __matmul__(self, other: np.ndarray) -> np.ndarray:
+        """Produit avec un vecteur (D,) ou une matrice (D, Q), bloc par bloc."""
+        other = np.asarray(other, dtype=np.float32)
+        result = np.empty((len(self.codes),) + other.shape[1:], dtype=np.float32)
+        for start in range(0, len(self.codes), BLOCK_SIZE):
+            result[start:start + BLOCK_SIZE] = self[start:start + BLOCK_SIZE] @ other
+        return result
+
+    def sum_rows(self, positions: np.ndarray) -> np.ndarray:
+        """Somme des lignes `positions` (vecteur de longueur N)."""
+        return self[np.asarray(positions, dtype=np.int64)].sum(axis=0, dtype=np.float64)
+
+    def dequantize(self) -> np.ndarray:
+        return self[:]
+
+
+class QuantizedSparse:
+    """Matrice creuse CSR dont les valeurs sont quantifiées ligne par ligne.
+
+    Parameters
+    ----------
+    data : numpy.ndarray
+        Valeurs non nulles en float16 ou int8.
+    indices, indptr : numpy.ndarray
+        Structure CSR ; `from_csr` réduit `indices` à 16 ou 32 bits.
+    shape : tuple
+        Dimensions de la matrice.
+    scale : numpy.ndarray, optional
+        Facteur d'échelle de chaque ligne (int8 uniquement).
+    """
+
+    def __init__(self, data: np.ndarray, indices: np.ndarray, indptr: np.ndarray, shape: Tuple[int, int],
+                 scale: Optional[np.ndarray] = None):
+        self.data = data
+        self.indices = indices
+        self.indptr = indptr
+        self.shape = tuple(shape)
+        self.scale = scale
+        self.precision = 'int8' if scale is not None else 'float16'
+
+    @classmethod
+    def from_csr(cls, matrix: sparse.spmatrix, precision: str = 'int8') -> 'QuantizedSparse':
+        _check_precision(precision)
+        if precision == 'float32':
+            raise ValueError("Une matrice float32 n'a pas besoin d'être quantifiée")
+        matrix = sparse.csr_matrix(matrix)
+        data = np.asarray(matrix.data, dtype=np.float32)
+        indices = _narrow_indices(matrix.indices, matrix.shape[1])
+        if precision == 'float16':
+            return cls(data.astype(np.float16), indices, matrix.indptr, matrix.shape)
+        lengths = np.diff(matrix.indptr)
+        row_max = np.zeros(matrix.shape[0], dtype=np.float32)
+        filled = lengths > 0
+        if data.size:
+            row_max[filled] = np.maximum.reduceat(np.abs(data), matrix.indptr[:-1][filled])
+        scale = row_max / INT8_MAX
+        codes = _int8_codes(data, np.repeat(scale, lengths))
+        return cls(codes, indices, matrix.indptr, matrix.shape, scale=scale)
+
+    @property
+    def dtype(self) -> np.dtype:
+        return np.dtype(np.float32)
+
+    @property
+    def nnz(self) -> int:
+        return len(self.data)
+
+    @property
+    def nbytes(self) -> int:
+        total = self.data.nbytes + self.indices.nbytes + self.indptr.nbytes
+        return total + (self.scale.nbytes if self.scale is not None else 0)
+
+    def __getitem__(self, rows) -> sparse.csr_matrix:
+        """Lignes demandées (tableau de positions), en CSR float32."""
+        rows = np.atleast_1d(np.asarray(rows, dtype=np.int64))
+        starts, stops = self.indptr[rows], self.indptr[rows + 1]
+        lengths = stops - starts
+        indptr = np.zeros(len(rows) + 1, dtype=np.int64)
+        np.cumsum(lengths, out=indptr[1:])
+        # Positions des valeurs des lignes demandées dans `data`
+        gather = np.repeat(starts - indptr[:-1], lengths) + np.arange(indptr[-1])
+        values = self.data[gather].astype(np.float32)
+        if self.scale is not None:
+            values *= np.repeat(self.scale[rows], lengths)
+        indices = self.indices[gather].astype(np.int64)
+        return sparse.csr_matrix((values, indices, indptr), shape=(len(rows), self.shape[1]))
+
+    def sum_rows(self, positions: np.ndarray) -> np.ndarray:
+        """Somme des lignes `positions` (vecteur dense de longueur N)."""
+        rows = self[positions]
+        return np.bincount(rows.indices, weights=rows.data, minlength=self.shape[1])
+
+    def dequantize(self) -> sparse.csr_matrix:
+        return self[np.arange(self.shape[0])]
+
+
+QuantizedScores = Union[QuantizedMatrix, QuantizedSparse]
+
+
+def quantize_scores(matrix: Union[np.ndarray, sparse.spmatrix], precision: str = SCORE_PRECISION):
+    """Version compacte d'une matrice de similarité (dense ou index des voisins).
+
+    Renvoie la matrice inchangée pour `'float32'`.
+    """
+    _check_precision(precision)
+    if precision == 'float32':
+        return matrix
+    if sparse.issparse(matrix):
+        return QuantizedSparse.from_csr(matrix, precision)
+    square = matrix.shape[0] == matrix.shape[1]
+    return QuantizedMatrix.from_dense(matrix, precision, ignore_diagonal=square)
+
+
+def overlap_at_k(expected: Sequence[Sequence[int]], found: Sequence[Sequence[int]], k: int) -> float:
+    """Proportion moyenne des k premiers résultats de référence retrouvés.
+
+    Parameters
+    ----------
+    expected : Sequence[Sequence[int]]
+        Classements en pleine précision (un par requête).
+    found : Sequence[Sequence[int]]
+        Classements obtenus sur la représentation compacte.
+    k : int
+        Profondeur comparée.
+
+    Returns
+    -------
+    float
+        Accord moyen, entre 0 et 1.
+    """
+    if not expected:
+        return 1.0
+    total = 0.0
+    for reference, candidate in zip(expected, found):
+        reference = list(reference)[:k]
+        if reference:
+            total += len(set(reference) & set(list(candidate)[:k])) / len(reference)
+        else:
+            total += 1.0
+    return total / len(expected)
+
+
+def recommendation_overlap(full, compact, n_items: int, k: int = 10, n_queries: int = 200,
+                           n_favorites: int = 3, seed: int = 0) -> float:
+    """overlap@k des recommandations par favoris, pleine précision contre compacte."""
+    from recommend import top_n_indices
+
+    rng = np.random.default_rng(seed)
+    expected, found = [], []
+    for _ in range(n_queries):
+        favorites = rng.choice(n_items, size=min(n_favorites, n_items), replace=False)
+        reference = np.asarray(full[favorites].sum(axis=0), dtype=np.float64).ravel()
+        expected.append(top_n_indices(reference, favorites, k))
+        found.append(top_n_indices(compact.sum_rows(favorites), favorites, k))
+    return overlap_at_k(expected, found, k)
+
+
+def main(argv: Optional[Sequence[str]] = None) -> None:
+    from artifact import load_or_build
+
+    parser = argparse.ArgumentParser(description="Accord des classements quantifiés avec la pleine précision.")
+    parser.add_argument('--csv', default='Anime.csv', help='Catalogue')
+    parser.add_argument('--embeddings', default='embeddings_cache.npy', help="Cache d'embeddings (optionnel)")
+    parser.add_argument('--precision', nargs='+', choices=PRECISIONS[1:], default=list(PRECISIONS[1:]),
+                        help="Précisions comparées ; l'index des voisins (valeurs et colonnes) est réduit "
+                             "d'environ 2,7× en int8 et 2× en float16 jusqu'à 65 536 titres")
+    parser.add_argument('--queries', type=int, default=200, help='Nombre de requêtes tirées au hasard')
+    parser.add_argument('-k', type=int, default=10, help='Profondeur du classement comparé')
+    args = parser.parse_args(argv)
+
+    _, model = load_or_build(args.csv, score_precision='float32')
+    neighbors = model.neighbors
+    full_bytes = neighbors.data.nbytes + neighbors.indices.nbytes + neighbors.indptr.nbytes
+    print(f"Voisins (float32) : {full_bytes / 2 ** 20:.1f} Mo")
+    for precision in args.precision:
+        compact = quantize_scores(neighbors, precision)
+        overlap = recommendation_overlap(neighbors, compact, neighbors.shape[0], args.k, args.queries)
+        print(f"Voisins ({precision:>7}) : {compact.nbytes / 2 ** 20:.1f} Mo, overlap@{args.k} = {overlap:.3f}")
+
+    if args.embeddings and os.path.exists(args.embeddings):
+        from vector_index import ExactIndex, recall_at_k
+
+        embeddings = np.load(args.embeddings, mmap_mode='r')
+        reference = ExactIndex(embeddings)
+        rng = np.random.default_rng(0)
+        queries = np.asarray(embeddings[rng.choice(len(embeddings), min(args.queries, len(embeddings)), replace=False)])
+        print(f"Embeddings (float32) : {reference.vectors.nbytes / 2 ** 20:.1f} Mo")
+        for precision in args.precision:
+            index = ExactIndex(embeddings, precision=precision)
+            overlap = recall_at_k(index, reference, queries, args.k)
+            print(f"Embeddings ({precision:>7}) : {index.vectors.nbytes / 2 ** 20:.1f} Mo, "
+                  f"overlap@{args.k} = {overlap:.3f}")
+
+
+if __name__ == '__main__':
+    main()
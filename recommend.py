@@ -3,20 +3,188 @@ Module de recommandation d'anime basé sur la similarité du synopsis.
 
 Ce module fournit une fonction permettant de recommander des titres
 d'anime similaires à ceux fournis comme favoris. La fonction s'appuie
-sur la matrice de similarité cosinus calculée à l'aide des synopsis.
+sur la matrice de similarité cosinus calculée à l'aide des synopsis, ou
+sur l'index creux des plus proches voisins produit par
+`vectorize.build_neighbors`.
+
+Le calcul est entièrement vectorisé avec NumPy : les lignes des favoris
+sont sommées en une seule réduction, les favoris sont masqués en place et
+les meilleurs scores sont extraits avec `np.argpartition`. Plusieurs listes
+de favoris peuvent être traitées en un seul produit matriciel avec
+`recommend_anime_batch`.
+
+`RecommendationCache` mémorise les résultats des combinaisons de favoris
+les plus fréquentes (cache LRU borné, par version du modèle).
+
+Avec `diversity='mmr'` ou `'genre'`, `recommend_anime` réordonne un groupe
+de candidats plus large que `top_n` pour éviter une liste saturée par une
+seule franchise (voir `diversity`).
 """
 
-from typing import List
+import threading
+from collections import OrderedDict
+from typing import Dict, Hashable, List, Optional, Sequence, Tuple, Union
 import numpy as np
 import pandas as pd
+from scipy import sparse
+
+from diversity import DEFAULT_LAMBDA, DEFAULT_MAX_PER_GENRE, DEFAULT_POOL_FACTOR, diversify, pool_size
+from instrumentation import count, timed
+from quantize import QuantizedMatrix, QuantizedSparse
+from vectorize import TfidfSimilarity
+
+
+def favorite_positions(favorites: Sequence[str], indices: pd.Series) -> np.ndarray:
+    """Convertit une liste de titres en positions dans la matrice de similarité.
+
+    Les titres inconnus sont ignorés ; les doublons sont conservés afin que
+    leur contribution au score soit la même qu'avec une somme ligne à ligne.
+
+    Parameters
+    ----------
+    favorites : Sequence[str]
+        Titres d'anime favoris.
+    indices : pandas.Series
+        Série associant chaque titre à sa position dans la matrice.
+
+    Returns
+    -------
+    numpy.ndarray
+        Positions (entiers) des favoris connus.
+    """
+    known = [fav for fav in favorites if fav in indices]
+    if not known:
+        return np.empty(0, dtype=np.int64)
+    return indices.loc[known].to_numpy(dtype=np.int64)
+
+
+def top_n_indices(scores: np.ndarray, exclude: np.ndarray, top_n: int) -> np.ndarray:
+    """Renvoie les positions des `top_n` meilleurs scores, hors `exclude`.
+
+    Les scores exclus sont masqués en place (mis à -inf). Le départage des
+    égalités suit l'ordre des positions, comme un tri stable décroissant.
+
+    Parameters
+    ----------
+    scores : numpy.ndarray
+        Vecteur de scores (modifié en place).
+    exclude : numpy.ndarray
+        Positions à ne pas recommander (les favoris).
+    top_n : int
+        Nombre de positions à retourner.
+
+    Returns
+    -------
+    numpy.ndarray
+        Positions triées par score décroissant.
+    """
+    scores[exclude] = -np.inf
+    k = min(top_n, len(scores) - len(np.unique(exclude)))
+    if k <= 0:
+        return np.empty(0, dtype=np.int64)
+
+    # Sélection partielle en O(N), puis petit tri des k candidats
+    candidates = np.argpartition(-scores, k - 1)[:k]
+    kth = scores[candidates].min()
+    above = np.flatnonzero(scores > kth)
+    tied = np.flatnonzero(scores == kth)[:k - len(above)]
+    top = np.concatenate([above, tied])
+    return top[np.lexsort((top, -scores[top]))]
+
+
+@timed('score_favorites')
+def score_favorites(
+    favorites_batch: Sequence[Sequence[str]],
+    cosine_sim: Union[np.ndarray, sparse.spmatrix],
+    indices: pd.Series,
+) -> Tuple[np.ndarray, List[np.ndarray]]:
+    """Calcule en un seul produit matriciel les scores de plusieurs listes de favoris.
+
+    Chaque liste est encodée comme une ligne d'une matrice de sélection
+    creuse B×N, multipliée par `cosine_sim`. Pour une matrice quantifiée
+    (voir `quantize`) ou une `vectorize.TfidfSimilarity`, seules les lignes
+    des favoris sont reconverties en float32 ou calculées, puis sommées par
+    le même produit.
+
+    Parameters
+    ----------
+    favorites_batch : Sequence[Sequence[str]]
+        Listes de titres favoris, une par utilisateur.
+    cosine_sim : numpy.ndarray, scipy.sparse.spmatrix or quantize.QuantizedScores
+        Matrice de similarité cosinus (dense) ou index creux des voisins.
+    indices : pandas.Series
+        Série associant chaque titre à sa position dans la matrice.
+
+    Returns
+    -------
+    tuple
+        Un couple (scores, positions) où `scores` est une matrice dense B×N
+        et `positions` la liste des positions des favoris de chaque ligne.
+    """
+    if indices.index.is_unique:
+        # Résolution de tous les titres du paquet en un seul appel
+        flat = [fav for favs in favorites_batch for fav in favs]
+        resolved = indices.index.get_indexer(flat)
+        values = indices.to_numpy(dtype=np.int64)
+        bounds = np.cumsum([0] + [len(favs) for favs in favorites_batch])
+        positions = [
+            values[found[found >= 0]]
+            for found in (resolved[lo:hi] for lo, hi in zip(bounds[:-1], bounds[1:]))
+        ]
+    else:
+        positions = [favorite_positions(favs, indices) for favs in favorites_batch]
+    n_items = cosine_sim.shape[0]
+    indptr = np.zeros(len(positions) + 1, dtype=np.int64)
+    indptr[1:] = np.cumsum([len(p) for p in positions])
+    cols = np.concatenate(positions) if positions else np.empty(0, dtype=np.int64)
+    if isinstance(cosine_sim, (QuantizedMatrix, QuantizedSparse, TfidfSimilarity)):
+        # Lignes des favoris seulement, puis somme par liste
+        selector = sparse.csr_matrix(
+            (np.ones(len(cols), dtype=np.float32), np.arange(len(cols)), indptr),
+            shape=(len(positions), len(cols)),
+        )
+        scores = selector @ cosine_sim[cols]
+    else:
+        selector = sparse.csr_matrix(
+            (np.ones(len(cols), dtype=cosine_sim.dtype), cols, indptr),
+            shape=(len(positions), n_items),
+        )
+        scores = selector @ cosine_sim
+    if sparse.issparse(scores):
+        scores = scores.toarray()
+    return np.asarray(scores, dtype=np.float64), positions
 
 
+def _build_result(
+    df: pd.DataFrame,
+    top_indices: np.ndarray,
+    top_scores: np.ndarray,
+    with_scores: bool,
+) -> pd.DataFrame:
+    result = df.iloc[top_indices][['Title', 'Synopsis']]
+    if with_scores:
+        result = result.copy()
+        result['score'] = top_scores
+    return result
+
+
+def _empty_result(with_scores: bool) -> pd.DataFrame:
+    columns = ['Title', 'Synopsis', 'score'] if with_scores else ['Title', 'Synopsis']
+    return pd.DataFrame(columns=columns)
+
+
+@timed('recommend_anime')
 def recommend_anime(
     favorites: List[str],
     top_n: int,
     df: pd.DataFrame,
-    cosine_sim: np.ndarray,
+    cosine_sim: Union[np.ndarray, sparse.spmatrix],
     indices: pd.Series,
+    with_scores: bool = False,
+    diversity: Optional[str] = None,
+    diversity_lambda: float = DEFAULT_LAMBDA,
+    max_per_genre: int = DEFAULT_MAX_PER_GENRE,
+    pool_factor: int = DEFAULT_POOL_FACTOR,
 ) -> pd.DataFrame:
     """Recommande des anime en se basant sur la similarité du synopsis.
 
@@ -28,40 +196,194 @@ def recommend_anime(
         Nombre de recommandations à retourner.
     df : pandas.DataFrame
         DataFrame complet contenant au moins les colonnes `Title` et `Synopsis`.
-    cosine_sim : numpy.ndarray
-        Matrice de similarité cosinus entre les synopsis.
+    cosine_sim : numpy.ndarray or scipy.sparse.spmatrix
+        Matrice de similarité cosinus entre les synopsis, dense ou creuse
+        (index des K plus proches voisins), éventuellement quantifiée
+        (voir `quantize.quantize_scores`).
     indices : pandas.Series
         Série associant chaque titre d'anime à l'indice correspondant dans
         la matrice `cosine_sim`.
+    with_scores : bool
+        Si vrai, ajoute une colonne `score` contenant le score cumulé (même
+        nom que dans `hybrid.HybridRanker.rank` et les réponses de `service`).
+    diversity : str, optional
+        `'mmr'` ou `'genre'` pour diversifier la liste (voir
+        `diversity.diversify`) ; par défaut, classement brut.
+    diversity_lambda : float
+        Poids de la pertinence face à la diversité (MMR), entre 0 et 1.
+    max_per_genre : int
+        Titres au plus par genre (quota, colonne `Genre`).
+    pool_factor : int
+        Taille du groupe de candidats réordonné, en multiple de `top_n`.
 
     Returns
     -------
     pandas.DataFrame
-        DataFrame des recommandations avec les colonnes `Title` et `Synopsis`.
+        DataFrame des recommandations avec les colonnes `Title` et `Synopsis`
+        (et `score` si demandé).
     """
     if not favorites:
-        return pd.DataFrame(columns=['Title', 'Synopsis'])
+        return _empty_result(with_scores)
+
+    if diversity is None:
+        top_indices, top_scores = _recommend_positions(favorites, top_n, cosine_sim, indices, len(df))
+    else:
+        pool_indices, pool_scores = _recommend_positions(
+            favorites, pool_size(top_n, pool_factor), cosine_sim, indices, len(df)
+        )
+        genres = df['Genre'].to_numpy() if diversity == 'genre' else None
+        top_indices, top_scores = diversify(
+            pool_indices, pool_scores, top_n, method=diversity, cosine_sim=cosine_sim, genres=genres,
+            diversity_lambda=diversity_lambda, max_per_genre=max_per_genre,
+        )
+
+    # Construction du DataFrame de résultats
+    return _build_result(df, top_indices, top_scores, with_scores)
+
+
+def _recommend_positions(
+    favorites: Sequence[str],
+    top_n: int,
+    cosine_sim: Union[np.ndarray, sparse.spmatrix],
+    indices: pd.Series,
+    n_items: int,
+) -> Tuple[np.ndarray, np.ndarray]:
+    # Sommation des similarités des favoris connus en une seule réduction
+    fav_indices = favorite_positions(favorites, indices)
+    if len(fav_indices):
+        sim_scores = np.asarray(cosine_sim[fav_indices].sum(axis=0), dtype=np.float64).ravel()
+    else:
+        sim_scores = np.zeros(n_items)
+
+    # Les favoris sont masqués pour ne pas être recommandés à nouveau
+    top_indices = top_n_indices(sim_scores, fav_indices, top_n)
+    return top_indices, sim_scores[top_indices]
+
+
+def recommend_anime_batch(
+    favorites_batch: Sequence[List[str]],
+    top_n: int,
+    df: pd.DataFrame,
+    cosine_sim: Union[np.ndarray, sparse.spmatrix],
+    indices: pd.Series,
+    with_scores: bool = False,
+) -> List[pd.DataFrame]:
+    """Recommande des anime pour plusieurs listes de favoris à la fois.
 
-    # Initialisation d'un tableau de scores à zéro
-    sim_scores = np.zeros(len(df))
+    Les scores de toutes les listes sont calculés en un seul produit
+    matriciel (voir `score_favorites`) ; le résultat de chaque liste est
+    identique à celui de `recommend_anime`.
 
-    # Sommation des similarités pour chaque favori présent
-    for fav in favorites:
-        if fav not in indices:
-            # Si le titre n'est pas connu, on continue sans l'ajouter
+    Parameters
+    ----------
+    favorites_batch : Sequence[List[str]]
+        Listes de titres favoris, une par utilisateur.
+    top_n, df, cosine_sim, indices, with_scores
+        Voir `recommend_anime`.
+
+    Returns
+    -------
+    List[pandas.DataFrame]
+        Un DataFrame de recommandations par liste de favoris.
+    """
+    if not favorites_batch:
+        return []
+
+    scores, positions = score_favorites(favorites_batch, cosine_sim, indices)
+    results = []
+    for favorites, row_scores, fav_indices in zip(favorites_batch, scores, positions):
+        if not favorites:
+            results.append(_empty_result(with_scores))
             continue
-        idx = indices[fav]
-        sim_scores += cosine_sim[idx]
+        top_indices = top_n_indices(row_scores, fav_indices, top_n)
+        results.append(_build_result(df, top_indices, row_scores[top_indices], with_scores))
+    return results
 
-    # On retire de la liste les favoris pour ne pas les recommander à nouveau
-    fav_indices = [indices[f] for f in favorites if f in indices]
-    scores = [(i, score) for i, score in enumerate(sim_scores) if i not in fav_indices]
 
-    # Classement des scores par ordre décroissant
-    scores = sorted(scores, key=lambda x: x[1], reverse=True)
+class RecommendationCache:
+    """Cache LRU des recommandations, indexé par ensemble de favoris normalisé.
 
-    # Sélection des meilleurs indices
-    top_indices = [i for i, _ in scores[:top_n]]
+    La clé est (favoris triés et dédoublonnés, version du modèle) ; pour
+    chaque clé on conserve le plus grand `top_n` calculé, si bien qu'une
+    demande plus petite est servie par troncature du résultat en cache.
+    Changer de version du modèle vide le cache.
 
-    # Construction du DataFrame de résultats
-    return df.iloc[top_indices][['Title', 'Synopsis']]
+    Parameters
+    ----------
+    max_entries : int
+        Nombre maximal de combinaisons de favoris conservées.
+    """
+
+    def __init__(self, max_entries: int = 1024):
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self.version = None
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def normalize(favorites: Sequence[str]) -> Tuple[str, ...]:
+        """Forme canonique d'une liste de favoris : triée, sans doublons."""
+        return tuple(sorted(set(favorites)))
+
+    def invalidate(self, version: Optional[Hashable] = None) -> None:
+        """Vide le cache (à appeler lorsque le modèle est reconstruit)."""
+        with self._lock:
+            self._entries.clear()
+            self.version = version
+
+    def stats(self) -> Dict[str, float]:
+        """Compteurs de succès/échecs et taille du cache."""
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'size': len(self._entries),
+                'hit_rate': self.hits / total if total else 0.0,
+            }
+
+    def recommend(
+        self,
+        favorites: List[str],
+        top_n: int,
+        df: pd.DataFrame,
+        cosine_sim: Union[np.ndarray, sparse.spmatrix],
+        indices: pd.Series,
+        version: Optional[Hashable] = None,
+        with_scores: bool = False,
+    ) -> pd.DataFrame:
+        """Équivalent de `recommend_anime`, servi depuis le cache si possible.
+
+        Les favoris étant dédoublonnés, un titre répété n'est compté qu'une
+        fois. `version` identifie le modèle (par exemple
+        `artifact.ModelArtifact.version`).
+        """
+        key = self.normalize(favorites)
+        if not key:
+            return _empty_result(with_scores)
+
+        with self._lock:
+            if version != self.version:
+                self._entries.clear()
+                self.version = version
+            entry = self._entries.get(key)
+            if entry is not None and (entry[0] >= top_n or len(entry[1]) < entry[0]):
+                # Résultat en cache pour un top_n au moins aussi grand
+                self._entries.move_to_end(key)
+                self.hits += 1
+                count('recommendation_cache_hits')
+                _, top_indices, top_scores = entry
+                return _build_result(df, top_indices[:top_n], top_scores[:top_n], with_scores)
+            self.misses += 1
+            count('recommendation_cache_misses')
+
+        top_indices, top_scores = _recommend_positions(key, top_n, cosine_sim, indices, len(df))
+        with self._lock:
+            if version == self.version:
+                self._entries[key] = (top_n, top_indices, top_scores)
+                self._entries.move_to_end(key)
+                while len(self._entries) > self.max_entries:
+                    self._entries.popitem(last=False)
+        return _build_result(df, top_indices, top_scores, with_scores)
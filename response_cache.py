@@ -0,0 +1,96 @@
+"""
+Cache persistant des réponses du LLM.
+
+Les réponses d'Ollama sont stockées dans une base SQLite, indexées par une
+empreinte de (modèle, prompt système, prompt, options). Chaque entrée a une
+durée de vie (TTL) et le nombre d'entrées est borné : au-delà, les entrées
+les moins récemment utilisées sont supprimées (LRU). Une même paire
+favoris/titre ne sollicite donc le LLM qu'une seule fois.
+"""
+
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from typing import Dict, Optional
+
+DEFAULT_CACHE_PATH = os.getenv("LLM_CACHE_PATH", "llm_cache.sqlite")
+DEFAULT_TTL = 7 * 24 * 3600
+DEFAULT_MAX_ENTRIES = 10000
+
+
+def make_key(model: str, system: Optional[str], prompt: str, options: Dict) -> str:
+    """Empreinte d'une requête au LLM."""
+    payload = json.dumps(
+        {'model': model, 'system': system, 'prompt': prompt, 'options': options},
+        sort_keys=True, ensure_ascii=False,
+    )
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+class ResponseCache:
+    """Cache LRU persistant avec expiration.
+
+    Parameters
+    ----------
+    path : str
+        Fichier SQLite (`':memory:'` pour un cache non persistant).
+    ttl : float
+        Durée de vie d'une entrée, en secondes.
+    max_entries : int
+        Nombre maximal d'entrées conservées.
+    """
+
+    def __init__(self, path: str = DEFAULT_CACHE_PATH, ttl: float = DEFAULT_TTL,
+                 max_entries: int = DEFAULT_MAX_ENTRIES):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS responses ("
+            "key TEXT PRIMARY KEY, response TEXT NOT NULL, created REAL NOT NULL, accessed REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS responses_accessed ON responses (accessed)")
+        self._conn.commit()
+
+    def get(self, key: str) -> Optional[str]:
+        """Renvoie la réponse en cache, ou None si absente ou expirée."""
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute("SELECT response, created FROM responses WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                return None
+            if now - row[1] > self.ttl:
+                self._conn.execute("DELETE FROM responses WHERE key = ?", (key,))
+                self._conn.commit()
+                return None
+            self._conn.execute("UPDATE responses SET accessed = ? WHERE key = ?", (now, key))
+            self._conn.commit()
+            return row[0]
+
+    def set(self, key: str, response: str) -> None:
+        """Enregistre une réponse puis applique la limite de taille (LRU)."""
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO responses (key, response, created, accessed) VALUES (?, ?, ?, ?)",
+                (key, response, now, now),
+            )
+            self._conn.execute(
+                "DELETE FROM responses WHERE key IN ("
+                "SELECT key FROM responses ORDER BY accessed DESC LIMIT -1 OFFSET ?)",
+                (self.max_entries,),
+            )
+            self._conn.commit()
+
+    def clear(self) -> None:
+        with self._lock:
+            self._conn.execute("DELETE FROM responses")
+            self._conn.commit()
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM responses").fetchone()[0]
@@ -0,0 +1,463 @@
+"""
+Service HTTP asynchrone de recommandation.
+
+Une API légère (aiohttp) expose le moteur aux applications :
+
+* `POST /recommend` : `{"favorites": [...], "top_n": 10}` ;
+* `POST /search` : `{"query": "...", "top_k": 10}` (recherche sémantique) ;
+* `POST /explain` : `{"title": "...", "favorites": [...]}` (explication LLM) ;
+* `GET /health` et `GET /metrics` (histogrammes de latence au format texte
+  Prometheus).
+
+Le modèle est chargé une seule fois par processus. Les requêtes
+concurrentes de recommandation et de recherche sont regroupées par un
+`MicroBatcher` pendant une courte fenêtre (quelques millisecondes) puis
+traitées en une seule opération matricielle (`recommend.score_favorites`,
+encodage groupé des requêtes et `search_batch` de l'index vectoriel).
+
+Les favoris sont résolus par `title_index.TitleIndex` : les fautes de
+frappe et les variantes de casse sont tolérées.
+
+Utilisation :
+
+    python service.py --port 8080
+    python service.py --ollama-stub        # LLM factice, sans Ollama
+"""
+
+import argparse
+import asyncio
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, List, Optional, Sequence
+
+import numpy as np
+from aiohttp import web
+
+from artifact import DEFAULT_ARTIFACT_DIR, DEFAULT_TOP_K, load_or_build
+from instrumentation import INSTRUMENTATION, LATENCY_BUCKETS, Histogram
+from quantize import EMBEDDING_PRECISION, PRECISIONS, SCORE_PRECISION
+from recommend import score_favorites, top_n_indices
+from title_index import TitleIndex
+
+# Fenêtre de regroupement des requêtes concurrentes (secondes)
+DEFAULT_BATCH_WINDOW = 0.005
+DEFAULT_MAX_BATCH = 64
+MAX_RESULTS = 100
+
+BATCH_SIZE_BUCKETS = (1, 2, 4, 8, 16, 32, 64, 128, 256)
+
+
+class Metrics:
+    """Métriques du service : latences par route, tailles de lots, statuts HTTP."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.latencies: Dict[str, Histogram] = {}
+        self.batch_sizes: Dict[str, Histogram] = {}
+        self.responses: Dict[tuple, int] = {}
+
+    def observe_request(self, route: str, seconds: float, status: int) -> None:
+        with self._lock:
+            self.latencies.setdefault(route, Histogram(LATENCY_BUCKETS)).observe(seconds)
+            self.responses[(route, status)] = self.responses.get((route, status), 0) + 1
+
+    def observe_batch(self, name: str, size: int) -> None:
+        with self._lock:
+            self.batch_sizes.setdefault(name, Histogram(BATCH_SIZE_BUCKETS)).observe(size)
+
+    def render(self) -> str:
+        """Exposition au format texte Prometheus."""
+        with self._lock:
+            lines = [
+                '# HELP anime_request_duration_seconds Latence des requêtes HTTP.',
+                '# TYPE anime_request_duration_seconds histogram',
+            ]
+            for route, histogram in sorted(self.latencies.items()):
+                lines += histogram.render('anime_request_duration_seconds', f'route="{route}"')
+            lines += [
+                '# HELP anime_batch_size Nombre de requêtes traitées par lot.',
+                '# TYPE anime_batch_size histogram',
+            ]
+            for name, histogram in sorted(self.batch_sizes.items()):
+                lines += histogram.render('anime_batch_size', f'batcher="{name}"')
+            lines += [
+                '# HELP anime_responses_total Réponses HTTP par route et statut.',
+                '# TYPE anime_responses_total counter',
+            ]
+            for (route, status), count in sorted(self.responses.items()):
+                lines.append(f'anime_responses_total{{route="{route}",status="{status}"}} {count}')
+        return '\n'.join(lines) + '\n'
+
+
+class MicroBatcher:
+    """Regroupe les requêtes concurrentes en lots traités d'un seul appel.
+
+    Le premier élément reçu ouvre une fenêtre de `window` secondes ; les
+    éléments arrivés entre-temps (au plus `max_batch`) sont traités
+    ensemble par `process`, exécutée dans un thread pour ne pas bloquer la
+    boucle d'événements. Pendant ce traitement, les requêtes suivantes
+    s'accumulent pour le lot d'après.
+
+    Parameters
+    ----------
+    name : str
+        Nom du lot dans les métriques.
+    process : Callable[[List], List]
+        Fonction synchrone : liste d'éléments -> liste de résultats (même ordre).
+    window : float
+        Durée maximale d'attente d'autres requêtes (secondes).
+    max_batch : int
+        Taille maximale d'un lot.
+    metrics : Metrics, optional
+        Métriques où enregistrer la taille des lots.
+    """
+
+    def __init__(self, name: str, process: Callable[[List], List], window: float = DEFAULT_BATCH_WINDOW,
+                 max_batch: int = DEFAULT_MAX_BATCH, metrics: Optional[Metrics] = None):
+        self.name = name
+        self.process = process
+        self.window = window
+        self.max_batch = max_batch
+        self.metrics = metrics
+        self._queue = None
+        self._task = None
+
+    def start(self) -> None:
+        self._queue = asyncio.Queue()
+        self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def submit(self, item):
+        """Soumet un élément et attend son résultat."""
+        future = asyncio.get_running_loop().create_future()
+        await self._queue.put((item, future))
+        return await future
+
+    async def _collect(self) -> list:
+        loop = asyncio.get_running_loop()
+        batch = [await self._queue.get()]
+        deadline = loop.time() + self.window
+        while len(batch) < self.max_batch:
+            if not self._queue.empty():
+                batch.append(self._queue.get_nowait())
+                continue
+            remaining = deadline - loop.time()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(self._queue.get(), remaining))
+            except asyncio.TimeoutError:
+                break
+        return batch
+
+    async def _run(self) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = await self._collect()
+            # Les requêtes abandonnées par leur client ne sont pas calculées
+            batch = [(item, future) for item, future in batch if not future.done()]
+            if not batch:
+                continue
+            if self.metrics is not None:
+                self.metrics.observe_batch(self.name, len(batch))
+            try:
+                results = await loop.run_in_executor(None, self.process, [item for item, _ in batch])
+            except Exception as exc:
+                for _, future in batch:
+                    if not future.done():
+                        future.set_exception(exc)
+                continue
+            for (_, future), result in zip(batch, results):
+                if not future.done():
+                    future.set_result(result)
+
+
+class RecommendationService:
+    """Moteur partagé par les routes : modèle, index de titres, embeddings et LLM.
+
+    Parameters
+    ----------
+    df : pandas.DataFrame
+        Catalogue prétraité.
+    model : artifact.ModelArtifact
+        Modèle chargé une fois pour le processus.
+    llm : LLMEngine, optional
+        Moteur LLM (explications, encodage des requêtes sémantiques).
+    embeddings : numpy.ndarray, optional
+        Embeddings des synopsis ; sans eux, `/search` répond 503.
+    vector_index : ExactIndex or IVFIndex, optional
+        Index vectoriel sur `embeddings` (exact par défaut).
+    """
+
+    def __init__(self, df, model, llm=None, embeddings: Optional[np.ndarray] = None, vector_index=None):
+        self.df = df
+        self.model = model
+        self.llm = llm
+        self.title_index = TitleIndex(model.titles)
+        if vector_index is None and embeddings is not None:
+            from vector_index import ExactIndex
+            vector_index = ExactIndex(embeddings)
+        self.vector_index = vector_index
+
+    @property
+    def search_available(self) -> bool:
+        if self.vector_index is None or self.llm is None:
+            return False
+        # `llm.embedder` attendrait la fin du chargement en cours et bloquerait
+        # la boucle d'événements : on lit seulement l'état du chargement.
+        if not self.llm._embedder_loaded:
+            self.llm.warm_up()
+            return False
+        return self.llm._embedder is not None
+
+    def recommend_batch(self, requests: List[Dict]) -> List[Dict]:
+        """Recommandations de plusieurs requêtes en un seul produit matriciel."""
+        resolved = [self.title_index.resolve_many(request['favorites']) for request in requests]
+        scores, positions = score_favorites([favorites for favorites, _ in resolved],
+                                            self.model.neighbors, self.model.indices)
+        results = []
+        for request, (favorites, unresolved), row_scores, fav_indices in zip(requests, resolved, scores, positions):
+            top = top_n_indices(row_scores, fav_indices, request['top_n']) if favorites else np.empty(0, dtype=np.int64)
+            results.append({
+                'favorites': favorites,
+                'unresolved': unresolved,
+                'recommendations': [
+                    {'title': self.model.titles[i], 'score': round(float(row_scores[i]), 6)} for i in top
+                ],
+            })
+        return results
+
+    def search_batch(self, requests: List[Dict]) -> List[Dict]:
+        """Recherche sémantique de plusieurs requêtes : un seul encodage, un seul produit."""
+        queries = np.asarray(self.llm.embedder.encode([request['query'] for request in requests]))
+        top_k = max(request['top_k'] for request in requests)
+        results = []
+        for request, (positions, scores) in zip(requests, self.vector_index.search_batch(queries, top_k)):
+            results.append({'results': [
+                {'title': self.model.titles[i], 'score': round(float(score), 6)}
+                for i, score in zip(positions[:request['top_k']], scores[:request['top_k']])
+            ]})
+        return results
+
+    def explain(self, title: str, favorites: List[str]) -> Optional[Dict]:
+        resolved = self.title_index.resolve(title)
+        if resolved is None:
+            return None
+        # Un titre dupliqué renvoie plusieurs positions : on garde la dernière,
+        # comme `incremental.update_artifact`.
+        position = np.atleast_1d(self.model.indices.loc[resolved])[-1]
+        synopsis = str(self.df['Synopsis'].iloc[int(position)])
+        favorites, _ = self.title_index.resolve_many(favorites)
+        return {'title': resolved, 'explanation': self.llm.explain_recommendation(resolved, synopsis, favorites)}
+
+
+def _bad_request(message: str) -> web.Response:
+    return web.json_response({'error': message}, status=400)
+
+
+async def _read_json(request: web.Request) -> Dict:
+    try:
+        payload = await request.json()
+    except ValueError:
+        raise web.HTTPBadRequest(text='{"error": "JSON invalide"}', content_type='application/json')
+    if not isinstance(payload, dict):
+        raise web.HTTPBadRequest(text='{"error": "objet JSON attendu"}', content_type='application/json')
+    return payload
+
+
+def _limit(payload: Dict, name: str, default: int) -> Optional[int]:
+    value = payload.get(name, default)
+    if isinstance(value, bool) or not isinstance(value, int) or not 1 <= value <= MAX_RESULTS:
+        return None
+    return value
+
+
+@web.middleware
+async def _timing_middleware(request: web.Request, handler):
+    start = time.perf_counter()
+    status = 500
+    try:
+        response = await handler(request)
+        status = response.status
+        return response
+    except web.HTTPException as exc:
+        status = exc.status
+        raise
+    finally:
+        resource = request.match_info.route.resource
+        route = resource.canonical if resource is not None else 'inconnue'
+        request.app['metrics'].observe_request(route, time.perf_counter() - start, status)
+
+
+async def handle_recommend(request: web.Request) -> web.Response:
+    payload = await _read_json(request)
+    favorites = payload.get('favorites')
+    if not isinstance(favorites, list) or not all(isinstance(title, str) for title in favorites):
+        return _bad_request("'favorites' doit être une liste de titres")
+    top_n = _limit(payload, 'top_n', 10)
+    if top_n is None:
+        return _bad_request(f"'top_n' doit être un entier entre 1 et {MAX_RESULTS}")
+    result = await request.app['recommend_batcher'].submit({'favorites': favorites, 'top_n': top_n})
+    return web.json_response(result)
+
+
+async def handle_search(request: web.Request) -> web.Response:
+    service = request.app['service']
+    if not service.search_available:
+        return web.json_response({'error': 'recherche sémantique indisponible'}, status=503)
+    payload = await _read_json(request)
+    query = payload.get('query')
+    if not isinstance(query, str) or not query.strip():
+        return _bad_request("'query' doit être une chaîne non vide")
+    top_k = _limit(payload, 'top_k', 10)
+    if top_k is None:
+        return _bad_request(f"'top_k' doit être un entier entre 1 et {MAX_RESULTS}")
+    result = await request.app['search_batcher'].submit({'query': query, 'top_k': top_k})
+    return web.json_response(result)
+
+
+async def handle_explain(request: web.Request) -> web.Response:
+    service = request.app['service']
+    if service.llm is None:
+        return web.json_response({'error': 'LLM indisponible'}, status=503)
+    payload = await _read_json(request)
+    title = payload.get('title')
+    favorites = payload.get('favorites', [])
+    if (not isinstance(title, str) or not isinstance(favorites, list)
+            or not all(isinstance(favorite, str) for favorite in favorites)):
+        return _bad_request("'title' (chaîne) et 'favorites' (liste de titres) sont attendus")
+    # Appel bloquant au LLM, exécuté dans le pool dédié (borné par max_concurrency)
+    loop = asyncio.get_running_loop()
+    result = await loop.run_in_executor(request.app['llm_pool'], service.explain, title, favorites)
+    if result is None:
+        return web.json_response({'error': f'titre inconnu : {title}'}, status=404)
+    return web.json_response(result)
+
+
+async def handle_health(request: web.Request) -> web.Response:
+    service = request.app['service']
+    return web.json_response({
+        'status': 'ok',
+        'model_version': service.model.version,
+        'n_items': len(service.model.titles),
+        'search': service.search_available,
+        'llm': service.llm is not None,
+    })
+
+
+async def handle_metrics(request: web.Request) -> web.Response:
+    text = request.app['metrics'].render()
+    if INSTRUMENTATION.enabled:
+        # Étapes du pipeline et compteurs du LLM (voir `instrumentation`)
+        text += INSTRUMENTATION.render_prometheus()
+    return web.Response(text=text, content_type='text/plain')
+
+
+def create_app(service: RecommendationService, window: float = DEFAULT_BATCH_WINDOW,
+               max_batch: int = DEFAULT_MAX_BATCH) -> web.Application:
+    """Construit l'application aiohttp autour d'un service déjà chargé.
+
+    Le LLM est injecté via `service.llm` : un `LLMEngine` pointant vers
+    `ollama_stub` permet de tester le service sans Ollama.
+    """
+    app = web.Application(middlewares=[_timing_middleware])
+    metrics = Metrics()
+    app['service'] = service
+    app['metrics'] = metrics
+    app['recommend_batcher'] = MicroBatcher('recommend', service.recommend_batch, window, max_batch, metrics)
+    app['search_batcher'] = MicroBatcher('search', service.search_batch, window, max_batch, metrics)
+    max_concurrency = service.llm.max_concurrency if service.llm is not None else 1
+    app['llm_pool'] = ThreadPoolExecutor(max_workers=max_concurrency, thread_name_prefix='llm')
+
+    async def on_startup(app):
+        app['recommend_batcher'].start()
+        app['search_batcher'].start()
+
+    async def on_cleanup(app):
+        await app['recommend_batcher'].stop()
+        await app['search_batcher'].stop()
+        app['llm_pool'].shutdown(wait=False)
+
+    app.on_startup.append(on_startup)
+    app.on_cleanup.append(on_cleanup)
+    app.router.add_post('/recommend', handle_recommend)
+    app.router.add_post('/search', handle_search)
+    app.router.add_post('/explain', handle_explain)
+    app.router.add_get('/health', handle_health)
+    app.router.add_get('/metrics', handle_metrics)
+    return app
+
+
+def load_service(csv_path: str = 'Anime.csv', artifact_dir: str = DEFAULT_ARTIFACT_DIR,
+                 top_k: int = DEFAULT_TOP_K, embeddings_path: Optional[str] = 'embeddings_cache.npy',
+                 index_kind: str = 'exact', llm=None, score_precision: str = SCORE_PRECISION,
+                 embedding_precision: str = EMBEDDING_PRECISION) -> RecommendationService:
+    """Charge le modèle, les embeddings éventuels et le LLM une fois pour le processus.
+
+    `score_precision` et `embedding_precision` choisissent le stockage
+    compact des voisins et des vecteurs indexés (voir `quantize`).
+    """
+    df, model = load_or_build(csv_path, artifact_dir, top_k, score_precision=score_precision)
+    if llm is None:
+        from llm_engine import LLMEngine
+        llm = LLMEngine(warm_up=True)
+    embeddings, index = None, None
+    if embeddings_path:
+        from llm_engine import load_embeddings_cache
+        from vector_index import load_or_build_index
+        embeddings = load_embeddings_cache(embeddings_path, df)
+        if embeddings is not None:
+            index = load_or_build_index(embeddings, embeddings_path, kind=index_kind, precision=embedding_precision)
+    return RecommendationService(df, model, llm=llm, embeddings=embeddings, vector_index=index)
+
+
+def main(argv: Optional[Sequence[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description="Service HTTP de recommandation d'anime.")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8080)
+    parser.add_argument('--csv', default='Anime.csv', help='Catalogue')
+    parser.add_argument('--artifact-dir', default=DEFAULT_ARTIFACT_DIR, help='Dossier racine des artefacts')
+    parser.add_argument('--embeddings', default='embeddings_cache.npy', help="Cache d'embeddings (recherche)")
+    parser.add_argument('--index', choices=['exact', 'ivf'], default='exact', help='Index de la recherche sémantique')
+    parser.add_argument('--score-precision', choices=PRECISIONS, default=SCORE_PRECISION,
+                        help='Précision des scores des voisins en mémoire')
+    parser.add_argument('--embedding-precision', choices=PRECISIONS, default=EMBEDDING_PRECISION,
+                        help='Précision des vecteurs de l\'index sémantique')
+    parser.add_argument('--batch-window-ms', type=float, default=DEFAULT_BATCH_WINDOW * 1000,
+                        help='Fenêtre de regroupement des requêtes (ms)')
+    parser.add_argument('--max-batch', type=int, default=DEFAULT_MAX_BATCH, help='Taille maximale d\'un lot')
+    parser.add_argument('--instrument', action='store_true',
+                        help='Ajoute les mesures des étapes du pipeline à /metrics')
+    parser.add_argument('--ollama-stub', action='store_true', help='Remplace Ollama par un serveur factice local')
+    args = parser.parse_args(argv)
+
+    if args.instrument:
+        INSTRUMENTATION.enable()
+    llm = None
+    if args.ollama_stub:
+        from llm_engine import LLMEngine
+        from ollama_stub import start_stub
+        from response_cache import ResponseCache
+
+        _, url = start_stub(delay=0.05)
+        llm = LLMEngine(base_url=url, response_cache=ResponseCache(':memory:'), warm_up=True)
+        print(f"Ollama factice sur {url}")
+
+    service = load_service(args.csv, args.artifact_dir, embeddings_path=args.embeddings,
+                           index_kind=args.index, llm=llm, score_precision=args.score_precision,
+                           embedding_precision=args.embedding_precision)
+    app = create_app(service, args.batch_window_ms / 1000, args.max_batch)
+    web.run_app(app, host=args.host, port=args.port)
+
+
+if __name__ == '__main__':
+    main()
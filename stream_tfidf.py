@@ -0,0 +1,234 @@
+"""
+Vectorisation TF‑IDF en flux, pour les catalogues plus grands que la RAM.
+
+`TfidfVectorizer.fit_transform` exige tout le corpus et tout le vocabulaire
+en mémoire. `HashingTfidf` lit au contraire les synopsis depuis un
+générateur, par morceaux :
+
+1. chaque morceau est tokenisé par un `HashingVectorizer` (mêmes règles de
+   tokenisation et mêmes stop words que `vectorize.fit_tfidf`, mais sans
+   vocabulaire : chaque terme est haché dans `n_features` colonnes) ; les
+   comptes bruts sont ajoutés à des fichiers temporaires et les fréquences
+   documentaires cumulées ;
+2. une fois le corpus lu, les poids IDF (même formule lissée que
+   scikit-learn) sont appliqués et chaque ligne normalisée L2, morceau par
+   morceau, directement dans les fichiers `.npy` finaux ouverts en
+   mémoire partagée.
+
+Le résultat approche la pondération TF‑IDF exacte (seules les collisions
+de hachage l'en écartent) et reste au format des artefacts
+(`<nom>_data.npy`, `<nom>_indices.npy`, `<nom>_indptr.npy`).
+
+Utilisation :
+
+    python stream_tfidf.py Anime.csv --out tfidf_stream --chunk-size 50000
+"""
+
+import argparse
+import itertools
+import json
+import os
+import time
+from typing import Iterable, Iterator, List, Optional
+
+import numpy as np
+from scipy import sparse
+
+from vectorize import VECTORIZER_PARAMS
+
+# Nombre de colonnes de hachage (les collisions restent rares en dessous
+# de quelques centaines de milliers de termes distincts)
+DEFAULT_N_FEATURES = 2 ** 20
+
+# Nombre de synopsis vectorisés à la fois
+DEFAULT_CHUNK_SIZE = 10000
+
+PARAMS_FILE = 'hashing_tfidf.json'
+
+
+def _chunks(texts: Iterable[str], chunk_size: int) -> Iterator[List[str]]:
+    iterator = iter(texts)
+    while True:
+        chunk = list(itertools.islice(iterator, chunk_size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def _row_ids(indptr: np.ndarray) -> np.ndarray:
+    """Numéro de ligne (relatif) de chaque valeur non nulle d'un bloc CSR."""
+    return np.repeat(np.arange(len(indptr) - 1), np.diff(indptr))
+
+
+class HashingTfidf:
+    """TF‑IDF à vocabulaire haché, ajusté en un seul passage sur un flux.
+
+    Parameters
+    ----------
+    n_features : int
+        Nombre de colonnes de hachage.
+    idf : numpy.ndarray, optional
+        Poids IDF déjà appris (par exemple relus depuis un artefact).
+    """
+
+    def __init__(self, n_features: int = DEFAULT_N_FEATURES, idf: Optional[np.ndarray] = None):
+        self.n_features = n_features
+        self.idf_ = idf
+        self._hasher = None
+
+    @property
+    def hasher(self):
+        if self._hasher is None:
+            # Import différé : scikit-learn n'est chargé que si l'on vectorise
+            from sklearn.feature_extraction.text import HashingVectorizer
+
+            self._hasher = HashingVectorizer(
+                n_features=self.n_features, alternate_sign=False, norm=None,
+                dtype=np.float32, **VECTORIZER_PARAMS,
+            )
+        return self._hasher
+
+    def counts(self, texts: List[str]) -> sparse.csr_matrix:
+        """Comptes bruts des termes hachés de chaque texte."""
+        matrix = self.hasher.transform(texts)
+        matrix.sum_duplicates()
+        return matrix
+
+    def transform(self, texts: List[str]) -> sparse.csr_matrix:
+        """Vecteurs TF‑IDF normalisés, avec les poids IDF appris."""
+        if self.idf_ is None:
+            raise ValueError("HashingTfidf n'est pas ajusté (aucun poids IDF)")
+        matrix = self.counts(texts)
+        weights = matrix.data * self.idf_[matrix.indices]
+        norms = np.sqrt(np.bincount(_row_ids(matrix.indptr), weights=weights * weights, minlength=matrix.shape[0]))
+        weights /= np.where(norms > 0, norms, 1.0)[_row_ids(matrix.indptr)]
+        return sparse.csr_matrix(
+            (weights.astype(np.float32), matrix.indices, matrix.indptr), shape=matrix.shape,
+        )
+
+    def fit_transform_to_disk(
+        self,
+        synopses: Iterable[str],
+        directory: str,
+        name: str = 'tfidf',
+        chunk_size: int = DEFAULT_CHUNK_SIZE,
+    ) -> sparse.csr_matrix:
+        """Ajuste les poids IDF sur un flux de synopsis et écrit la matrice.
+
+        Parameters
+        ----------
+        synopses : Iterable[str]
+            Synopsis (sans valeurs manquantes), lus une seule fois.
+        directory : str
+            Dossier de sortie.
+        name : str
+            Préfixe des fichiers `.npy` écrits.
+        chunk_size : int
+            Nombre de synopsis traités à la fois.
+
+        Returns
+        -------
+        scipy.sparse.csr_matrix
+            Matrice TF‑IDF normalisée, ouverte en mémoire partagée.
+        """
+        os.makedirs(directory, exist_ok=True)
+        counts_path = os.path.join(directory, f'.{name}_counts.tmp')
+        indices_path = os.path.join(directory, f'.{name}_indices.tmp')
+        document_frequency = np.zeros(self.n_features, dtype=np.int64)
+        row_lengths = []
+        try:
+            # 1. Comptes bruts écrits sur disque, fréquences documentaires cumulées
+            with open(counts_path, 'wb') as counts_file, open(indices_path, 'wb') as indices_file:
+                for chunk in _chunks(synopses, chunk_size):
+                    matrix = self.counts(chunk)
+                    document_frequency += np.bincount(matrix.indices, minlength=self.n_features)
+                    matrix.data.astype(np.float32).tofile(counts_file)
+                    matrix.indices.astype(np.int32).tofile(indices_file)
+                    row_lengths.append(np.diff(matrix.indptr))
+
+            n_docs = sum(len(lengths) for lengths in row_lengths)
+            self.idf_ = np.log((1 + n_docs) / (1 + document_frequency)) + 1.0
+            indptr = np.zeros(n_docs + 1, dtype=np.int64)
+            if row_lengths:
+                np.cumsum(np.concatenate(row_lengths), out=indptr[1:])
+            del row_lengths
+            nnz = int(indptr[-1])
+            # Index 32 bits tant que possible : scipy n'a pas à les convertir
+            index_dtype = np.int32 if nnz < np.iinfo(np.int32).max else np.int64
+            np.save(os.path.join(directory, f'{name}_indptr.npy'), indptr.astype(index_dtype))
+
+            # 2. Pondération IDF et normalisation L2, morceau par morceau
+            data = np.lib.format.open_memmap(
+                os.path.join(directory, f'{name}_data.npy'), mode='w+', dtype=np.float32, shape=(nnz,),
+            )
+            indices = np.lib.format.open_memmap(
+                os.path.join(directory, f'{name}_indices.npy'), mode='w+', dtype=index_dtype, shape=(nnz,),
+            )
+            if nnz:
+                raw_counts = np.memmap(counts_path, dtype=np.float32, mode='r', shape=(nnz,))
+                raw_indices = np.memmap(indices_path, dtype=np.int32, mode='r', shape=(nnz,))
+                for start in range(0, n_docs, chunk_size):
+                    block_indptr = indptr[start:min(start + chunk_size, n_docs) + 1]
+                    low, high = block_indptr[0], block_indptr[-1]
+                    block_indices = np.asarray(raw_indices[low:high])
+                    weights = raw_counts[low:high] * self.idf_[block_indices]
+                    rows = _row_ids(block_indptr - low)
+                    norms = np.sqrt(np.bincount(rows, weights=weights * weights, minlength=len(block_indptr) - 1))
+                    data[low:high] = weights / norms[rows]
+                    indices[low:high] = block_indices
+                del raw_counts, raw_indices
+            data.flush()
+            indices.flush()
+            del data, indices
+        finally:
+            for path in (counts_path, indices_path):
+                if os.path.exists(path):
+                    os.remove(path)
+
+        return load_matrix(directory, name, (n_docs, self.n_features))
+
+    def save(self, directory: str) -> None:
+        """Enregistre les paramètres et les poids IDF."""
+        np.save(os.path.join(directory, 'idf.npy'), self.idf_)
+        with open(os.path.join(directory, PARAMS_FILE), 'w', encoding='utf-8') as f:
+            json.dump({'n_features': self.n_features, 'vectorizer_params': VECTORIZER_PARAMS}, f, indent=2)
+
+    @classmethod
+    def load(cls, directory: str) -> 'HashingTfidf':
+        with open(os.path.join(directory, PARAMS_FILE), encoding='utf-8') as f:
+            params = json.load(f)
+        return cls(params['n_features'], idf=np.load(os.path.join(directory, 'idf.npy')))
+
+
+def load_matrix(directory: str, name: str, shape, mmap_mode: Optional[str] = 'r') -> sparse.csr_matrix:
+    """Rouvre une matrice écrite par `HashingTfidf.fit_transform_to_disk`."""
+    arrays = [
+        np.load(os.path.join(directory, f'{name}_{part}.npy'), mmap_mode=mmap_mode)
+        for part in ('data', 'indices', 'indptr')
+    ]
+    return sparse.csr_matrix(tuple(arrays), shape=shape, copy=False)
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    from data_load import iter_synopses
+
+    parser = argparse.ArgumentParser(description="Vectorisation TF-IDF en flux d'un catalogue.")
+    parser.add_argument('csv', nargs='?', default='Anime.csv', help='Catalogue (CSV, Parquet ou Feather)')
+    parser.add_argument('--out', default='tfidf_stream', help='Dossier de sortie')
+    parser.add_argument('--chunk-size', type=int, default=DEFAULT_CHUNK_SIZE, help='Synopsis par morceau')
+    parser.add_argument('--n-features', type=int, default=DEFAULT_N_FEATURES, help='Colonnes de hachage')
+    args = parser.parse_args(argv)
+
+    start = time.perf_counter()
+    vectorizer = HashingTfidf(args.n_features)
+    matrix = vectorizer.fit_transform_to_disk(
+        iter_synopses(args.csv, args.chunk_size), args.out, chunk_size=args.chunk_size,
+    )
+    vectorizer.save(args.out)
+    elapsed = time.perf_counter() - start
+    print(f"{matrix.shape[0]} synopsis vectorisés en {elapsed:.1f} s "
+          f"({matrix.shape[0] / elapsed:.0f}/s, {matrix.nnz} valeurs non nulles) : {args.out}")
+
+
+if __name__ == '__main__':
+    main()
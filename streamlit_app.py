@@ -1,14 +1,15 @@
 import streamlit as st
 import pandas as pd
 import os
-from data_load import load_data
-from preprocess import preprocess_data
-from vectorize import vectorize_synopsis
-from recommend import recommend_anime
+from artifact import load_or_build
+from recommend import RecommendationCache, recommend_anime
+from hybrid import HybridRanker
+from title_index import TitleIndex
 
 # Import LLM engine
 try:
     from llm_engine import LLMEngine, load_embeddings_cache, create_embeddings_cache
+    from vector_index import load_or_build_index
     LLM_AVAILABLE = True
 except ImportError:
     LLM_AVAILABLE = False
@@ -26,41 +27,90 @@ h3 { color: #4db5ff; }
 </style>
 """, unsafe_allow_html=True)
 
-@st.cache_data
+@st.cache_resource
 def load_and_process():
     try:
-        df = load_data('Anime.csv')
-        df = preprocess_data(df)
-        tfidf_matrix, cosine_sim, indices = vectorize_synopsis(df)
-        return df, cosine_sim, indices
+        # L'artefact est ouvert en mémoire partagée : pas de copie par session
+        df, model = load_or_build('Anime.csv')
+        # Similarité exacte (comme la matrice dense), calculée pour les seuls favoris
+        return df, model.similarity, model.indices, model
     except Exception as e:
         st.error(f"Erreur: {e}")
-        return None, None, None
+        return None, None, None, None
+
+@st.cache_resource
+def get_recommendation_cache():
+    # Partagé entre les sessions ; vidé automatiquement si l'artefact change
+    return RecommendationCache(max_entries=2048)
+
+@st.cache_resource
+def get_title_index(_df):
+    # Index des titres construit une fois : chaque frappe est résolue sans parcourir le catalogue
+    return TitleIndex(_df['Title'])
 
 @st.cache_resource
 def load_llm_engine():
     if LLM_AVAILABLE:
-        return LLMEngine()
+        # Le modèle d'embeddings se charge en arrière-plan : le mode
+        # "Par favoris" reste disponible immédiatement
+        return LLMEngine(warm_up=True)
     return None
 
-@st.cache_data
-def get_semantic_embeddings(_df):
+@st.cache_resource
+def get_semantic_embeddings(_df, _llm):
     if not LLM_AVAILABLE:
         return None
     cache_path = "embeddings_cache.npy"
-    embeddings = load_embeddings_cache(cache_path)
+    embeddings = load_embeddings_cache(cache_path, _df)
     if embeddings is None:
-        embeddings = create_embeddings_cache(_df, cache_path)
+        # Seuls les synopsis nouveaux ou modifiés sont encodés
+        embeddings = create_embeddings_cache(_df, cache_path, engine=_llm)
     return embeddings
 
+@st.cache_resource
+def get_vector_index(_embeddings):
+    # Index approché (IVF) persisté à côté de embeddings_cache.npy
+    return load_or_build_index(_embeddings, "embeddings_cache.npy", kind="ivf")
+
+@st.cache_resource
+def get_hybrid_ranker(_df, _model, _embeddings, _vector_index, _llm):
+    return HybridRanker(
+        _df, _model.tfidf_matrix, _model.neighbors, _model.indices,
+        vectorizer=_model.vectorizer, embeddings=_embeddings, vector_index=_vector_index,
+        encode=lambda texts: _llm.embedder.encode(texts),
+    )
+
+def add_searched_title(title_index):
+    # Ajoute le titre le plus proche de la recherche aux favoris, puis vide la recherche
+    query = st.session_state.get("title_search", "")
+    resolved = title_index.resolve(query) if query.strip() else None
+    st.session_state["title_search_miss"] = query if query.strip() and resolved is None else ""
+    if resolved is not None:
+        favorites = st.session_state.get("favorites", [])
+        if resolved not in favorites:
+            st.session_state["favorites"] = favorites + [resolved]
+        st.session_state["title_search"] = ""
+
+def render_card(row, explanation="", score=None):
+    return f"""
+    <div class="anime-card">
+        <h3>{row['Title']}</h3>
+        {f'<p><strong>Score:</strong> {score:.2%}</p>' if score is not None else ''}
+        <p><strong>Genre:</strong> {row.get('Genre', 'N/A')}</p>
+        <p><em>{row['Synopsis'][:200]}...</em></p>
+        {f'<div class="llm-explanation">💡 {explanation}</div>' if explanation else ''}
+    </div>
+    """
+
 def main():
     st.title("🎬 Anime Recommendation Engine")
     st.markdown("### Découvrez votre prochain anime favori grâce à l'IA")
 
     with st.spinner('Chargement...'):
-        df, cosine_sim, indices = load_and_process()
+        df, cosine_sim, indices, model = load_and_process()
         llm = load_llm_engine()
-        embeddings = get_semantic_embeddings(df) if llm else None
+        embeddings = get_semantic_embeddings(df, llm) if llm else None
+        vector_index = get_vector_index(embeddings) if embeddings is not None else None
 
     if df is None:
         return
@@ -71,18 +121,37 @@ def main():
         # Mode de recherche
         search_mode = st.radio(
             "Mode de recherche",
-            ["🎯 Par favoris", "💬 Langage naturel"] if LLM_AVAILABLE and embeddings is not None else ["🎯 Par favoris"]
+            ["🎯 Par favoris", "💬 Langage naturel", "🔀 Hybride"] if LLM_AVAILABLE and embeddings is not None else ["🎯 Par favoris"]
         )
         
-        if search_mode == "🎯 Par favoris":
+        if search_mode in ("🎯 Par favoris", "🔀 Hybride"):
             all_titles = sorted(df['Title'].unique().tolist())
-            favorites = st.multiselect("Vos animes préférés", options=all_titles)
+            st.text_input("🔎 Ajouter un titre", placeholder="Ex: shingeki, naruto shipuden...",
+                          key="title_search", on_change=add_searched_title, args=(get_title_index(df),))
+            if st.session_state.get("title_search_miss"):
+                st.caption(f"Aucun titre proche de « {st.session_state['title_search_miss']} »")
+            favorites = st.multiselect("Vos animes préférés", options=all_titles, key="favorites")
             top_n = st.slider("Nombre de recommandations", 1, 20, 5)
+            diversity = None
+            if search_mode == "🎯 Par favoris":
+                # Évite une liste saturée par une seule franchise
+                diversity_label = st.selectbox("Diversité", ["Aucune", "MMR", "Quota par genre"])
+                diversity = {"Aucune": None, "MMR": "mmr", "Quota par genre": "genre"}[diversity_label]
+                diversity_options = {}
+                if diversity == "mmr":
+                    diversity_options['diversity_lambda'] = st.slider("Pertinence ↔ diversité", 0.0, 1.0, 0.7, 0.05)
+                elif diversity == "genre":
+                    diversity_options['max_per_genre'] = st.slider("Titres par genre", 1, 10, 3)
+            if search_mode == "🔀 Hybride":
+                semantic_weight = st.slider("Poids sémantique", 0.0, 1.0, 0.5, 0.05)
+                fusion = st.selectbox("Fusion", ["weighted", "rrf"])
+                candidate_pool = st.slider("Candidats par index", 50, 1000, 200, 50)
         else:
             favorites = []
             top_n = st.slider("Nombre de résultats", 1, 20, 10)
         
         use_llm_explain = st.checkbox("✨ Explications IA", value=True) if LLM_AVAILABLE else False
+        stream_llm = st.checkbox("⚡ Affichage progressif", value=True) if use_llm_explain else False
         
         st.markdown("---")
         st.metric("Total Animes", len(df))
@@ -98,7 +167,7 @@ def main():
         
         if query and st.button("🚀 Rechercher"):
             with st.spinner("Recherche sémantique..."):
-                results = llm.semantic_search(query, df, embeddings, top_k=top_n)
+                results = llm.semantic_search(query, df, embeddings, top_k=top_n, index=vector_index)
             
             st.markdown(f"### 🎯 Résultats pour: *{query}*")
             cols = st.columns(2)
@@ -113,31 +182,65 @@ def main():
                     </div>
                     """, unsafe_allow_html=True)
     
+    # Mode hybride : favoris et/ou requête, un seul classement fusionné
+    elif search_mode == "🔀 Hybride":
+        query = st.text_input("🔍 Décrivez l'anime que vous cherchez (optionnel)")
+        if (favorites or query) and st.button("🚀 Rechercher"):
+            ranker = get_hybrid_ranker(df, model, embeddings, vector_index, llm)
+            with st.spinner("Classement hybride..."):
+                results = ranker.rank(
+                    favorites, query or None, top_k=top_n,
+                    weights={'tfidf': 1 - semantic_weight, 'embedding': semantic_weight},
+                    method=fusion, candidate_pool=candidate_pool,
+                )
+            cols = st.columns(2)
+            for idx, (_, row) in enumerate(results.iterrows()):
+                with cols[idx % 2]:
+                    st.markdown(render_card(row, score=row['score']), unsafe_allow_html=True)
+    
     # Mode favoris classique
     elif favorites:
         if st.button("🔍 Générer les recommandations"):
-            recommendations = recommend_anime(favorites, top_n, df, cosine_sim, indices)
+            if diversity is None:
+                recommendations = get_recommendation_cache().recommend(
+                    favorites, top_n, df, cosine_sim, indices, version=model.version
+                )
+            else:
+                recommendations = recommend_anime(
+                    favorites, top_n, df, cosine_sim, indices, diversity=diversity, **diversity_options
+                )
             
             st.markdown(f"### 🎯 Basé sur: {', '.join(favorites)}")
+            explanations = [""] * len(recommendations)
+            if use_llm_explain and llm and not stream_llm:
+                # Toutes les explications sont demandées en parallèle
+                with st.spinner("Analyse des recommandations..."):
+                    explanations = llm.explain_recommendations(
+                        list(zip(recommendations['Title'], recommendations['Synopsis'])), favorites
+                    )
             cols = st.columns(2)
-            
-            for idx, (_, row) in enumerate(recommendations.iterrows()):
+            streaming = use_llm_explain and llm and stream_llm
+            rows = [row for _, row in recommendations.iterrows()]
+            cards = []
+            for idx, row in enumerate(rows):
                 with cols[idx % 2]:
-                    explanation = ""
-                    if use_llm_explain and llm:
-                        with st.spinner(f"Analyse de {row['Title']}..."):
-                            explanation = llm.explain_recommendation(
-                                row['Title'], row['Synopsis'], favorites
-                            )
-                    
-                    st.markdown(f"""
-                    <div class="anime-card">
-                        <h3>{row['Title']}</h3>
-                        <p><strong>Genre:</strong> {row.get('Genre', 'N/A')}</p>
-                        <p><em>{row['Synopsis'][:200]}...</em></p>
-                        {f'<div class="llm-explanation">💡 {explanation}</div>' if explanation else ''}
-                    </div>
-                    """, unsafe_allow_html=True)
+                    cards.append(st.empty())
+                    cards[idx].markdown(render_card(row, "▌" if streaming else explanations[idx]),
+                                        unsafe_allow_html=True)
+
+            if streaming:
+                # Rendu progressif : les explications sont générées en parallèle
+                # et chaque token est affiché dans sa carte dès son arrivée
+                items = list(zip(recommendations['Title'], recommendations['Synopsis']))
+                for idx, token in llm.explain_recommendations_stream(items, favorites):
+                    explanations[idx] += token
+                    cards[idx].markdown(render_card(rows[idx], explanations[idx] + "▌"), unsafe_allow_html=True)
+                for card, row, explanation in zip(cards, rows, explanations):
+                    card.markdown(render_card(row, explanation), unsafe_allow_html=True)
+
+            if streaming and llm.first_token_latencies:
+                latencies = list(llm.first_token_latencies)[-len(recommendations):]
+                st.caption(f"⏱️ Premier token : {1000 * sum(latencies) / len(latencies):.0f} ms en moyenne")
     else:
         st.info("👈 Sélectionnez vos animes préférés ou utilisez la recherche en langage naturel!")
         st.markdown("### 🎲 Suggestions")
@@ -0,0 +1,394 @@
+"""
+Index vectoriels pour la recherche sémantique.
+
+Ce module fournit deux implémentations interchangeables utilisées par
+`LLMEngine.semantic_search` :
+
+* `ExactIndex` : recherche exhaustive sur des embeddings normalisés une fois
+  pour toutes (float32), avec sélection partielle par `np.argpartition` ;
+* `IVFIndex` : recherche approchée par listes inversées (IVF). Les
+  embeddings sont partitionnés par un k-means sphérique ; une requête ne
+  parcourt que les `n_probe` partitions les plus proches. `n_probe` règle
+  le compromis rappel/latence.
+
+Les vecteurs indexés peuvent être stockés en float16 ou en int8 (voir
+`quantize`, paramètre `precision`) : les scores sont alors calculés
+directement sur la forme compacte.
+
+Les index se sauvegardent à côté de `embeddings_cache.npy` et
+`recall_at_k` mesure le rappel d'un index approché par rapport à l'index
+exact.
+
+Utilisation en ligne de commande (mesure du rappel et de la latence) :
+
+    python vector_index.py --embeddings embeddings_cache.npy --n-probe 4 8 16
+"""
+
+import argparse
+import hashlib
+import os
+import time
+from typing import List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from quantize import EMBEDDING_PRECISION, QuantizedMatrix
+
+DEFAULT_N_PROBE = 8
+
+# Lignes hachées à la fois par `embeddings_fingerprint`
+FINGERPRINT_BLOCK_SIZE = 4096
+
+
+def normalize_rows(vectors: np.ndarray) -> np.ndarray:
+    """Normalise chaque ligne en norme L2 (float32), les lignes nulles restant nulles."""
+    vectors = np.asarray(vectors, dtype=np.float32)
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return vectors / norms
+
+
+def embeddings_fingerprint(embeddings: np.ndarray) -> str:
+    """Empreinte des embeddings, pour détecter un index obsolète.
+
+    Les lignes sont hachées par blocs, sans copie pour une matrice contiguë :
+    un cache ouvert en mémoire partagée n'est pas chargé entièrement en RAM.
+    """
+    digest = hashlib.sha256(str(embeddings.shape).encode('utf-8'))
+    for start in range(0, len(embeddings), FINGERPRINT_BLOCK_SIZE):
+        block = np.ascontiguousarray(embeddings[start:start + FINGERPRINT_BLOCK_SIZE])
+        digest.update(memoryview(block).cast('B'))
+    return digest.hexdigest()[:16]
+
+
+def _top_k(scores: np.ndarray, top_k: int) -> np.ndarray:
+    """Positions des `top_k` meilleurs scores, triées par score décroissant."""
+    top_k = min(top_k, len(scores))
+    if top_k <= 0:
+        return np.empty(0, dtype=np.int64)
+    top = np.argpartition(-scores, top_k - 1)[:top_k]
+    return top[np.argsort(-scores[top], kind='stable')]
+
+
+class ExactIndex:
+    """Recherche exhaustive par produit scalaire sur embeddings normalisés.
+
+    `precision` (`'float32'`, `'float16'` ou `'int8'`) choisit le stockage
+    des vecteurs ; une `quantize.QuantizedMatrix` est aussi acceptée telle quelle.
+    """
+
+    kind = 'exact'
+
+    def __init__(self, embeddings: np.ndarray, normalized: bool = False, precision: str = 'float32'):
+        if isinstance(embeddings, QuantizedMatrix):
+            self.vectors = embeddings
+        elif precision != 'float32':
+            self.vectors = QuantizedMatrix.from_dense(embeddings, precision, normalize=not normalized)
+        else:
+            self.vectors = np.asarray(embeddings, dtype=np.float32) if normalized else normalize_rows(embeddings)
+        self.fingerprint = None
+
+    def __len__(self) -> int:
+        return len(self.vectors)
+
+    def search(self, query: np.ndarray, top_k: int = 10) -> Tuple[np.ndarray, np.ndarray]:
+        """Renvoie les positions et similarités cosinus des `top_k` plus proches voisins.
+
+        Parameters
+        ----------
+        query : numpy.ndarray
+            Embedding de la requête (non nécessairement normalisé).
+        top_k : int
+            Nombre de résultats.
+
+        Returns
+        -------
+        tuple
+            Un couple (positions, similarités), triés par similarité décroissante.
+        """
+        scores = self.vectors @ normalize_rows(query)
+        top = _top_k(scores, top_k)
+        return top, scores[top]
+
+    def search_batch(self, queries: np.ndarray, top_k: int = 10) -> List[Tuple[np.ndarray, np.ndarray]]:
+        """Variante de `search` pour plusieurs requêtes, en un seul produit matriciel."""
+        scores = (self.vectors @ normalize_rows(queries).T).T
+        results = []
+        for row in scores:
+            top = _top_k(row, top_k)
+            results.append((top, row[top]))
+        return results
+
+    def save(self, path: str) -> None:
+        np.savez(path, kind=self.kind, fingerprint=self.fingerprint or '', **_vector_arrays(self.vectors))
+
+
+class IVFIndex:
+    """Recherche approchée par listes inversées (k-means sphérique).
+
+    Parameters
+    ----------
+    embeddings : numpy.ndarray
+        Matrice N×D des embeddings.
+    n_lists : int, optional
+        Nombre de partitions ; par défaut environ √N.
+    n_probe : int
+        Nombre de partitions parcourues par requête (rappel/latence).
+    n_iter : int
+        Nombre d'itérations du k-means.
+    seed : int
+        Graine du générateur aléatoire.
+    precision : str
+        Stockage des vecteurs : `'float32'`, `'float16'` ou `'int8'`.
+    """
+
+    kind = 'ivf'
+
+    def __init__(
+        self,
+        embeddings: Optional[np.ndarray] = None,
+        n_lists: Optional[int] = None,
+        n_probe: int = DEFAULT_N_PROBE,
+        n_iter: int = 20,
+        seed: int = 0,
+        precision: str = 'float32',
+    ):
+        self.n_probe = n_probe
+        self.fingerprint = None
+        if embeddings is not None:
+            self._build(normalize_rows(embeddings), n_lists, n_iter, seed)
+            if precision != 'float32':
+                self.vectors = QuantizedMatrix.from_dense(self.vectors, precision)
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def _build(self, vectors: np.ndarray, n_lists: Optional[int], n_iter: int, seed: int) -> None:
+        n_items = len(vectors)
+        n_lists = n_lists or max(1, int(np.sqrt(n_items)))
+        n_lists = min(n_lists, n_items)
+        rng = np.random.default_rng(seed)
+
+        # Apprentissage des centroïdes sur un échantillon
+        sample_size = min(n_items, 256 * n_lists)
+        sample = vectors[rng.choice(n_items, sample_size, replace=False)]
+        centroids = sample[rng.choice(sample_size, n_lists, replace=False)].copy()
+        for _ in range(n_iter):
+            assign = self._assign(sample, centroids)
+            sums = np.zeros_like(centroids)
+            np.add.at(sums, assign, sample)
+            counts = np.bincount(assign, minlength=n_lists)
+            # Les partitions vides sont réinitialisées sur des points au hasard
+            empty = counts == 0
+            sums[empty] = sample[rng.choice(sample_size, int(empty.sum()))]
+            centroids = normalize_rows(sums)
+
+        assign = self._assign(vectors, centroids)
+        order = np.argsort(assign, kind='stable')
+        self.centroids = centroids
+        self.ids = order.astype(np.int64)
+        self.vectors = vectors[order]
+        self.offsets = np.concatenate([[0], np.cumsum(np.bincount(assign, minlength=n_lists))]).astype(np.int64)
+
+    @staticmethod
+    def _assign(vectors: np.ndarray, centroids: np.ndarray, block_size: int = 8192) -> np.ndarray:
+        assign = np.empty(len(vectors), dtype=np.int64)
+        for start in range(0, len(vectors), block_size):
+            block = vectors[start:start + block_size]
+            assign[start:start + block_size] = np.argmax(block @ centroids.T, axis=1)
+        return assign
+
+    def search(
+        self, query: np.ndarray, top_k: int = 10, n_probe: Optional[int] = None
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        """Renvoie les positions et similarités approchées des `top_k` voisins.
+
+        Parameters
+        ----------
+        query : numpy.ndarray
+            Embedding de la requête.
+        top_k : int
+            Nombre de résultats.
+        n_probe : int, optional
+            Nombre de partitions parcourues (par défaut `self.n_probe`).
+
+        Returns
+        -------
+        tuple
+            Un couple (positions, similarités), triés par similarité décroissante.
+        """
+        query = normalize_rows(query)
+        n_probe = min(n_probe or self.n_probe, len(self.centroids))
+        lists = _top_k(self.centroids @ query, n_probe)
+        candidates = np.concatenate([
+            np.arange(self.offsets[i], self.offsets[i + 1]) for i in lists
+        ])
+        scores = self.vectors[candidates] @ query
+        top = _top_k(scores, top_k)
+        return self.ids[candidates[top]], scores[top]
+
+    def search_batch(
+        self, queries: np.ndarray, top_k: int = 10, n_probe: Optional[int] = None
+    ) -> List[Tuple[np.ndarray, np.ndarray]]:
+        """Variante de `search` pour plusieurs requêtes (une par ligne)."""
+        return [self.search(query, top_k, n_probe) for query in np.atleast_2d(queries)]
+
+    def save(self, path: str) -> None:
+        np.savez(
+            path, kind=self.kind, ids=self.ids, offsets=self.offsets, centroids=self.centroids,
+            n_probe=self.n_probe, fingerprint=self.fingerprint or '', **_vector_arrays(self.vectors),
+        )
+
+
+def _vector_arrays(vectors) -> dict:
+    """Tableaux à sauvegarder pour des vecteurs pleins ou quantifiés."""
+    if isinstance(vectors, QuantizedMatrix):
+        scale = vectors.scale if vectors.scale is not None else np.empty(0, dtype=np.float32)
+        return {'vectors': vectors.codes, 'scale': scale, 'precision': vectors.precision}
+    return {'vectors': vectors, 'precision': 'float32'}
+
+
+def _load_vectors(data):
+    precision = str(data['precision']) if 'precision' in data.files else 'float32'
+    if precision == 'float32':
+        return data['vectors']
+    return QuantizedMatrix(data['vectors'], data['scale'] if precision == 'int8' else None)
+
+
+def index_path_for(cache_path: str, kind: str, precision: str = 'float32') -> str:
+    """Chemin de l'index sauvegardé à côté du cache d'embeddings."""
+    root, _ = os.path.splitext(cache_path)
+    suffix = '' if precision == 'float32' else f'.{precision}'
+    return f'{root}.{kind}{suffix}.npz'
+
+
+def load_index(path: str):
+    """Charge un index sauvegardé avec sa méthode `save`."""
+    with np.load(path) as data:
+        kind = str(data['kind'])
+        if kind == ExactIndex.kind:
+            index = ExactIndex(_load_vectors(data), normalized=True)
+        elif kind == IVFIndex.kind:
+            index = IVFIndex(n_probe=int(data['n_probe']))
+            index.vectors = _load_vectors(data)
+            index.ids = data['ids']
+            index.offsets = data['offsets']
+            index.centroids = data['centroids']
+        else:
+            raise ValueError(f"Type d'index inconnu : {kind}")
+        index.fingerprint = str(data['fingerprint']) or None
+    return index
+
+
+def build_index(embeddings: np.ndarray, kind: str = 'exact', precision: str = 'float32', **kwargs):
+    """Construit un index du type demandé (`'exact'` ou `'ivf'`)."""
+    if kind == ExactIndex.kind:
+        index = ExactIndex(embeddings, precision=precision)
+    elif kind == IVFIndex.kind:
+        index = IVFIndex(embeddings, precision=precision, **kwargs)
+    else:
+        raise ValueError(f"Type d'index inconnu : {kind}")
+    index.fingerprint = embeddings_fingerprint(embeddings)
+    return index
+
+
+def load_or_build_index(
+    embeddings: np.ndarray,
+    cache_path: str = "embeddings_cache.npy",
+    kind: str = 'ivf',
+    precision: str = EMBEDDING_PRECISION,
+    **kwargs,
+):
+    """Charge l'index sauvegardé à côté du cache, ou le reconstruit s'il est obsolète.
+
+    Parameters
+    ----------
+    embeddings : numpy.ndarray
+        Embeddings indexés.
+    cache_path : str
+        Chemin du cache d'embeddings ; l'index est sauvegardé à côté.
+    kind : str
+        `'exact'` ou `'ivf'`.
+    precision : str
+        Stockage des vecteurs indexés (`'float32'`, `'float16'` ou `'int8'`).
+    **kwargs
+        Paramètres de construction transmis à `IVFIndex`.
+
+    Returns
+    -------
+    ExactIndex or IVFIndex
+        Index à jour.
+    """
+    path = index_path_for(cache_path, kind, precision)
+    fingerprint = embeddings_fingerprint(embeddings)
+    if os.path.exists(path):
+        index = load_index(path)
+        if index.fingerprint == fingerprint:
+            return index
+    index = build_index(embeddings, kind, precision, **kwargs)
+    index.save(path)
+    return index
+
+
+def recall_at_k(index, reference: ExactIndex, queries: np.ndarray, k: int = 10, **search_kwargs) -> float:
+    """Rappel@k moyen d'un index par rapport à l'index exact.
+
+    Parameters
+    ----------
+    index : ExactIndex or IVFIndex
+        Index évalué.
+    reference : ExactIndex
+        Index exact de référence.
+    queries : numpy.ndarray
+        Matrice Q×D de requêtes.
+    k : int
+        Nombre de voisins comparés.
+    **search_kwargs
+        Paramètres transmis à `index.search` (par exemple `n_probe`).
+
+    Returns
+    -------
+    float
+        Proportion moyenne des k vrais voisins retrouvés par `index`.
+    """
+    hits = 0
+    for query in queries:
+        expected, _ = reference.search(query, k)
+        found, _ = index.search(query, k, **search_kwargs)
+        hits += len(np.intersect1d(expected, found))
+    return hits / (len(queries) * k)
+
+
+def main(argv: Optional[Sequence[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description="Rappel et latence de l'index approché.")
+    parser.add_argument('--embeddings', default='embeddings_cache.npy', help="Cache d'embeddings (.npy)")
+    parser.add_argument('--n-lists', type=int, default=None, help='Nombre de partitions IVF')
+    parser.add_argument('--n-probe', type=int, nargs='+', default=[1, 4, 8, 16, 32], help='Valeurs de n_probe testées')
+    parser.add_argument('--queries', type=int, default=200, help='Nombre de requêtes tirées du cache')
+    parser.add_argument('-k', type=int, default=10, help='Nombre de voisins')
+    args = parser.parse_args(argv)
+
+    embeddings = np.load(args.embeddings, mmap_mode='r')
+    exact = build_index(embeddings, 'exact')
+    ivf = load_or_build_index(embeddings, args.embeddings, 'ivf', n_lists=args.n_lists)
+
+    rng = np.random.default_rng(0)
+    queries = np.asarray(embeddings[rng.choice(len(embeddings), min(args.queries, len(embeddings)), replace=False)])
+
+    start = time.perf_counter()
+    for query in queries:
+        exact.search(query, args.k)
+    exact_ms = 1000 * (time.perf_counter() - start) / len(queries)
+    print(f"exact        : rappel@{args.k} = 1.000, {exact_ms:.3f} ms/requête")
+
+    for n_probe in args.n_probe:
+        start = time.perf_counter()
+        for query in queries:
+            ivf.search(query, args.k, n_probe=n_probe)
+        ivf_ms = 1000 * (time.perf_counter() - start) / len(queries)
+        recall = recall_at_k(ivf, exact, queries, args.k, n_probe=n_probe)
+        print(f"ivf n_probe={n_probe:<3}: rappel@{args.k} = {recall:.3f}, {ivf_ms:.3f} ms/requête")
+
+
+if __name__ == '__main__':
+    main()
@@ -5,37 +5,267 @@ Ce module contient une fonction qui transforme les synopsis en une matrice
 TF‑IDF et calcule une matrice de similarité cosinus. Il renvoie aussi un
 index inversé pour passer rapidement d'un titre d'anime à l'indice de son
 synopsis dans la matrice.
+
+Pour les gros catalogues, la matrice dense N×N peut être remplacée par :
+
+* `TfidfSimilarity`, qui calcule à la demande les lignes exactes de la
+  matrice (favoris, candidats) à partir de la matrice TF‑IDF : mêmes
+  scores que la matrice dense, sans la matérialiser ;
+* un index creux des K plus proches voisins de chaque titre (voir
+  `build_neighbors`), dont la mémoire est en O(N·K) au lieu de O(N²), mais
+  qui ignore les similarités hors des K meilleures. Son calcul par blocs de
+  lignes peut être réparti sur plusieurs cœurs.
 """
 
-from typing import Tuple
+import os
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from typing import TYPE_CHECKING, Callable, Optional, Tuple
+import numpy as np
 import pandas as pd
-from sklearn.feature_extraction.text import TfidfVectorizer
-from sklearn.metrics.pairwise import linear_kernel
+from scipy import sparse
+
+from instrumentation import timed
+
+if TYPE_CHECKING:
+    from sklearn.feature_extraction.text import TfidfVectorizer
+
+# Nombre de lignes traitées à la fois lors du calcul des voisins
+DEFAULT_BLOCK_SIZE = 512
+
+# Paramètres du vectoriseur TF‑IDF (ils font partie de la clé des artefacts)
+VECTORIZER_PARAMS = {'stop_words': 'english'}
+
+# Matrice TF‑IDF et transposée ouvertes par les processus de build_neighbors
+_SHARED_TFIDF = None
+
+
+def fit_tfidf(synopses) -> Tuple['TfidfVectorizer', sparse.csr_matrix]:
+    """Apprend le vectoriseur TF‑IDF et transforme les synopsis.
+
+    Parameters
+    ----------
+    synopses : iterable of str
+        Synopsis (sans valeurs manquantes) à vectoriser.
+
+    Returns
+    -------
+    tuple
+        Un couple (vectorizer, tfidf_matrix).
+    """
+    # Import différé : scikit-learn n'est chargé que si l'on vectorise
+    from sklearn.feature_extraction.text import TfidfVectorizer
+
+    # Création du vectoriseur avec suppression des stop words anglais
+    vectorizer = TfidfVectorizer(**VECTORIZER_PARAMS)
+    tfidf_matrix = vectorizer.fit_transform(synopses)
+    return vectorizer, tfidf_matrix
+
+
+class TfidfSimilarity:
+    """Similarité cosinus exacte, calculée ligne par ligne à la demande.
+
+    S'utilise comme `cosine_sim` dans `recommend.recommend_anime` : les
+    scores sont ceux de `linear_kernel(tfidf_matrix, tfidf_matrix)`, mais
+    seules les lignes demandées sont calculées (un produit creux par appel).
+
+    Parameters
+    ----------
+    tfidf_matrix : scipy.sparse.spmatrix
+        Matrice TF‑IDF (lignes normalisées L2) des synopsis.
+    """
+
+    def __init__(self, tfidf_matrix: sparse.spmatrix):
+        self.tfidf_matrix = sparse.csr_matrix(tfidf_matrix)
+        self.shape = (self.tfidf_matrix.shape[0], self.tfidf_matrix.shape[0])
+
+    @property
+    def dtype(self) -> np.dtype:
+        return np.dtype(np.float64)
+
+    def __getitem__(self, rows) -> sparse.csr_matrix:
+        """Lignes demandées (tableau de positions) de la matrice de similarité, en CSR."""
+        rows = np.atleast_1d(np.asarray(rows, dtype=np.int64))
+        selected = self.tfidf_matrix[rows].astype(np.float64)
+        return sparse.csr_matrix((self.tfidf_matrix @ selected.T).T)
 
+    def sum_rows(self, positions: np.ndarray) -> np.ndarray:
+        """Somme des lignes `positions` (vecteur dense de longueur N)."""
+        return np.asarray(self[positions].sum(axis=0), dtype=np.float64).ravel()
 
-def vectorize_synopsis(df: pd.DataFrame) -> Tuple:
+
+def _save_shared(directory: str, name: str, matrix: sparse.csr_matrix) -> None:
+    for part in ('data', 'indices', 'indptr'):
+        np.save(os.path.join(directory, f'{name}_{part}.npy'), getattr(matrix, part))
+
+
+def _load_shared(directory: str, name: str, shape: Tuple[int, int]) -> sparse.csr_matrix:
+    arrays = [
+        np.load(os.path.join(directory, f'{name}_{part}.npy'), mmap_mode='r')
+        for part in ('data', 'indices', 'indptr')
+    ]
+    return sparse.csr_matrix(tuple(arrays), shape=shape, copy=False)
+
+
+def _init_neighbors_worker(directory: str, shape: Tuple[int, int]) -> None:
+    global _SHARED_TFIDF
+    _SHARED_TFIDF = (
+        _load_shared(directory, 'tfidf', shape),
+        _load_shared(directory, 'tfidf_t', (shape[1], shape[0])),
+    )
+
+
+def _block_top_k(
+    tfidf_matrix: sparse.csr_matrix,
+    tfidf_t: sparse.csr_matrix,
+    start: int,
+    stop: int,
+    k: int,
+) -> Tuple[np.ndarray, np.ndarray]:
+    """Top-K des similarités des lignes `start:stop`, triées par score décroissant."""
+    block = (tfidf_matrix[start:stop] @ tfidf_t).toarray().astype(np.float32)
+    rows = np.arange(stop - start)
+    # Un titre n'est pas son propre voisin
+    block[rows, rows + start] = -np.inf
+
+    top = np.argpartition(block, -k, axis=1)[:, -k:]
+    top_scores = np.take_along_axis(block, top, axis=1)
+    order = np.argsort(-top_scores, axis=1)
+    return np.take_along_axis(top, order, axis=1), np.take_along_axis(top_scores, order, axis=1)
+
+
+def _neighbors_task(start: int, stop: int, k: int) -> Tuple[int, int, np.ndarray, np.ndarray, float]:
+    began = time.perf_counter()
+    top, top_scores = _block_top_k(*_SHARED_TFIDF, start, stop, k)
+    return start, stop, top, top_scores, time.perf_counter() - began
+
+
+def build_neighbors(
+    tfidf_matrix: sparse.spmatrix,
+    top_k: int,
+    block_size: int = DEFAULT_BLOCK_SIZE,
+    workers: int = 1,
+    progress: Optional[Callable[[int, int, int, float], None]] = None,
+) -> sparse.csr_matrix:
+    """Calcule les K plus proches voisins de chaque synopsis, bloc par bloc.
+
+    Seul un bloc de `block_size` lignes de similarités est matérialisé à la
+    fois ; on n'en garde que les `top_k` meilleurs scores (le titre lui-même
+    est exclu), stockés en float32.
+
+    Avec `workers > 1`, les blocs sont répartis sur un pool de processus.
+    La matrice et sa transposée sont écrites une fois dans un dossier
+    temporaire puis ouvertes en mémoire partagée par chaque processus :
+    seuls les top-K de chaque bloc transitent entre processus.
+
+    Parameters
+    ----------
+    tfidf_matrix : scipy.sparse.spmatrix
+        Matrice TF‑IDF (lignes normalisées L2) des synopsis.
+    top_k : int
+        Nombre de voisins à conserver par titre.
+    block_size : int
+        Nombre de lignes calculées simultanément.
+    workers : int
+        Nombre de processus de calcul.
+    progress : Callable, optional
+        Appelée après chaque bloc avec `(start, stop, n_rows, secondes)`.
+
+    Returns
+    -------
+    scipy.sparse.csr_matrix
+        Matrice N×N creuse en float32 où la ligne i contient les scores de
+        similarité des voisins de i, triés par score décroissant.
+    """
+    tfidf_matrix = sparse.csr_matrix(tfidf_matrix)
+    n_rows = tfidf_matrix.shape[0]
+    k = max(0, min(top_k, n_rows - 1))
+    neighbor_indices = np.zeros((n_rows, k), dtype=np.int32)
+    neighbor_scores = np.zeros((n_rows, k), dtype=np.float32)
+    if k == 0:
+        return sparse.csr_matrix((n_rows, n_rows), dtype=np.float32)
+
+    # Transposée calculée une fois en CSR : chaque bloc est un produit CSR × CSR
+    tfidf_t = tfidf_matrix.T.tocsr()
+    blocks = [(start, min(start + block_size, n_rows)) for start in range(0, n_rows, block_size)]
+
+    def store(start, stop, top, top_scores, seconds):
+        neighbor_indices[start:stop] = top
+        neighbor_scores[start:stop] = top_scores
+        if progress is not None:
+            progress(start, stop, n_rows, seconds)
+
+    if workers <= 1 or len(blocks) == 1:
+        for start, stop in blocks:
+            began = time.perf_counter()
+            top, top_scores = _block_top_k(tfidf_matrix, tfidf_t, start, stop, k)
+            store(start, stop, top, top_scores, time.perf_counter() - began)
+    else:
+        with tempfile.TemporaryDirectory(prefix='neighbors-') as shared_dir:
+            _save_shared(shared_dir, 'tfidf', tfidf_matrix)
+            _save_shared(shared_dir, 'tfidf_t', tfidf_t)
+            del tfidf_t
+            with ProcessPoolExecutor(
+                max_workers=workers, initializer=_init_neighbors_worker,
+                initargs=(shared_dir, tfidf_matrix.shape),
+            ) as pool:
+                futures = [pool.submit(_neighbors_task, start, stop, k) for start, stop in blocks]
+                for future in as_completed(futures):
+                    store(*future.result())
+
+    indptr = np.arange(0, n_rows * k + 1, k, dtype=np.int64)
+    neighbors = sparse.csr_matrix(
+        (neighbor_scores.ravel(), neighbor_indices.ravel(), indptr),
+        shape=(n_rows, n_rows),
+    )
+    # Les voisins de score nul n'apportent rien au classement
+    neighbors.eliminate_zeros()
+    return neighbors
+
+
+@timed('vectorize_synopsis')
+def vectorize_synopsis(
+    df: pd.DataFrame,
+    top_k: Optional[int] = None,
+    block_size: int = DEFAULT_BLOCK_SIZE,
+    workers: int = 1,
+) -> Tuple:
     """Vectorise les synopsis et calcule la similarité cosinus.
 
     Parameters
     ----------
     df : pandas.DataFrame
         DataFrame contenant au moins les colonnes `Title` et `Synopsis`.
+    top_k : int, optional
+        Si fourni, seuls les `top_k` voisins de chaque titre sont calculés et
+        `cosine_sim` est une matrice creuse (voir `build_neighbors`) au lieu
+        de la matrice dense N×N.
+    block_size : int
+        Taille des blocs de lignes utilisés lorsque `top_k` est fourni.
+    workers : int
+        Nombre de processus utilisés lorsque `top_k` est fourni.
 
     Returns
     -------
     tuple
         Un triplet (tfidf_matrix, cosine_sim, indices) où :
         * tfidf_matrix est la matrice TF‑IDF des synopsis ;
-        * cosine_sim est la matrice de similarité cosinus ;
+        * cosine_sim est la matrice de similarité cosinus (dense) ou
+          l'index creux des voisins si `top_k` est fourni ;
         * indices est une série associant chaque titre à son index dans
           le DataFrame.
     """
-    # Création du vectoriseur avec suppression des stop words anglais
-    vectorizer = TfidfVectorizer(stop_words='english')
-    tfidf_matrix = vectorizer.fit_transform(df['Synopsis'])
+    _, tfidf_matrix = fit_tfidf(df['Synopsis'])
+
+    if top_k is None:
+        from sklearn.metrics.pairwise import linear_kernel
 
-    # Calcul de la similarité cosinus entre tous les synopsis
-    cosine_sim = linear_kernel(tfidf_matrix, tfidf_matrix)
+        # Calcul de la similarité cosinus entre tous les synopsis
+        cosine_sim = linear_kernel(tfidf_matrix, tfidf_matrix)
+    else:
+        # Seuls les K meilleurs voisins de chaque synopsis sont conservés
+        cosine_sim = build_neighbors(tfidf_matrix, top_k, block_size=block_size, workers=workers)
 
     # Création de l'index inversé (titre -> position)
     indices = pd.Series(df.index, index=df['Title']).drop_duplicates()